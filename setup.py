@@ -54,6 +54,10 @@ setuptools.setup(
         "tqdm",
         "tqdm", "gevent", "colorlog"
     ],
+    extras_require={
+        # array-backed subtitle timing, see subs2cia/timings.py
+        'numpy': ["numpy"],
+    },
     entry_points={
         # create a cli command called 'subs2cia' which runs the main() function in subs2cia.cli
         'console_scripts': ['subs2cia=subs2cia.cli:main', 'subzipper=subs2cia.cli:subzipper_main']
@@ -28,6 +28,8 @@ class CardExport(Common):
                  no_export_screenshot: bool,
                  export_video: bool,
                  export_header_row: bool,
+                 intermediate_format: str = 'flac',
+                 demux_subtitles: bool = False,
                  ):
         super(CardExport, self).__init__(
             sources=sources,
@@ -51,7 +53,9 @@ class CardExport(Common):
             bitrate=bitrate,
             mono_channel=mono_channel,
             interactive=interactive,
-            out_audiocodec=out_audiocodec
+            out_audiocodec=out_audiocodec,
+            intermediate_format=intermediate_format,
+            demux_subtitles=demux_subtitles
         )
 
         self.normalize_audio = normalize_audio
@@ -88,16 +92,19 @@ class CardExport(Common):
                     logging.critical(f"Input files {self.sources} don't contain usable subtitles")
                     self.insufficient = True
                     return
-            subfile = self.picked_streams[k].demux(overwrite_existing=self.demux_overwrite_existing)
+            subsource = self.get_subtitle_source(self.picked_streams[k])
             ignore_range = (self.ignore_range or []) + chapter_timestamps(self.picked_streams[k].file, self.ignore_chapters or [])
-            if subfile is None:
+            if subsource is None:
                 logging.warning(f"Error while demuxing {self.picked_streams[k]}")
                 self.picked_streams[k] = None
+                continue
+            subpath, subtext = subsource
 
-            audiolength = subtools.get_audiofile_duration(self.picked_streams['audio'].demux_file.filepath)
-            subdata = subtools.SubtitleManipulator(subfile.filepath,
+            audiolength = self.picked_streams['audio'].get_media_info().duration
+            subdata = subtools.SubtitleManipulator(subpath,
                                                    threshold=0, padding=self.padding,
-                                                   ignore_range=ignore_range, audio_length=audiolength)
+                                                   ignore_range=ignore_range, audio_length=audiolength,
+                                                   subtext=subtext)
             subdata.load(include_all=self.use_all_subs, regex=self.subtitle_regex_filter,
                          substrreplace_regex='', substrreplace_nokeepchanges=False)
             if subdata.ssadata is None:
@@ -128,6 +135,11 @@ class CardExport(Common):
         export_video = self.export_video and self.picked_streams['video'] is not None
         export_header_row = self.export_header_row
 
+        if export_audio:
+            self.materialize_audio()
+            audio_file = self.picked_streams['audio'].get_data_path()
+            audio_stream_index = self.picked_streams['audio'].get_data_stream_index() or 0
+
         # path to write the csv (or tsv) file to
         csv_outpath = self.outdir / (self.outstem + ".tsv")
 
@@ -180,8 +192,8 @@ class CardExport(Common):
                         logging.warning(f"Already exists: {outpath}")
                     else:
                         ffmpeg_trim_audio_clip_atrim_encode(
-                            input_file=self.picked_streams['audio'].demux_file.filepath,
-                            stream_index=0,
+                            input_file=audio_file,
+                            stream_index=audio_stream_index,
                             timestamp_start=group.group_range[0],
                             timestamp_end=group.group_range[1],
                             quality=self.quality,
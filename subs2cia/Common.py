@@ -1,10 +1,11 @@
 from subs2cia.sources import AVSFile
 from subs2cia.pickers import picker
-from subs2cia.sources import Stream, get_and_partition_streams
+from subs2cia.sources import Stream, get_and_partition_streams, demux_streams, read_subtitle_streams
+from subs2cia import demux_registry
 import subs2cia.subtools as subtools
-from subs2cia.ffmpeg_tools import export_condensed_audio, export_condensed_video
+from subs2cia.ffmpeg_tools import export_condensed_audio, export_condensed_video, Error
 
-from typing import List, Union, Dict
+from typing import List, Union, Dict, Tuple
 from collections import defaultdict
 from pathlib import Path
 from pprint import pprint
@@ -36,18 +37,18 @@ def chapter_timestamps(sourcefile: AVSFile, ignore_chapters: List[str]):
     if len(ignore_chapters) == 0:
         return []
 
-    chapters = sourcefile.info['chapters'] or []
+    chapters = sourcefile.info.chapters
 
     if len(chapters) == 0:
         return []
 
-    chapters_by_title = {c['tags']['title']: c for c in chapters}
+    chapters_by_title = {c.title: c for c in chapters}
     timestamps = []
 
     for title in ignore_chapters:
         if title in chapters_by_title:
             chapter = chapters_by_title[title]
-            timestamps.append([('', 1000 * int(float((chapter['start_time'])))), ('', 1000 * int(float(chapter['end_time'])))])
+            timestamps.append([('', 1000 * int(chapter.start_time)), ('', 1000 * int(chapter.end_time))])
         else:
             logging.warning(f"Chapter '{title}' was specified to be ignored, but it was not found")
 
@@ -61,18 +62,16 @@ def interactive_picker(sources: List[AVSFile], partitioned_streams: Dict[str, St
     print(f"Found the following {media_type} streams:")
     for idx, stream in enumerate(partitioned_streams[media_type]):
         desc_str = ''
-        if "codec_name" in stream.stream_info:
-            desc_str = desc_str + "codec: " + stream.stream_info['codec_name'] + ", "
+        if stream.stream_info.codec_name is not None:
+            desc_str = desc_str + "codec: " + stream.stream_info.codec_name + ", "
         if media_type == 'video':
-            if 'width' in stream.stream_info and 'height' in stream.stream_info:
-                desc_str = desc_str + f"{stream.stream_info['width']}x{stream.stream_info['height']}, "
+            if stream.stream_info.width is not None and stream.stream_info.height is not None:
+                desc_str = desc_str + f"{stream.stream_info.width}x{stream.stream_info.height}, "
         if (media_type == 'audio') or (media_type == 'subtitle'):
-            if "tags" in stream.stream_info:
-                tags = stream.stream_info['tags']
-                if "language" in tags:
-                    desc_str = desc_str + "lang_code: " + tags['language'] + ", "
-                if "title" in tags:
-                    desc_str = desc_str + "title: " + tags['title'] + ", "
+            if stream.stream_info.language is not None:
+                desc_str = desc_str + "lang_code: " + stream.stream_info.language + ", "
+            if stream.stream_info.title is not None:
+                desc_str = desc_str + "title: " + stream.stream_info.title + ", "
         if desc_str == '':
             desc_str = f"\tStream {idx: 3}: no information found, "
         else:
@@ -93,7 +92,8 @@ class Common:
                  # subtitle_regex_substrfilter: str, subtitle_regex_substrfilter_nokeep: bool,
                  audio_stream_index: int, subtitle_stream_index: int,
                  ignore_range: Union[List[List[int]], None], ignore_chapters: Union[List[str], None],
-                 bitrate: Union[int, None], mono_channel: bool, interactive: bool, out_audiocodec: str):
+                 bitrate: Union[int, None], mono_channel: bool, interactive: bool, out_audiocodec: str,
+                 intermediate_format: str = 'flac', demux_subtitles: bool = False):
         if outdir is None:
             self.outdir = sources[0].filepath.parent
         else:
@@ -102,6 +102,8 @@ class Common:
                 self.outdir.mkdir()
 
         self.sources = sources
+        # streams this group demuxes are kept for later groups reading the same files, until cleanup() of the last one
+        demux_registry.get_demux_registry().expect([s.filepath for s in self.sources])
         if outstem is not None:
             self.outstem = outstem
         else:
@@ -150,6 +152,12 @@ class Common:
 
         self.interactive = interactive
 
+        # if set, the picked audio stream is demuxed to an intermediate file instead of being read from its container
+        self.demux_audio = True
+        self.intermediate_format = intermediate_format
+        # if set, embedded subtitle streams are demuxed to files instead of being read into memory
+        self.demux_subtitles = demux_subtitles
+
     # go through source files and count how many subtitle and audio streams we have
     def get_and_partition_streams(self):
         self.partitioned_streams = get_and_partition_streams(self.sources)
@@ -185,14 +193,12 @@ class Common:
             print(f"Available {k} streams:")
             for idx, stream in enumerate(self.partitioned_streams[k]):
                 desc_str = ''
-                if "codec_name" in stream.stream_info:
-                    desc_str = desc_str + "codec: " + stream.stream_info['codec_name'] + ", "
-                if "tags" in stream.stream_info:
-                    tags = stream.stream_info['tags']
-                    if "language" in tags:
-                        desc_str = desc_str + "lang_code: " + tags['language'] + ", "
-                    if "title" in tags:
-                        desc_str = desc_str + "title: " + tags['title'] + ", "
+                if stream.stream_info.codec_name is not None:
+                    desc_str = desc_str + "codec: " + stream.stream_info.codec_name + ", "
+                if stream.stream_info.language is not None:
+                    desc_str = desc_str + "lang_code: " + stream.stream_info.language + ", "
+                if stream.stream_info.title is not None:
+                    desc_str = desc_str + "title: " + stream.stream_info.title + ", "
                 desc_str = desc_str + f"[{stream.file.filepath}]"
                 if desc_str == '':
                     desc_str = f"Stream {idx: 3}: no information found"
@@ -205,14 +211,14 @@ class Common:
         for source in self.sources:
             if source.type != 'video':
                 continue
-            if 'chapters' not in source.info or len(source.info['chapters']) == 0:
+            if len(source.info.chapters) == 0:
                 continue
-            chapters = source.info['chapters']
-            chapters_by_title = {c['tags']['title']: c for c in chapters}
+            chapters = source.info.chapters
+            chapters_by_title = {c.title: c for c in chapters}
             # pprint(chapters_by_title)
             for k in chapters_by_title:
-                start = ps2.time.ms_to_str(float(chapters_by_title[k]['start_time']) * 1000)
-                end = ps2.time.ms_to_str(float(chapters_by_title[k]['end_time']) * 1000)
+                start = ps2.time.ms_to_str(chapters_by_title[k].start_time * 1000)
+                end = ps2.time.ms_to_str(chapters_by_title[k].end_time * 1000)
                 print(f'{start} - {end} "{k}"')
         print("\n")
 
@@ -243,10 +249,34 @@ class Common:
                     logging.critical("Inputs don't contain usable audio")
                     self.insufficient = True
                     return
-            afile = self.picked_streams[k].demux(overwrite_existing=self.demux_overwrite_existing)
-            if afile is None:
-                logging.warning(f"Error while demuxing {self.picked_streams[k]}")
-                self.picked_streams[k] = None
+            # duration and time base come from container metadata, samples are only demuxed once an export needs them
+            try:
+                self.picked_streams[k].get_media_info()
+            except Error:
+                if not self.demux_audio:
+                    logging.warning(f"Couldn't determine time base of {self.picked_streams[k]}")
+                    self.picked_streams[k] = None
+                    continue
+                # the demuxed file's metadata may still be usable, demux now instead of deferring
+                afile = self.picked_streams[k].demux(overwrite_existing=self.demux_overwrite_existing,
+                                                     audio_format=self.intermediate_format,
+                                                     temporary=not self.keep_temporaries)
+                if afile is None:
+                    logging.warning(f"Error while demuxing {self.picked_streams[k]}")
+                    self.picked_streams[k] = None
+
+    def materialize_audio(self):
+        r"""
+        Demuxes the picked audio stream, if audio is demuxed and it hasn't been yet. Called by exports right before they
+        read audio samples, so that runs that never get that far don't pay for a demux. If demuxing fails, the stream is
+        read from its container instead.
+        """
+        stream = self.picked_streams['audio']
+        if stream is None or not self.demux_audio or stream.demux_file is not None:
+            return
+        if stream.demux(overwrite_existing=self.demux_overwrite_existing, audio_format=self.intermediate_format,
+                        temporary=not self.keep_temporaries) is None:
+            logging.warning(f"Error while demuxing {stream}, reading it from its container instead")
 
     def choose_subtitle(self, interactive: bool):
         # pass
@@ -275,12 +305,38 @@ class Common:
             #     logging.warning(f"Error while demuxing {self.picked_streams[k]}")
             #     self.picked_streams[k] = None
 
+    def plan_demux(self):
+        r"""
+        Extracts every subtitle stream up front, reading each source file only once. Embedded subtitle streams are read
+        into memory unless demux_subtitles is set. Audio is left alone until an export needs it, see materialize_audio.
+        """
+        if self.demux_subtitles:
+            demux_streams(self.partitioned_streams['subtitle'], overwrite_existing=self.demux_overwrite_existing,
+                          temporary=not self.keep_temporaries)
+        else:
+            read_subtitle_streams(self.partitioned_streams['subtitle'])
+
+    def get_subtitle_source(self, stream: Stream) -> Union[Tuple[Path, Union[str, None]], None]:
+        r"""
+        Where SubtitleManipulator should read a subtitle stream from
+        :return: (path, text) pair, text is None if the subtitles should be read from path. None if the stream couldn't
+            be extracted
+        """
+        if stream.is_standalone():
+            return stream.file.filepath, None
+        if self.demux_subtitles:
+            subfile = stream.demux(overwrite_existing=self.demux_overwrite_existing, temporary=not self.keep_temporaries)
+            return None if subfile is None else (subfile.filepath, None)
+        subtext = stream.read_subtitles()
+        return None if subtext is None else (stream.get_demux_path(), subtext)
+
     def choose_streams(self):
         if insufficient_source_streams(self.partitioned_streams):
             logging.error(f"Not enough input sources to generate condensed output for output stem {self.outstem} "
                           f"(missing audio and/or subtitles)")
             self.insufficient = True
             return
+        self.plan_demux()
         self.choose_audio(interactive=self.interactive)
         self.choose_subtitle(interactive=self.interactive)
         self.choose_video(interactive=self.interactive)
@@ -369,3 +425,4 @@ class Common:
                 continue
             for s in self.partitioned_streams[k]:
                 s.cleanup_demux()
+        demux_registry.get_demux_registry().done([s.filepath for s in self.sources])
@@ -1,7 +1,6 @@
 import argparse
 import sys
 import re
-from pysubs2.time import make_time
 
 
 def get_args_subzipper():
@@ -39,6 +38,7 @@ def get_args_subzipper():
 
 # taken from pysubs2:cli.py
 def time(s):
+    from pysubs2.time import make_time
     d = {}
     # all = re.findall(r"(\+?|-?|^$)(\d*\.?\d*)(ms|m|s|h)", s)
     sign = s[0] if s[0] == 'e' or s[0] == '+' else ''
@@ -61,11 +61,27 @@ def get_args_subs2cia():
     parent_parser.add_argument('-vv', '--debug', action='store_true', dest='debug', default=False, required=False,
                                help='Verbose and debug output if set')
 
-    # todo: implement directory parsing
     # if directory is an input, batch mode must be specified
     parent_parser.add_argument('-i', '--inputs', metavar='<input files>', dest='infiles', default=None, required=False,
                                type=str, nargs='+',
-                               help='Paths to input files or a single path to a directory of input files.')
+                               help='Paths to input files and/or directories of input files. '
+                                    'Directories require batch mode (-b) and are scanned as they are processed, '
+                                    'see --recursive, --include and --exclude.')
+
+    parent_parser.add_argument('--recursive', action='store_true', dest='recursive', default=False,
+                               help='If set, input directories are scanned recursively.')
+
+    parent_parser.add_argument('--include', metavar='<pattern>', dest='include_patterns', default=None,
+                               action='append', type=str,
+                               help='When scanning input directories, only use files whose names match this glob '
+                                    'pattern, e.g. --include "*.mkv". Can be given multiple times. '
+                                    'Defaults to common video, audio and subtitle file extensions.')
+
+    parent_parser.add_argument('--exclude', metavar='<pattern>', dest='exclude_patterns', default=None,
+                               action='append', type=str,
+                               help='When scanning input directories, skip files and subdirectories whose names match '
+                                    'this glob pattern, e.g. --exclude "Extras". Can be given multiple times. '
+                                    "subs2cia's own outputs and demuxed files are always skipped.")
 
     parent_parser.add_argument('-si', '--subtitle-index', metavar='<index>', dest='subtitle_stream_index', default=None,
                                type=int,
@@ -223,6 +239,67 @@ def get_args_subs2cia():
     parent_parser.add_argument('-a', '--absolute-paths', action='store_true', dest='absolute_paths', default=False,
                                help='Prints absolute paths from the root directory instead of given paths.')
 
+    parent_parser.add_argument('--no-probe-cache', action='store_true', dest='no_probe_cache', default=False,
+                               help='If set, will always run ffprobe on inputs instead of reusing results cached from '
+                                    'previous runs. Cached results are invalidated automatically when a file changes.')
+
+    parent_parser.add_argument('--probe-cache-entries', metavar='N', dest='probe_cache_entries', default=20000,
+                               type=int,
+                               help="Number of files the probe cache keeps results for. Least recently used entries "
+                                    "are removed once it's exceeded. Default is 20000.")
+
+    parent_parser.add_argument('--no-header-probe', action='store_true', dest='no_header_probe', default=False,
+                               help="If set, always uses ffprobe to read input files instead of subs2cia's built-in "
+                                    "Matroska/MP4 header reader.")
+
+    parent_parser.add_argument('--intermediate-format', dest='intermediate_format', default='flac',
+                               choices=['flac', 'copy', 'wav', 'speech'],
+                               help="Format audio is demuxed to before clipping (srs, or condense with --demux-audio). "
+                                    "flac: lossless, re-encoded (default). copy: stream copy into .mka, fastest "
+                                    "to demux. wav: uncompressed PCM, fastest to read back but largest. speech: "
+                                    "mono PCM at 24 kHz, downmixed once at demux time.")
+
+    parent_parser.add_argument('--demux-subtitles', action='store_true', dest='demux_subtitles', default=False,
+                               help="If set, extracts embedded subtitle streams to files next to the input (or into "
+                                    "--cache-dir) before loading them. By default they are read into memory over a "
+                                    "pipe, with nothing written to disk.")
+
+    parent_parser.add_argument('--cache-dir', metavar='/path/to/directory', dest='cache_dir', default=None, type=str,
+                               help="If set, demuxed streams are stored in and reused from this directory instead of "
+                                    "being written next to input files and deleted afterwards. Entries are keyed by "
+                                    "file contents, so renamed or moved inputs still hit the cache. Works with "
+                                    "read-only input directories.")
+
+    parent_parser.add_argument('--cache-size', metavar='MiB', dest='cache_size', default=4096, type=int,
+                               help="Size limit of --cache-dir in MiB. Least recently used streams are removed once "
+                                    "it's exceeded. Default is 4096.")
+
+    parent_parser.add_argument('--scratch-dir', metavar='/path/to/directory', dest='scratch_dir', default=None,
+                               type=str,
+                               help="Fast directory for temporary files, e.g. /dev/shm. Demuxed streams and ffmpeg "
+                                    "filter scripts are written there instead of next to the input files while they "
+                                    "fit in --scratch-size, and are removed on exit. Not used for files kept with "
+                                    "--keep-temporaries, or for streams in --cache-dir.")
+
+    parent_parser.add_argument('--scratch-size', metavar='MiB', dest='scratch_size', default=1024, type=int,
+                               help="Size budget of --scratch-dir in MiB. Temporaries that don't fit are written next "
+                                    "to the input files. Default is 1024.")
+
+    parent_parser.add_argument('--prefetch', metavar='MiB', dest='prefetch', default=0, type=int,
+                               help="In batch mode, reads up to this many MiB of the next group's input files into the "
+                                    "OS cache while the current group is processed, capped at a quarter of available "
+                                    "memory. Useful for inputs on network storage. Default is 0 (off).")
+
+    parent_parser.add_argument('--probe-jobs', metavar='N', dest='probe_jobs', default=4, type=int,
+                               help='Number of input files to probe concurrently. Default is 4. '
+                                    'Set to 1 to probe one file at a time. Once a progress bar has been shown, '
+                                    'files are probed in greenlets instead of threads, which only overlap while '
+                                    'waiting on ffprobe.')
+
+    parent_parser.add_argument('--profile-startup', action='store_true', dest='profile_startup', default=False,
+                               help='If set, reports how long importing and initializing each module takes '
+                                    'before processing inputs. Useful for keeping batch invocations fast.')
+
     parent_parser.add_argument('-ma', '--interactive', action='store_true', dest='interactive', default=False,
                                help='If set, will enable interactive stream picking. Overrides -ai, -si, -tl.')
 
@@ -242,6 +319,17 @@ def get_args_subs2cia():
 6:\tComma-seperated list of input files used
 """ )
 
+    inventory_parser = subparsers.add_parser('inventory', parents=[parent_parser],
+                                             help="List streams, languages, codecs and chapters of input files as "
+                                                  "JSON lines.",
+                                             description="Probe input files and directories in parallel and write one "
+                                                         "JSON object per file, one per line, describing its streams "
+                                                         "(type, codec, language, title) and chapters. Directories "
+                                                         "don't require batch mode. Most other options are ignored.")
+
+    inventory_parser.add_argument('--jsonl', metavar='<file>', dest='inventory_output', default=None, type=str,
+                                  help="Write JSON lines to this file instead of standard output.")
+
     srs_parser.add_argument('-N', '--normalize', action='store_true', dest='normalize_audio', default=False,
                             help="If set, normalizes volume of audio clips to the same loudness. YMMV.")
 
@@ -282,6 +370,17 @@ def get_args_subs2cia():
                                  "subtitle file will be chosen, if available. Used for ignoring subtitles that contain only "
                                  "signs and songs.")
 
+    cia_parser.add_argument('--demux-audio', action='store_true', dest='demux_audio', default=False,
+                            help="If set, extracts the chosen audio stream to a temporary file in "
+                                 "--intermediate-format (FLAC by default) before condensing. By default audio is read "
+                                 "straight from its container, which skips a full demux and disk write per input.")
+
+    cia_parser.add_argument('--subtitle-candidates', metavar='<count>', dest='subtitle_candidates', default=1, type=int,
+                            help="Number of subtitle streams to load and score at the same time. Useful when the first "
+                                 "streams in picking order are often rejected, e.g. signs and songs tracks, and "
+                                 "subtitles come from slow storage or --demux-subtitles is set. The chosen stream is "
+                                 "the same as with the default of 1, which tries one stream at a time.")
+
     cia_parser.add_argument('--no-gen-subtitle', action='store_true', dest='no_condensed_subtitles', default=False,
                             help="If set, won't output a condensed subtitle file. Useful for reducing file clutter.")
 
@@ -3,12 +3,13 @@ from subs2cia.sources import AVSFile
 from subs2cia.pickers import picker
 from subs2cia.sources import Stream
 import subs2cia.subtools as subtools
-from subs2cia.ffmpeg_tools import export_condensed_audio, export_condensed_video
+from subs2cia.ffmpeg_tools import export_condensed_audio, export_condensed_video, map_concurrently
 
+import itertools
 import logging
 from collections import defaultdict
 from pathlib import Path
-from typing import Union, List
+from typing import Union, List, Iterator, Tuple
 
 
 class Condense(Common):
@@ -20,7 +21,8 @@ class Condense(Common):
                  subtitle_regex_substrfilter: str, subtitle_regex_substrfilter_nokeep: bool,
                  audio_stream_index: int, subtitle_stream_index: int, ignore_range: Union[List[List[int]], None],
                  ignore_chapters: Union[List[str], None], bitrate: Union[int, None], mono_channel: bool,
-                 interactive: bool, no_condensed_subtitles: bool, out_audiocodec: str):
+                 interactive: bool, no_condensed_subtitles: bool, out_audiocodec: str, demux_audio: bool = False,
+                 intermediate_format: str = 'flac', demux_subtitles: bool = False, subtitle_candidates: int = 1):
         super(Condense, self).__init__(
             sources=sources,
             outdir=outdir,
@@ -43,7 +45,9 @@ class Condense(Common):
             bitrate=bitrate,
             mono_channel=mono_channel,
             interactive=interactive,
-            out_audiocodec=out_audiocodec
+            out_audiocodec=out_audiocodec,
+            intermediate_format=intermediate_format,
+            demux_subtitles=demux_subtitles
         )
         r"""
 
@@ -60,6 +64,12 @@ class Condense(Common):
         :param target_lang: Target language for audio AND subtitles
         :param out_audioext: Output audio extension
         :param minimum_compression_ratio: Chosen subtitle stream must yield generated audio at least this percent long of audio file
+        :param demux_audio: If set, demuxes the chosen audio stream to a temporary file before condensing instead of
+            reading it straight from its container
+        :param intermediate_format: Format demuxed audio is stored in, see sources.audio_intermediate_formats
+        :param demux_subtitles: If set, demuxes embedded subtitle streams to files instead of reading them into memory
+        :param subtitle_candidates: Number of subtitle streams to load and score concurrently, ahead of the picker.
+            The stream that is picked doesn't depend on it
         """
 
         self.out_subext = None  # extensions must contain dot
@@ -80,50 +90,85 @@ class Condense(Common):
 
         self.subtitle_outfile = None
 
+        self.demux_audio = demux_audio
+        self.subtitle_candidates = subtitle_candidates
+
+    def score_subtitle(self, stream: Stream) -> Union[Tuple[subtools.SubtitleManipulator, list, float], None]:
+        r"""
+        Loads and merges a subtitle stream and computes its compression ratio against the picked audio stream
+        :return: (subtitle data, merged subtitle times, compression ratio), or None if the stream couldn't be loaded
+        """
+        subsource = self.get_subtitle_source(stream)
+        if subsource is None:
+            logging.warning(f"Error while demuxing {stream}")
+            return None
+        subpath, subtext = subsource
+
+        assert(self.picked_streams['audio'] is not None)  # must call choose_audio first
+        ignore_range = (self.ignore_range or []) + chapter_timestamps(self.picked_streams['audio'].file, self.ignore_chapters or [])
+        audiolength = self.picked_streams['audio'].get_media_info().duration
+        subdata = subtools.SubtitleManipulator(subpath,
+                                               threshold=self.threshold, padding=self.padding,
+                                               ignore_range=ignore_range, audio_length=audiolength,
+                                               subtext=subtext)
+        subdata.load(include_all=self.use_all_subs, regex=self.subtitle_regex_filter,
+                     substrreplace_regex='',
+                     substrreplace_nokeepchanges=False)
+                     # substrreplace_regex=self.subtitle_regex_substrfilter, substrreplace_nokeepchanges=self.subtitle_regex_substrfilter_nokeep)
+        if subdata.ssadata is None:
+            logging.warning(f"Problem loading subtitle data from {stream}")
+            return None
+        subdata.merge_groups()
+        times = subdata.get_times()
+        ps_times = subtools.partition_and_split(times, self.partition, self.split)
+
+        sublength = subtools.get_partitioned_and_split_times_duration(ps_times)
+
+        return subdata, times, sublength / audiolength
+
+    def scored_candidates(self, candidates: Iterator[Stream], lookahead: int) \
+            -> Iterator[Tuple[Stream, Union[Tuple[subtools.SubtitleManipulator, list, float], None]]]:
+        r"""
+        Yields (stream, score_subtitle(stream)) in picker order, scoring the next lookahead streams concurrently so that
+        rejected streams don't cost one round trip each
+        :param candidates: Subtitle picker
+        :param lookahead: Number of streams taken from the picker and scored at a time. 1 scores them one by one
+        """
+        scores = {}  # pickers can yield the same stream more than once, score it once
+        while True:
+            batch = list(itertools.islice(candidates, max(lookahead, 1)))
+            if len(batch) == 0:
+                return
+            unscored = list({id(s): s for s in batch if id(s) not in scores}.values())
+            for stream, score in zip(unscored, map_concurrently(self.score_subtitle, unscored, lookahead)):
+                scores[id(stream)] = score
+            for stream in batch:
+                yield stream, scores[id(stream)]
+
     def choose_subtitle(self, interactive: bool):
         if len(self.partitioned_streams['subtitle']) == 0:
             logging.warning(f"Couldn't find audio streams in input files")
             return
         k = 'subtitle'
+        candidates = self.scored_candidates(self.pickers[k], self.subtitle_candidates)
         while True:
             if interactive and len(self.partitioned_streams['subtitle']) > 1:
                 self.picked_streams['subtitle'] = interactive_picker(self.sources, self.partitioned_streams, 'subtitle')
+                score = self.score_subtitle(self.picked_streams[k])
             else:
 
                 k = 'subtitle'
                 try:
-                    self.picked_streams[k] = next(self.pickers[k])
+                    self.picked_streams[k], score = next(candidates)
                 except StopIteration as s:
                     logging.critical(f"Input files {self.sources} don't contain usable subtitles")
                     self.insufficient = True
                     return
-            subfile = self.picked_streams[k].demux(overwrite_existing=self.demux_overwrite_existing)
-            if subfile is None:
-                logging.warning(f"Error while demuxing {self.picked_streams[k]}")
+            if score is None:
                 self.picked_streams[k] = None
                 continue
+            subdata, times, compression_ratio = score
 
-            assert(self.picked_streams['audio'] is not None)  # must call choose_audio first
-            ignore_range = (self.ignore_range or []) + chapter_timestamps(self.picked_streams['audio'].file, self.ignore_chapters or [])
-            audiolength = subtools.get_audiofile_duration(self.picked_streams['audio'].demux_file.filepath)
-            subdata = subtools.SubtitleManipulator(subfile.filepath,
-                                                   threshold=self.threshold, padding=self.padding,
-                                                   ignore_range=ignore_range, audio_length=audiolength)
-            subdata.load(include_all=self.use_all_subs, regex=self.subtitle_regex_filter,
-                         substrreplace_regex='',
-                         substrreplace_nokeepchanges=False)
-                         # substrreplace_regex=self.subtitle_regex_substrfilter, substrreplace_nokeepchanges=self.subtitle_regex_substrfilter_nokeep)
-            if subdata.ssadata is None:
-                logging.warning(f"Problem loading subtitle data from {self.picked_streams[k]}")
-                self.picked_streams[k] = None
-                continue
-            subdata.merge_groups()
-            times = subdata.get_times()
-            ps_times = subtools.partition_and_split(times, self.partition, self.split)
-
-            sublength = subtools.get_partitioned_and_split_times_duration(ps_times)
-
-            compression_ratio = sublength / audiolength
             if compression_ratio < self.minimum_compression_ratio:
                 if interactive:
                     resp = input(f"Got compression ratio of {compression_ratio} (ratio of dialogue to total audio), "
@@ -158,8 +203,7 @@ class Condense(Common):
         if self.picked_streams['subtitle'] is None:
             logging.info(f'No subtitles to process for output {self.outstem}')
             return
-        subpath = self.picked_streams['subtitle'].get_data_path()
-        subext = subpath.suffix
+        subext = self.subdata.subpath.suffix
         self.subdata.condense()
 
         self.subtitle_outfile = Path(self.outdir) / (
@@ -176,8 +220,11 @@ class Condense(Common):
         if outfile.exists() and not self.overwrite_existing_generated:
             logging.warning(f"Can't write to {outfile}: file exists and not set to overwrite")
             return
+        self.materialize_audio()
         export_condensed_audio(self.dialogue_times, audiofile=self.picked_streams['audio'].get_data_path(),
-                               outfile=outfile, to_mono=self.to_mono, quality=self.quality, codec=self.out_audiocodec)
+                               outfile=outfile, to_mono=self.to_mono, quality=self.quality, codec=self.out_audiocodec,
+                               audio_info=self.picked_streams['audio'].get_media_info(),
+                               stream_index=self.picked_streams['audio'].get_data_stream_index())
         # logging.info(f"Wrote condensed audio to {outfile}")
 
     def export_video(self):
@@ -190,17 +237,19 @@ class Condense(Common):
         if outfile.exists() and not self.overwrite_existing_generated:
             logging.warning(f"Can't write to {outfile}: file exists and not set to overwrite")
             return
+        self.materialize_audio()
         export_condensed_video(self.dialogue_times, audiofile=self.picked_streams['audio'].get_data_path(),
                                subfile=self.subtitle_outfile,
                                videofile=self.picked_streams['video'].get_data_path(),
-                               outfile=outfile)
+                               outfile=outfile,
+                               audio_stream_index=self.picked_streams['audio'].get_data_stream_index())
         logging.info(f"Wrote condensed video to {outfile}")
         return
 
     def export(self):
         if self.insufficient:
             return
-        subtools.get_compression_ratio(self.dialogue_times, self.picked_streams['audio'].demux_file.filepath)
+        subtools.get_compression_ratio(self.dialogue_times, self.picked_streams['audio'].get_media_info())
         if self.condensed_subtitles:
             self.export_subtitles()
         if self.condensed_audio:
@@ -0,0 +1,817 @@
+r"""
+Minimal Matroska (EBML) and MP4 header reader.
+Listing streams, reading language tags and chapters only needs a container's track and chapter headers, which can be
+read from the file with a handful of buffered reads instead of spawning ffprobe. Output mirrors the parts of
+ffprobe's JSON that subs2cia uses (see AVSFile.info). Anything this reader doesn't fully understand makes it return
+None so that the caller falls back to ffprobe.
+"""
+import io
+import logging
+import struct
+from pathlib import Path
+from typing import Union, Dict, List, Tuple
+
+
+class _UnsupportedContainer(Exception):
+    pass
+
+
+# headers larger than this are probably not worth parsing in Python, let ffprobe handle them
+_MAX_HEADER_SIZE = 64 * 1024 * 1024
+
+# Matroska element IDs, see https://www.matroska.org/technical/elements.html
+_EBML = 0x1A45DFA3
+_DOCTYPE = 0x4282
+_SEGMENT = 0x18538067
+_SEEKHEAD = 0x114D9B74
+_SEEK = 0x4DBB
+_SEEKID = 0x53AB
+_SEEKPOSITION = 0x53AC
+_INFO = 0x1549A966
+_TIMESTAMPSCALE = 0x2AD7B1
+_DURATION = 0x4489
+_TRACKS = 0x1654AE6B
+_TRACKENTRY = 0xAE
+_TRACKTYPE = 0x83
+_CODECID = 0x86
+_NAME = 0x536E
+_LANGUAGE = 0x22B59C
+_VIDEO = 0xE0
+_PIXELWIDTH = 0xB0
+_PIXELHEIGHT = 0xBA
+_AUDIO = 0xE1
+_SAMPLINGFREQUENCY = 0xB5
+_OUTPUTSAMPLINGFREQUENCY = 0x78B5
+_CHANNELS = 0x9F
+_BITDEPTH = 0x6264
+_CHAPTERS = 0x1043A770
+_EDITIONENTRY = 0x45B9
+_CHAPTERATOM = 0xB6
+_CHAPTERUID = 0x73C4
+_CHAPTERTIMESTART = 0x91
+_CHAPTERTIMEEND = 0x92
+_CHAPTERDISPLAY = 0x80
+_CHAPSTRING = 0x85
+_ATTACHMENTS = 0x1941A469
+_ATTACHEDFILE = 0x61A7
+_FILENAME = 0x466E
+_FILEMIMETYPE = 0x4660
+_FILEDATA = 0x465C
+_CLUSTER = 0x1F43B675
+_TRACKUID = 0x73C5
+_TAGS = 0x1254C367
+_TAG = 0x7373
+_TARGETS = 0x63C0
+_TAGTRACKUID = 0x63C5
+_SIMPLETAG = 0x67C8
+_TAGNAME = 0x45A3
+_TAGSTRING = 0x4487
+
+_mkv_track_types = {
+    1: 'video',
+    2: 'audio',
+    0x11: 'subtitle',
+}
+
+# CodecID prefix -> ffmpeg codec name, checked in order
+_mkv_codecs = [
+    ('V_MPEG4/ISO/AVC', 'h264'),
+    ('V_MPEGH/ISO/HEVC', 'hevc'),
+    ('V_AV1', 'av1'),
+    ('V_VP8', 'vp8'),
+    ('V_VP9', 'vp9'),
+    ('V_MPEG4/ISO/', 'mpeg4'),
+    ('V_MPEG2', 'mpeg2video'),
+    ('V_MPEG1', 'mpeg1video'),
+    ('V_THEORA', 'theora'),
+    ('V_MJPEG', 'mjpeg'),
+    ('A_AAC', 'aac'),
+    ('A_EAC3', 'eac3'),
+    ('A_AC3', 'ac3'),
+    ('A_DTS', 'dts'),
+    ('A_TRUEHD', 'truehd'),
+    ('A_MLP', 'mlp'),
+    ('A_FLAC', 'flac'),
+    ('A_ALAC', 'alac'),
+    ('A_OPUS', 'opus'),
+    ('A_VORBIS', 'vorbis'),
+    ('A_MPEG/L3', 'mp3'),
+    ('A_MPEG/L2', 'mp2'),
+    ('A_MPEG/L1', 'mp1'),
+    ('S_TEXT/UTF8', 'subrip'),
+    ('S_TEXT/ASCII', 'text'),
+    ('S_TEXT/ASS', 'ass'),
+    ('S_TEXT/SSA', 'ass'),
+    ('S_ASS', 'ass'),
+    ('S_SSA', 'ass'),
+    ('S_TEXT/WEBVTT', 'webvtt'),
+    ('S_HDMV/PGS', 'hdmv_pgs_subtitle'),
+    ('S_HDMV/TEXTST', 'hdmv_text_subtitle'),
+    ('S_VOBSUB', 'dvd_subtitle'),
+    ('S_DVBSUB', 'dvb_subtitle'),
+]
+
+_mkv_pcm_codecs = {
+    ('A_PCM/INT/LIT', 16): 'pcm_s16le',
+    ('A_PCM/INT/LIT', 24): 'pcm_s24le',
+    ('A_PCM/INT/LIT', 32): 'pcm_s32le',
+    ('A_PCM/INT/BIG', 16): 'pcm_s16be',
+    ('A_PCM/INT/BIG', 24): 'pcm_s24be',
+    ('A_PCM/INT/BIG', 32): 'pcm_s32be',
+    ('A_PCM/FLOAT/IEEE', 32): 'pcm_f32le',
+    ('A_PCM/FLOAT/IEEE', 64): 'pcm_f64le',
+}
+
+_attachment_mimetypes = {
+    'application/x-truetype-font': 'ttf',
+    'application/x-font-ttf': 'ttf',
+    'font/ttf': 'ttf',
+    'application/vnd.ms-opentype': 'otf',
+    'font/otf': 'otf',
+    'application/x-font-otf': 'otf',
+}
+
+
+def _read_vint(f, keep_marker: bool) -> Tuple[int, int, bool]:
+    r"""
+    Reads an EBML variable-length integer
+    :return: (value, length in bytes, value is the reserved "unknown size" value)
+    """
+    first = f.read(1)
+    if len(first) == 0:
+        raise EOFError
+    b = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not b & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise _UnsupportedContainer("invalid EBML variable-length integer")
+    value = b if keep_marker else b & (mask - 1)
+    rest = f.read(length - 1)
+    if len(rest) != length - 1:
+        raise EOFError
+    for c in rest:
+        value = (value << 8) | c
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, length, unknown
+
+
+def _read_element_header(f) -> Tuple[int, int, bool]:
+    r"""
+    :return: (element ID, data size, data size is unknown)
+    """
+    eid, _, _ = _read_vint(f, keep_marker=True)
+    size, _, unknown = _read_vint(f, keep_marker=False)
+    return eid, size, unknown
+
+
+def _iter_children(data: bytes):
+    r"""
+    Yields (element ID, element data) for each child of an in-memory master element
+    """
+    f = io.BytesIO(data)
+    while f.tell() < len(data):
+        try:
+            eid, size, unknown = _read_element_header(f)
+        except EOFError:
+            raise _UnsupportedContainer("truncated element")
+        if unknown:
+            raise _UnsupportedContainer("unknown-size element inside header")
+        child = f.read(size)
+        if len(child) != size:
+            raise _UnsupportedContainer("truncated element")
+        yield eid, child
+
+
+def _uint(data: bytes) -> int:
+    return int.from_bytes(data, 'big')
+
+
+def _float(data: bytes) -> float:
+    if len(data) == 4:
+        return struct.unpack('>f', data)[0]
+    if len(data) == 8:
+        return struct.unpack('>d', data)[0]
+    if len(data) == 0:
+        return 0.0
+    raise _UnsupportedContainer("invalid float element")
+
+
+def _string(data: bytes) -> str:
+    return data.rstrip(b'\0').decode('utf-8', errors='replace')
+
+
+def _mkv_codec_name(codec_id: str, bit_depth: Union[int, None]) -> str:
+    if codec_id.startswith('A_PCM/'):
+        if (codec_id, bit_depth) in _mkv_pcm_codecs:
+            return _mkv_pcm_codecs[(codec_id, bit_depth)]
+        raise _UnsupportedContainer(f"unhandled PCM codec {codec_id} with bit depth {bit_depth}")
+    for prefix, name in _mkv_codecs:
+        if codec_id.startswith(prefix):
+            return name
+    raise _UnsupportedContainer(f"unknown Matroska codec ID {codec_id}")
+
+
+def _parse_mkv_track(data: bytes, index: int, time_base: str) -> dict:
+    track_type = None
+    codec_id = None
+    name = None
+    language = 'eng'  # Matroska's default when the element is missing
+    width = height = None
+    sample_rate = output_sample_rate = channels = bit_depth = None
+    for eid, child in _iter_children(data):
+        if eid == _TRACKTYPE:
+            track_type = _uint(child)
+        elif eid == _CODECID:
+            codec_id = _string(child)
+        elif eid == _NAME:
+            name = _string(child)
+        elif eid == _LANGUAGE:
+            language = _string(child)
+        elif eid == _VIDEO:
+            for veid, vchild in _iter_children(child):
+                if veid == _PIXELWIDTH:
+                    width = _uint(vchild)
+                elif veid == _PIXELHEIGHT:
+                    height = _uint(vchild)
+        elif eid == _AUDIO:
+            for aeid, achild in _iter_children(child):
+                if aeid == _SAMPLINGFREQUENCY:
+                    sample_rate = _float(achild)
+                elif aeid == _OUTPUTSAMPLINGFREQUENCY:
+                    output_sample_rate = _float(achild)
+                elif aeid == _CHANNELS:
+                    channels = _uint(achild)
+                elif aeid == _BITDEPTH:
+                    bit_depth = _uint(achild)
+
+    if track_type not in _mkv_track_types:
+        # ffmpeg skips track types it doesn't support, which would shift stream indices
+        raise _UnsupportedContainer(f"unsupported Matroska track type {track_type}")
+    if codec_id is None:
+        raise _UnsupportedContainer("Matroska track without a codec ID")
+
+    stream = {
+        'index': index,
+        'codec_name': _mkv_codec_name(codec_id, bit_depth),
+        'codec_type': _mkv_track_types[track_type],
+        'time_base': time_base,
+    }
+    if track_type == 1:
+        if width is not None:
+            stream['width'] = width
+        if height is not None:
+            stream['height'] = height
+    if track_type == 2:
+        rate = output_sample_rate or sample_rate or 8000.0  # 8000 is Matroska's default
+        stream['sample_rate'] = str(int(rate))
+        stream['channels'] = channels if channels is not None else 1
+    tags = {}
+    if language != 'und':
+        tags['language'] = language
+    if name is not None:
+        tags['title'] = name
+    if len(tags) > 0:
+        stream['tags'] = tags
+    return stream
+
+
+def _mkv_track_uid(data: bytes) -> Union[int, None]:
+    for eid, child in _iter_children(data):
+        if eid == _TRACKUID:
+            return _uint(child)
+    return None
+
+
+def _parse_mkv_track_durations(data: bytes) -> Dict[int, str]:
+    r"""
+    Reads the per-track DURATION statistics tags that muxers such as ffmpeg and mkvmerge write, which ffprobe reports
+    as stream tags
+    :return: Track UID -> DURATION tag value, e.g. '00:23:40.021000000'
+    """
+    durations = {}
+    for eid, tag in _iter_children(data):
+        if eid != _TAG:
+            continue
+        track_uids = []
+        duration = None
+        for teid, child in _iter_children(tag):
+            if teid == _TARGETS:
+                track_uids = [_uint(t) for tteid, t in _iter_children(child) if tteid == _TAGTRACKUID]
+            elif teid == _SIMPLETAG:
+                name = value = None
+                for steid, schild in _iter_children(child):
+                    if steid == _TAGNAME:
+                        name = _string(schild)
+                    elif steid == _TAGSTRING:
+                        value = _string(schild)
+                if name == 'DURATION' and value is not None:
+                    duration = value
+        if duration is not None:
+            for uid in track_uids:
+                durations[uid] = duration
+    return durations
+
+
+def _parse_mkv_chapters(data: bytes, duration: Union[float, None]) -> List[dict]:
+    atoms = []
+    for eid, edition in _iter_children(data):
+        if eid != _EDITIONENTRY:
+            continue
+        for aeid, atom in _iter_children(edition):
+            if aeid != _CHAPTERATOM:
+                continue  # nested chapters are ignored, same as ffmpeg
+            uid = start = end = title = None
+            for ceid, child in _iter_children(atom):
+                if ceid == _CHAPTERUID:
+                    uid = _uint(child)
+                elif ceid == _CHAPTERTIMESTART:
+                    start = _uint(child)
+                elif ceid == _CHAPTERTIMEEND:
+                    end = _uint(child)
+                elif ceid == _CHAPTERDISPLAY and title is None:
+                    for deid, dchild in _iter_children(child):
+                        if deid == _CHAPSTRING:
+                            title = _string(dchild)
+            atoms.append((uid, start, end, title))
+
+    chapters = []
+    max_start = 0
+    for uid, start, end, title in atoms:
+        # same filtering as ffmpeg's matroska demuxer
+        if start is None or not uid or (max_start != 0 and start <= max_start):
+            continue
+        max_start = start
+        chapters.append([uid, start, end, title])
+    for idx, chapter in enumerate(chapters):
+        if chapter[2] is None:
+            if idx + 1 < len(chapters):
+                chapter[2] = chapters[idx + 1][1]
+            elif duration is not None:
+                chapter[2] = int(duration * 1e9)
+            else:
+                chapter[2] = chapter[1]
+
+    return [{
+        'id': uid,
+        'time_base': '1/1000000000',
+        'start': start,
+        'start_time': f"{start / 1e9:.6f}",
+        'end': end,
+        'end_time': f"{end / 1e9:.6f}",
+        'tags': {'title': title} if title is not None else {},
+    } for uid, start, end, title in chapters]
+
+
+def _parse_mkv_attachments(f, end: int, first_index: int) -> List[dict]:
+    r"""
+    Reads attachment names and mimetypes, seeking past the (potentially large) file data
+    """
+    streams = []
+    while f.tell() < end:
+        eid, size, unknown = _read_element_header(f)
+        if unknown:
+            raise _UnsupportedContainer("unknown-size attachment")
+        if eid != _ATTACHEDFILE:
+            f.seek(size, io.SEEK_CUR)
+            continue
+        file_end = f.tell() + size
+        filename = mimetype = None
+        data_size = 0
+        while f.tell() < file_end:
+            ceid, csize, unknown = _read_element_header(f)
+            if unknown:
+                raise _UnsupportedContainer("unknown-size attachment")
+            if ceid == _FILENAME:
+                filename = _string(f.read(csize))
+            elif ceid == _FILEMIMETYPE:
+                mimetype = _string(f.read(csize))
+            else:
+                if ceid == _FILEDATA:
+                    data_size = csize
+                f.seek(csize, io.SEEK_CUR)
+        if filename is None or mimetype is None or data_size == 0:
+            continue  # ffmpeg ignores incomplete attachments
+        stream = {
+            'index': first_index + len(streams),
+            'codec_type': 'attachment',
+            'time_base': '1/90000',  # ffmpeg's default, attachments have no packets
+            'tags': {'filename': filename, 'mimetype': mimetype},
+        }
+        if mimetype in _attachment_mimetypes:
+            stream['codec_name'] = _attachment_mimetypes[mimetype]
+        streams.append(stream)
+    return streams
+
+
+def _read_mkv(f, filesize: int) -> dict:
+    eid, size, unknown = _read_element_header(f)
+    if eid != _EBML or unknown:
+        raise _UnsupportedContainer("missing EBML header")
+    doctype = None
+    for ceid, child in _iter_children(f.read(size)):
+        if ceid == _DOCTYPE:
+            doctype = _string(child)
+    if doctype not in ('matroska', 'webm'):
+        raise _UnsupportedContainer(f"unsupported EBML doctype {doctype}")
+
+    eid, size, unknown = _read_element_header(f)
+    if eid != _SEGMENT:
+        raise _UnsupportedContainer("missing Matroska segment")
+    segment_start = f.tell()
+    segment_end = filesize if unknown else min(filesize, segment_start + size)
+
+    # locate top-level elements: scan until the first cluster, then use the seek head for anything stored after it
+    wanted = {_INFO, _TRACKS, _CHAPTERS, _ATTACHMENTS, _TAGS}
+    positions = {}  # element ID -> (data offset, data size)
+    seekheads = []
+    while f.tell() < segment_end:
+        eid, size, unknown = _read_element_header(f)
+        if eid == _CLUSTER or unknown:
+            break
+        if eid in wanted and eid not in positions:
+            positions[eid] = (f.tell(), size)
+        elif eid == _SEEKHEAD:
+            seekheads.append((f.tell(), size))
+        f.seek(size, io.SEEK_CUR)
+
+    visited = set()
+    while len(seekheads) > 0 and not wanted.issubset(positions):
+        offset, size = seekheads.pop(0)
+        if offset in visited or size > _MAX_HEADER_SIZE:
+            continue
+        visited.add(offset)
+        f.seek(offset)
+        for ceid, seek in _iter_children(f.read(size)):
+            if ceid != _SEEK:
+                continue
+            target_id = target_pos = None
+            for seid, schild in _iter_children(seek):
+                if seid == _SEEKID:
+                    target_id = _uint(schild)
+                elif seid == _SEEKPOSITION:
+                    target_pos = _uint(schild)
+            if target_id is None or target_pos is None:
+                continue
+            if target_id in positions or (target_id not in wanted and target_id != _SEEKHEAD):
+                continue
+            f.seek(segment_start + target_pos)
+            eid, size, unknown = _read_element_header(f)
+            if eid != target_id or unknown:
+                raise _UnsupportedContainer("seek head points to the wrong element")
+            if eid == _SEEKHEAD:
+                seekheads.append((f.tell(), size))
+            else:
+                positions[eid] = (f.tell(), size)
+
+    if _TRACKS not in positions:
+        raise _UnsupportedContainer("couldn't find Matroska tracks")
+
+    def read_element(eid) -> bytes:
+        offset, size = positions[eid]
+        if size > _MAX_HEADER_SIZE:
+            raise _UnsupportedContainer("header element too large")
+        f.seek(offset)
+        data = f.read(size)
+        if len(data) != size:
+            raise _UnsupportedContainer("truncated element")
+        return data
+
+    timestamp_scale = 1000000
+    duration = None
+    if _INFO in positions:
+        for ceid, child in _iter_children(read_element(_INFO)):
+            if ceid == _TIMESTAMPSCALE:
+                timestamp_scale = _uint(child)
+            elif ceid == _DURATION:
+                duration = _float(child)
+    if duration is not None:
+        duration = duration * timestamp_scale / 1e9  # seconds
+    time_base = f"1/{int(1e9 / timestamp_scale)}"
+
+    track_durations = {}
+    if _TAGS in positions:
+        track_durations = _parse_mkv_track_durations(read_element(_TAGS))
+
+    streams = []
+    for ceid, child in _iter_children(read_element(_TRACKS)):
+        if ceid == _TRACKENTRY:
+            stream = _parse_mkv_track(child, index=len(streams), time_base=time_base)
+            uid = _mkv_track_uid(child)
+            if uid in track_durations:
+                stream.setdefault('tags', {})['DURATION'] = track_durations[uid]
+            streams.append(stream)
+
+    chapters = []
+    if _CHAPTERS in positions:
+        chapters = _parse_mkv_chapters(read_element(_CHAPTERS), duration)
+
+    if _ATTACHMENTS in positions:
+        offset, size = positions[_ATTACHMENTS]
+        f.seek(offset)
+        streams += _parse_mkv_attachments(f, offset + size, first_index=len(streams))
+
+    fmt = {
+        'format_name': 'matroska,webm',
+        'nb_streams': len(streams),
+        'nb_chapters': len(chapters),
+        'size': str(filesize),
+    }
+    if duration is not None:
+        fmt['duration'] = f"{duration:.6f}"
+    return {'streams': streams, 'chapters': chapters, 'format': fmt}
+
+
+_mp4_handlers = {
+    b'vide': 'video',
+    b'soun': 'audio',
+    b'sbtl': 'subtitle',
+    b'subt': 'subtitle',
+    b'text': 'subtitle',
+}
+
+_mp4_codecs = {
+    b'avc1': 'h264',
+    b'avc3': 'h264',
+    b'hvc1': 'hevc',
+    b'hev1': 'hevc',
+    b'av01': 'av1',
+    b'vp09': 'vp9',
+    b'ac-3': 'ac3',
+    b'ec-3': 'eac3',
+    b'Opus': 'opus',
+    b'fLaC': 'flac',
+    b'alac': 'alac',
+    b'.mp3': 'mp3',
+    b'tx3g': 'mov_text',
+    b'wvtt': 'webvtt',
+}
+
+# MPEG-4 objectTypeIndication -> ffmpeg codec name, for mp4a and mp4v sample entries
+_mp4_object_types = {
+    0x20: 'mpeg4',
+    0x21: 'h264',
+    0x60: 'mpeg2video',
+    0x61: 'mpeg2video',
+    0x62: 'mpeg2video',
+    0x63: 'mpeg2video',
+    0x64: 'mpeg2video',
+    0x65: 'mpeg2video',
+    0x6A: 'mpeg1video',
+    0x6C: 'mjpeg',
+    0x40: 'aac',
+    0x66: 'aac',
+    0x67: 'aac',
+    0x68: 'aac',
+    0x69: 'mp3',
+    0x6B: 'mp3',
+}
+
+
+def _iter_boxes(data: bytes):
+    r"""
+    Yields (box type, box payload) for each box in an in-memory buffer
+    """
+    pos = 0
+    while pos + 8 <= len(data):
+        size, btype = struct.unpack('>I4s', data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            if pos + 16 > len(data):
+                raise _UnsupportedContainer("truncated box")
+            size = struct.unpack('>Q', data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = len(data) - pos
+        if size < header or pos + size > len(data):
+            raise _UnsupportedContainer("truncated box")
+        yield btype, data[pos + header:pos + size]
+        pos += size
+
+
+def _find_box(data: bytes, path: List[bytes]) -> Union[bytes, None]:
+    for btype, payload in _iter_boxes(data):
+        if btype == path[0]:
+            if len(path) == 1:
+                return payload
+            return _find_box(payload, path[1:])
+    return None
+
+
+def _mp4_language(code: int) -> str:
+    return ''.join(chr(((code >> shift) & 0x1F) + 0x60) for shift in (10, 5, 0))
+
+
+def _mp4_object_type(esds: bytes) -> Union[int, None]:
+    r"""
+    Reads objectTypeIndication from an esds box's DecoderConfigDescriptor
+    """
+    f = io.BytesIO(esds[4:])  # skip version/flags
+
+    def read_descriptor():
+        tag = f.read(1)
+        if len(tag) == 0:
+            raise _UnsupportedContainer("truncated esds")
+        length = 0
+        for _ in range(4):
+            b = f.read(1)
+            if len(b) == 0:
+                raise _UnsupportedContainer("truncated esds")
+            length = (length << 7) | (b[0] & 0x7F)
+            if not b[0] & 0x80:
+                break
+        return tag[0], length
+
+    tag, _ = read_descriptor()
+    if tag != 0x03:  # ES_Descriptor
+        return None
+    f.read(2)  # ES_ID
+    flags = f.read(1)[0]
+    if flags & 0x80:
+        f.read(2)
+    if flags & 0x40:
+        f.read(f.read(1)[0])
+    if flags & 0x20:
+        f.read(2)
+    tag, _ = read_descriptor()
+    if tag != 0x04:  # DecoderConfigDescriptor
+        return None
+    return f.read(1)[0]
+
+
+def _mp4_duration_ts(trak: bytes, media_duration: int, timescale: int, movie_timescale: int) -> Union[int, None]:
+    r"""
+    Track duration in its own timescale, as ffprobe reports it: the length of the track's edit, rescaled from the movie
+    timescale, or the media duration from mdhd if the track has no edit list
+    :return: Duration in ticks of 1/timescale, None if unknown
+    """
+    elst = _find_box(trak, [b'edts', b'elst'])
+    if elst is None:
+        if media_duration in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):  # unknown, e.g. fragmented files
+            return None
+        return media_duration
+    version = elst[0]
+    count = struct.unpack('>I', elst[4:8])[0]
+    entry_format, entry_size = ('>Qq', 20) if version == 1 else ('>Ii', 12)
+    edits = [struct.unpack(entry_format, elst[8 + i * entry_size:8 + i * entry_size + entry_size - 4])
+             for i in range(count)]
+    if len(edits) != 1 or edits[0][1] < 0 or movie_timescale <= 0:
+        # empty edits (delays) and multiple edits are resolved by ffmpeg's index fixup
+        raise _UnsupportedContainer("MP4 edit list with more than one edit")
+    segment_duration = edits[0][0]
+    if segment_duration == 0:
+        raise _UnsupportedContainer("MP4 edit list without a duration")
+    # av_rescale, rounding to nearest
+    return (segment_duration * timescale + movie_timescale // 2) // movie_timescale
+
+
+def _parse_mp4_track(trak: bytes, index: int, movie_timescale: int) -> dict:
+    mdia = _find_box(trak, [b'mdia'])
+    if mdia is None:
+        raise _UnsupportedContainer("MP4 track without mdia box")
+    mdhd = _find_box(mdia, [b'mdhd'])
+    hdlr = _find_box(mdia, [b'hdlr'])
+    stsd = _find_box(mdia, [b'minf', b'stbl', b'stsd'])
+    if mdhd is None or hdlr is None or stsd is None:
+        raise _UnsupportedContainer("MP4 track missing mdhd, hdlr or stsd")
+
+    if mdhd[0] == 1:
+        timescale, media_duration, language = struct.unpack('>IQH', mdhd[20:34])
+    else:
+        timescale, media_duration, language = struct.unpack('>IIH', mdhd[12:22])
+    if timescale == 0:
+        raise _UnsupportedContainer("MP4 track without a timescale")
+
+    handler = hdlr[8:12]
+    if handler not in _mp4_handlers:
+        raise _UnsupportedContainer(f"unsupported MP4 handler {handler}")
+    codec_type = _mp4_handlers[handler]
+
+    entries = list(_iter_boxes(stsd[8:]))  # skip version/flags and entry count
+    if len(entries) == 0:
+        raise _UnsupportedContainer("MP4 track without sample entries")
+    fourcc, entry = entries[0]
+
+    if fourcc in (b'mp4a', b'mp4v'):
+        if fourcc == b'mp4v':
+            children = entry[78:]  # child boxes follow the fixed-size visual sample entry fields
+        elif struct.unpack('>H', entry[8:10])[0] == 0:
+            children = entry[28:]
+        else:
+            children = entry[44:]  # QuickTime v1 sound sample entries have 16 extra bytes
+        esds = _find_box(children, [b'esds'])
+        object_type = _mp4_object_type(esds) if esds is not None else None
+        if object_type not in _mp4_object_types:
+            raise _UnsupportedContainer(f"unknown {fourcc} object type {object_type}")
+        codec_name = _mp4_object_types[object_type]
+    elif fourcc in _mp4_codecs:
+        codec_name = _mp4_codecs[fourcc]
+    else:
+        raise _UnsupportedContainer(f"unknown MP4 sample entry {fourcc}")
+
+    stream = {
+        'index': index,
+        'codec_name': codec_name,
+        'codec_type': codec_type,
+        'time_base': f"1/{timescale}",
+    }
+    duration_ts = _mp4_duration_ts(trak, media_duration, timescale, movie_timescale)
+    if duration_ts is not None:
+        stream['duration_ts'] = duration_ts
+        stream['duration'] = f"{duration_ts / timescale:.6f}"
+    if codec_type == 'video':
+        stream['width'], stream['height'] = struct.unpack('>HH', entry[24:28])
+    if codec_type == 'audio':
+        version, channels, sample_rate = struct.unpack('>H6xH6xI', entry[8:28])
+        if version not in (0, 1):
+            raise _UnsupportedContainer("QuickTime v2 sound sample entry")
+        stream['channels'] = channels
+        stream['sample_rate'] = str(sample_rate >> 16)
+    stream['tags'] = {'language': _mp4_language(language)}
+    handler_name = _string(hdlr[24:])
+    if handler_name:
+        stream['tags']['handler_name'] = handler_name
+    return stream
+
+
+def _read_mp4(f, filesize: int) -> dict:
+    moov = None
+    pos = 0
+    while pos + 8 <= filesize:
+        f.seek(pos)
+        header = f.read(16)
+        size, btype = struct.unpack('>I4s', header[:8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = filesize - pos
+        if size < header_size:
+            raise _UnsupportedContainer("invalid top-level box")
+        if btype == b'moov':
+            if size > _MAX_HEADER_SIZE:
+                raise _UnsupportedContainer("moov box too large")
+            f.seek(pos + header_size)
+            moov = f.read(size - header_size)
+            break
+        pos += size
+    if moov is None:
+        raise _UnsupportedContainer("couldn't find moov box")
+
+    streams = []
+    duration = None
+    mvhd = _find_box(moov, [b'mvhd'])
+    if mvhd is None:
+        raise _UnsupportedContainer("MP4 without mvhd box")
+    if mvhd[0] == 1:
+        movie_timescale, length = struct.unpack('>IQ', mvhd[20:32])
+    else:
+        movie_timescale, length = struct.unpack('>II', mvhd[12:20])
+    if movie_timescale > 0:
+        duration = length / movie_timescale
+    for btype, payload in _iter_boxes(moov):
+        if btype == b'trak':
+            if _find_box(payload, [b'tref', b'chap']) is not None:
+                # QuickTime chapter tracks need ffmpeg's handling
+                raise _UnsupportedContainer("MP4 chapter track")
+            streams.append(_parse_mp4_track(payload, index=len(streams), movie_timescale=movie_timescale))
+        elif btype == b'udta' and _find_box(payload, [b'chpl']) is not None:
+            raise _UnsupportedContainer("Nero chapters")
+
+    fmt = {
+        'format_name': 'mov,mp4,m4a,3gp,3g2,mj2',
+        'nb_streams': len(streams),
+        'nb_chapters': 0,
+        'size': str(filesize),
+    }
+    if duration is not None:
+        fmt['duration'] = f"{duration:.6f}"
+    return {'streams': streams, 'chapters': [], 'format': fmt}
+
+
+def read_container_info(filepath: Path) -> Union[Dict, None]:
+    r"""
+    Reads stream and chapter information from a Matroska or MP4 file's headers.
+    :param filepath: Path to a media file
+    :return: Dict shaped like ffprobe's JSON output (streams, chapters, format), or None if the file isn't a
+        Matroska/MP4 file or uses features this reader doesn't handle
+    """
+    try:
+        filesize = filepath.stat().st_size
+        with open(str(filepath), 'rb') as f:
+            magic = f.read(8)
+            f.seek(0)
+            if magic[:4] == b'\x1a\x45\xdf\xa3':
+                info = _read_mkv(f, filesize)
+            elif magic[4:8] in (b'ftyp', b'moov'):
+                info = _read_mp4(f, filesize)
+            else:
+                return None
+    except (_UnsupportedContainer, EOFError, struct.error, IndexError, OSError) as e:
+        logging.debug(f"Couldn't read container headers of {filepath}, falling back to ffprobe: {e!r}")
+        return None
+    info['format']['filename'] = str(filepath)
+    return info
@@ -0,0 +1,153 @@
+r"""
+Persistent cache of demuxed streams, so that rerunning condense or srs on the same inputs doesn't demux them again,
+and nothing has to be written next to the source files.
+Entries are keyed by the source file's identity (size, modification time and a hash of its first and last blocks), the
+stream index and the output format. The cache is capped in size, least recently used entries are evicted first.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Union
+
+DEFAULT_MAX_BYTES = 4 * 2 ** 30
+# bytes hashed from each end of the source file
+PARTIAL_HASH_BYTES = 2 ** 20
+
+
+def source_identity(filepath: Path) -> str:
+    r"""
+    Identifies a source file by size, modification time and a hash of its first and last PARTIAL_HASH_BYTES bytes.
+    Cheap to compute even for large files on network storage, and doesn't depend on the file's path.
+    """
+    st = os.stat(str(filepath))
+    h = hashlib.sha256(f"{st.st_size}:{st.st_mtime_ns}:".encode('utf-8'))
+    with open(str(filepath), 'rb') as f:
+        h.update(f.read(PARTIAL_HASH_BYTES))
+        if st.st_size > 2 * PARTIAL_HASH_BYTES:
+            f.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+            h.update(f.read(PARTIAL_HASH_BYTES))
+    return h.hexdigest()
+
+
+class DemuxCache:
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        r"""
+        Directory of demuxed streams indexed by a SQLite database, with least-recently-used eviction
+        :param cache_dir: Directory to store demuxed streams in, created if it doesn't exist
+        :param max_bytes: Once the cache holds more than this many bytes, the least recently used entries are evicted
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.cache_dir / 'demux_cache.sqlite3'), isolation_level=None,
+                                   check_same_thread=False, timeout=30)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "key TEXT PRIMARY KEY, filename TEXT, size INTEGER, last_used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        # source identities computed this run, by (path, size, mtime_ns)
+        self._identities = {}
+        # entries used by this process, never evicted while it runs
+        self._in_use = set()
+
+    def key(self, filepath: Path, stream_index: int, variant: str) -> str:
+        r"""
+        :param filepath: Source file
+        :param stream_index: Index of the demuxed stream within the source file
+        :param variant: Output format of the demuxed stream, e.g. its extension
+        """
+        st = os.stat(str(filepath))
+        ident_key = (str(Path(filepath).absolute()), st.st_size, st.st_mtime_ns)
+        if ident_key not in self._identities:
+            self._identities[ident_key] = source_identity(filepath)
+        return f"{self._identities[ident_key]}.{stream_index}.{variant}"
+
+    def path_for(self, key: str, extension: str) -> Path:
+        r"""
+        Where the entry for key is stored. Output format is specified via extension, which must not include a dot
+        """
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return self.cache_dir / digest[:2] / f"{digest}.{extension}"
+
+    def get(self, key: str) -> Union[Path, None]:
+        r"""
+        :return: Path to the cached stream, or None if it isn't cached
+        """
+        with self._lock:
+            row = self._db.execute("SELECT filename FROM entries WHERE key = ?", (key,)).fetchone()
+            path = None if row is None else self.cache_dir / row[0]
+            if path is None or not path.exists() or path.stat().st_size == 0:
+                self.misses += 1
+                logging.debug(f"Demux cache miss for {key} (hits={self.hits}, misses={self.misses})")
+                return None
+            self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._in_use.add(key)
+            self.hits += 1
+        logging.debug(f"Demux cache hit for {key} (hits={self.hits}, misses={self.misses})")
+        return path
+
+    def put(self, key: str, path: Path):
+        r"""
+        Records a stream demuxed to path_for(key, ...) and evicts old entries if the cache is over its size cap
+        """
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries (key, filename, size, last_used) VALUES (?, ?, ?, ?)",
+                             (key, str(path.relative_to(self.cache_dir)), path.stat().st_size, time.time()))
+            self._in_use.add(key)
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, filename, size in self._db.execute(
+                "SELECT key, filename, size FROM entries ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            if key in self._in_use:
+                continue
+            try:
+                (self.cache_dir / filename).unlink()
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            logging.debug(f"Evicted {filename} from demux cache")
+        if total > self.max_bytes:
+            logging.warning(f"Demux cache in {self.cache_dir} is over its size limit with streams still in use, "
+                            f"consider raising --cache-size")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# process-wide cache, None if demuxed streams are written next to their sources
+_cache = None
+
+
+def enable_demux_cache(cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+    global _cache
+    try:
+        _cache = DemuxCache(Path(cache_dir), max_bytes=max_bytes)
+        logging.debug(f"Using demux cache at {_cache.cache_dir}")
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Couldn't open demux cache in {cache_dir}, demuxing next to input files: {e}")
+        _cache = None
+
+
+def get_demux_cache() -> Union[DemuxCache, None]:
+    return _cache
+
+
+def log_demux_cache_stats():
+    if _cache is None:
+        return
+    logging.debug(f"Demux cache: {_cache.hits} hits, {_cache.misses} misses")
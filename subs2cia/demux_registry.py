@@ -0,0 +1,135 @@
+r"""
+Process-wide registry of demuxed streams, so that groups sharing a source file (e.g. one video paired with several
+external subtitle files in different groups) extract each of its streams once per run instead of once per group.
+Entries are reference counted: a demuxed file is deleted once no stream uses it and no group that reads its source file
+is still waiting to be processed.
+"""
+import logging
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Union
+
+from subs2cia import scratch
+
+
+def _source_key(filepath: Path) -> str:
+    return str(Path(filepath).absolute())
+
+
+class RegistryEntry:
+    __slots__ = ('demux_file', 'refs', 'cached')
+
+    def __init__(self, demux_file, cached: bool):
+        r"""
+        :param demux_file: AVSFile of the demuxed stream, shared by every Stream using it
+        :param cached: If set, the file belongs to the demux cache and is never deleted
+        """
+        self.demux_file = demux_file
+        self.refs = 1
+        self.cached = cached
+
+
+class DemuxRegistry:
+    def __init__(self):
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        # groups that read each source file and haven't been cleaned up yet
+        self._pending = defaultdict(int)
+
+    @staticmethod
+    def key(filepath: Path, stream_index: int, variant: str) -> tuple:
+        r"""
+        :param filepath: Source file
+        :param stream_index: Index of the demuxed stream within the source file
+        :param variant: Output format of the demuxed stream, e.g. its extension
+        """
+        return _source_key(filepath), stream_index, variant
+
+    def expect(self, filepaths):
+        r"""
+        Records that a group reading filepaths is going to be processed, which keeps their demuxed streams around until
+        done() is called for it
+        """
+        with self._lock:
+            for filepath in filepaths:
+                self._pending[_source_key(filepath)] += 1
+
+    def done(self, filepaths):
+        r"""
+        Counterpart of expect(), called once the group has been cleaned up. Deletes demuxed streams of its source files
+        that nothing needs anymore.
+        """
+        with self._lock:
+            for filepath in filepaths:
+                source = _source_key(filepath)
+                if self._pending.get(source, 0) > 1:
+                    self._pending[source] -= 1
+                else:
+                    self._pending.pop(source, None)
+                self._collect(source)
+
+    def acquire(self, key: tuple) -> Union[RegistryEntry, None]:
+        r"""
+        :return: Entry of a previously demuxed stream, with one more reference held by the caller. None if the stream
+            hasn't been demuxed in this run
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refs += 1
+                self.hits += 1
+                logging.debug(f"Reusing demuxed stream {entry.demux_file.filepath}")
+            return entry
+
+    def add(self, key: tuple, demux_file, cached: bool) -> RegistryEntry:
+        r"""
+        Registers a newly demuxed stream, referenced once by the caller. If another thread registered the same stream
+        first, its entry is used instead.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refs += 1
+                return entry
+            entry = RegistryEntry(demux_file, cached=cached)
+            self._entries[key] = entry
+            return entry
+
+    def release(self, key: tuple):
+        r"""
+        Drops one reference to a demuxed stream, deleting it if nothing needs it anymore
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            self._collect(key[0])
+
+    def _collect(self, source: str):
+        if self._pending.get(source, 0) > 0:
+            return
+        for key in [k for k, e in self._entries.items() if k[0] == source and e.refs <= 0]:
+            entry = self._entries.pop(key)
+            if entry.cached:
+                continue
+            logging.info(f"Deleting temporary file {str(entry.demux_file.filepath)}")
+            try:
+                scratch.discard(entry.demux_file.filepath)
+            except FileNotFoundError:
+                pass
+
+
+_registry = DemuxRegistry()
+
+
+def get_demux_registry() -> DemuxRegistry:
+    return _registry
+
+
+def log_demux_registry_stats():
+    if _registry.hits == 0:
+        return
+    logging.debug(f"Demux registry: {_registry.hits} streams reused across groups instead of demuxed again")
@@ -2,31 +2,60 @@ from __future__ import unicode_literals, print_function
 import logging
 from pathlib import Path
 import subprocess
-from typing import List, Union
-from tqdm import tqdm, TqdmWarning
-
-try:
-    import gevent
-    import gevent.monkey
-    gevent.monkey.patch_all(thread=False)
-except ImportError:
-    gevent = None
-    pass
-
-
-import warnings
-warnings.filterwarnings("ignore", category=TqdmWarning)
+from typing import List, Union, Callable, Iterable, NamedTuple, Tuple
 
 import contextlib
+from concurrent.futures import ThreadPoolExecutor
 import ffmpeg
 import os
+import selectors
 import shutil
 import socket
 import sys
 import tempfile
 import textwrap
 
-import json
+from subs2cia.probe_records import ProbeInfo
+from subs2cia import scratch
+
+# gevent is imported and monkey-patched on first use, see load_gevent()
+gevent = None
+_gevent_loaded = False
+
+
+def load_gevent():
+    r"""
+    Imports gevent and monkey-patches the standard library the first time a progress bar is needed.
+    Patching is slow and has process-wide side effects, so it is deferred until ffmpeg is actually about to run.
+    :return: gevent module, or None if gevent is not available
+    """
+    global gevent, _gevent_loaded
+    if _gevent_loaded:
+        return gevent
+    _gevent_loaded = True
+    try:
+        import gevent
+        import gevent.monkey
+        gevent.monkey.patch_all(thread=False)
+    except ImportError:
+        gevent = None
+    return gevent
+
+
+def map_concurrently(fn: Callable, items: Iterable, jobs: int) -> list:
+    r"""
+    Like map(), but runs fn on up to jobs items at a time in worker threads. Results are returned in input order.
+    Once gevent has monkey-patched the process, patched queues and subprocesses don't work from native threads, so
+    fn runs in up to jobs greenlets instead. These overlap while waiting on ffprobe/ffmpeg, but not in Python code.
+    :param jobs: Maximum number of worker threads or greenlets. 1 or less runs sequentially.
+    """
+    if jobs <= 1:
+        return [fn(item) for item in items]
+    if gevent is not None:
+        from gevent.pool import Pool
+        return Pool(jobs).map(fn, items)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(fn, items))
 
 
 @contextlib.contextmanager
@@ -74,7 +103,7 @@ def _watch_progress(handler):
     Yields:
         socket_filename: the name of the socket file.
     """
-    if gevent is None:
+    if load_gevent() is None:
         raise RuntimeError('Package `gevent` is not available')
 
     with _tmpdir_scope() as tmpdir:
@@ -96,6 +125,10 @@ def _watch_progress(handler):
 def show_progress(total_duration, desc):
     """Create a unix-domain socket to watch progress and render tqdm
     progress bar."""
+    import warnings
+    from tqdm import tqdm, TqdmWarning
+    warnings.filterwarnings("ignore", category=TqdmWarning)
+
     with tqdm(total=round(total_duration, 2), position=0, unit='sec', desc=desc) as bar:
         def handler(key, value):
             if key == 'out_time_ms':
@@ -108,12 +141,12 @@ def show_progress(total_duration, desc):
 
 
 # given a stream in the input file, demux the stream and save it into the outfile with some type
-def ffmpeg_demux(infile: Path, stream_idx: int, outfile: Path):
-    # output format is specified via extention on outfile
+def ffmpeg_demux(infile: Path, stream_idx: int, outfile: Path, **output_kwargs):
+    # output format is specified via extention on outfile, output_kwargs are passed to ffmpeg.output (e.g. acodec, ac)
     logging.debug(f"demuxing stream {stream_idx} from file {infile} to {outfile}")
     video = ffmpeg.input(str(infile))
     stream = video[str(stream_idx)]  # don't need 0
-    stream = ffmpeg.output(stream, str(outfile))
+    stream = ffmpeg.output(stream, str(outfile), **output_kwargs)
     stream = ffmpeg.overwrite_output(stream)
     logging.debug(f"ffmpeg arguments: {ffmpeg.get_args(stream)}")
 
@@ -132,6 +165,114 @@ def ffmpeg_demux(infile: Path, stream_idx: int, outfile: Path):
     return outfile
 
 
+def ffmpeg_demux_many(infile: Path, outputs: List[Tuple[int, Path, dict]]) -> List[Union[Path, None]]:
+    r"""
+    Demuxes several streams of infile in a single ffmpeg invocation, so that the input is only read once.
+    If that fails (e.g. one of the streams can't be converted), each stream is retried on its own.
+    :param infile: Input file
+    :param outputs: List of (stream index, output file, ffmpeg.output keyword arguments) tuples, output format is
+        specified via extension
+    :return: Output file of each tuple in order, or None for streams that couldn't be demuxed
+    """
+    if len(outputs) == 0:
+        return []
+    if len(outputs) == 1:
+        return [ffmpeg_demux(infile, outputs[0][0], outputs[0][1], **outputs[0][2])]
+    logging.debug(f"demuxing streams {[idx for idx, _, _ in outputs]} from file {infile} in one pass")
+    video = ffmpeg.input(str(infile))
+    stream = ffmpeg.merge_outputs(*[ffmpeg.output(video[str(idx)], str(outfile), **kwargs)
+                                    for idx, outfile, kwargs in outputs])
+    stream = ffmpeg.overwrite_output(stream)
+    logging.debug(f"ffmpeg arguments: {ffmpeg.get_args(stream)}")
+
+    quiet = not logging.root.isEnabledFor(logging.DEBUG)
+
+    try:
+        ffmpeg.run(stream, quiet=quiet)
+    except ffmpeg.Error as e:
+        logging.debug(f"Couldn't demux streams from {infile} in one pass, demuxing one at a time. ffmpeg output: \n" +
+                      (e.stderr.decode("utf-8") if e.stderr is not None else ''))
+        return [ffmpeg_demux(infile, idx, outfile, **kwargs) for idx, outfile, kwargs in outputs]
+    return [outfile for _, outfile, _ in outputs]
+
+
+def ffmpeg_read_subtitle(infile: Path, stream_idx: int, format: str) -> Union[str, None]:
+    r"""
+    Extracts a subtitle stream over ffmpeg's stdout instead of writing it to a file
+    :param format: Subtitle format to convert to, e.g. 'ass' or 'srt'
+    :return: Subtitle text, or None if the stream couldn't be extracted
+    """
+    logging.debug(f"reading subtitle stream {stream_idx} from file {infile}")
+    video = ffmpeg.input(str(infile))
+    stream = ffmpeg.output(video[str(stream_idx)], 'pipe:', format=format)
+    logging.debug(f"ffmpeg arguments: {ffmpeg.get_args(stream)}")
+
+    try:
+        out, _ = ffmpeg.run(stream, capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        logging.warning(f"Couldn't read subtitle stream {stream_idx} from {infile}, skipping. ffmpeg output: \n" +
+                        (e.stderr.decode("utf-8", errors='replace') if e.stderr is not None else ''))
+        return None
+    return out.decode('utf-8', errors='replace')
+
+
+def ffmpeg_read_subtitles(infile: Path, outputs: List[Tuple[int, str]]) -> List[Union[str, None]]:
+    r"""
+    Extracts several subtitle streams of infile into memory in a single ffmpeg invocation, so that the input is only
+    read once. Each stream is written to its own pipe, which are only available on POSIX systems; elsewhere, or if the
+    single pass fails, each stream is read on its own.
+    :param infile: Input file
+    :param outputs: List of (stream index, subtitle format) pairs
+    :return: Subtitle text of each pair in order, or None for streams that couldn't be extracted
+    """
+    if len(outputs) == 0:
+        return []
+    if len(outputs) == 1 or os.name != 'posix':
+        return [ffmpeg_read_subtitle(infile, idx, fmt) for idx, fmt in outputs]
+    logging.debug(f"reading subtitle streams {[idx for idx, _ in outputs]} from file {infile} in one pass")
+    pipes = [os.pipe() for _ in outputs]
+    video = ffmpeg.input(str(infile))
+    stream = ffmpeg.merge_outputs(*[ffmpeg.output(video[str(idx)], f'pipe:{w}', format=fmt)
+                                    for (idx, fmt), (_, w) in zip(outputs, pipes)])
+    logging.debug(f"ffmpeg arguments: {ffmpeg.get_args(stream)}")
+
+    try:
+        process = subprocess.Popen(ffmpeg.compile(stream), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, pass_fds=[w for _, w in pipes])
+    except OSError:
+        for r, w in pipes:
+            os.close(r)
+            os.close(w)
+        raise
+    for _, w in pipes:
+        os.close(w)
+
+    # drain every pipe as data arrives, ffmpeg blocks once any one of them is full
+    chunks = {r: [] for r, _ in pipes}
+    chunks[process.stderr.fileno()] = []
+    with selectors.DefaultSelector() as selector:
+        for fd in chunks:
+            selector.register(fd, selectors.EVENT_READ)
+        while len(selector.get_map()) > 0:
+            for key, _ in selector.select():
+                data = os.read(key.fd, 2 ** 16)
+                if len(data) == 0:
+                    selector.unregister(key.fd)
+                else:
+                    chunks[key.fd].append(data)
+    process.wait()
+    stderr = b''.join(chunks[process.stderr.fileno()])
+    process.stderr.close()
+    for r, _ in pipes:
+        os.close(r)
+
+    if process.returncode != 0:
+        logging.debug(f"Couldn't read subtitle streams from {infile} in one pass, reading one at a time. "
+                      f"ffmpeg output: \n" + stderr.decode("utf-8", errors='replace'))
+        return [ffmpeg_read_subtitle(infile, idx, fmt) for idx, fmt in outputs]
+    return [b''.join(chunks[r]).decode('utf-8', errors='replace') for r, _ in pipes]
+
+
 # from ffmpeg-python _run.py
 class Error(Exception):
     def __init__(self, cmd, stdout, stderr: bytes):
@@ -142,39 +283,82 @@ class Error(Exception):
         self.stderr = stderr
 
 
-def ffmpeg_condense_audio(audiofile, sub_times, quality: Union[int, None], to_mono: bool, outfile=None, codec=''):
-    if outfile is None:
-        outfile = "condensed.flac"
-    # logging.info(f"saving condensed audio to {outfile}")
+class MediaInfo(NamedTuple):
+    r"""
+    Immutable summary of the ffprobe fields subs2cia uses from an audio stream.
+    Built once per file by get_media_info() and passed along instead of re-running ffprobe.
+    """
+    duration: float  # milliseconds
+    sample_rate: Union[int, None]
+    time_base: int  # ticks per second, used to convert milliseconds to atrim start_pts/end_pts if sample_rate is unknown
+    chapters: tuple
+
+
+def get_media_info(probe_info: ProbeInfo, stream_idx: int = 0) -> MediaInfo:
+    r"""
+    Extracts duration, sample rate, time base and chapters from probe results
+    :param probe_info: Probe results, e.g. ProbeInfo.from_probe(ffmpeg.probe(...))
+    :param stream_idx: Index of the audio stream to describe
+    :return: MediaInfo
+    """
+    stream_info = probe_info.streams[stream_idx]
 
-    # get samples in audio file
     # prefer codec_time_base because some files will have different values for each, and codec_time_base seems to be the
     #  most accurate
-    audio_info = ffmpeg.probe(audiofile, cmd='ffprobe')
-    if 'codec_time_base' in audio_info['streams'][0]:
+    if stream_info.codec_time_base is not None:
         # audio samples per second, inverse of sampling frequency
-        sps = int(
-            audio_info['streams'][0]['codec_time_base'].split('/')[1])
-    elif 'time_base' in audio_info['streams'][0]:
-        # audio samples per second, inverse of sampling frequency
-        sps = int(
-            audio_info['streams'][0]['time_base'].split('/')[
-                1])
+        time_base = stream_info.codec_time_base
+    elif stream_info.time_base is not None:
+        time_base = stream_info.time_base
     else:
-        info = json.dumps(audio_info['streams'][0])
+        info = repr(stream_info)
         logging.error("ffprobe couldn't determine audio time_base, can't condense")
         raise Error("", '', info.encode('utf-8'))
-    # samples = audio_info['streams'][0]['duration_ts']  # total samples in audio track
+
     # duration_ts uses time_base, not codec_time_base
+    if stream_info.duration_ts is not None and stream_info.time_base is not None:
+        duration = stream_info.duration_ts / stream_info.time_base * 1000
+    elif stream_info.duration is not None:
+        duration = stream_info.duration * 1000
+    else:
+        duration = probe_info.duration * 1000
+
+    return MediaInfo(duration=duration, sample_rate=stream_info.sample_rate, time_base=time_base,
+                     chapters=probe_info.chapters)
+
 
-    stream = ffmpeg.input(audiofile)
+def _select_audio(stream, stream_index: Union[int, None]):
+    # first audio stream of a single-stream file, or a specific stream of a container
+    if stream_index is None:
+        return stream.audio
+    return stream[str(stream_index)]
+
+
+def ffmpeg_condense_audio(audiofile, sub_times, quality: Union[int, None], to_mono: bool, outfile=None, codec='',
+                          audio_info: Union[MediaInfo, None] = None, stream_index: Union[int, None] = None):
+    r"""
+    :param audiofile: Audio file, or a container if stream_index is given
+    :param audio_info: Metadata of the audio stream. Probed from audiofile if not given
+    :param stream_index: Index of the audio stream within audiofile. If None, uses the first audio stream
+    """
+    if outfile is None:
+        outfile = "condensed.flac"
+    # logging.info(f"saving condensed audio to {outfile}")
+
+    if audio_info is None:
+        audio_info = get_media_info(ProbeInfo.from_probe(ffmpeg.probe(audiofile, cmd='ffprobe')),
+                                    stream_idx=stream_index or 0)
+    # decoded audio is timestamped in samples, a container's time base (e.g. 1/1000 for Matroska) doesn't apply
+    sps = audio_info.sample_rate if audio_info.sample_rate is not None else audio_info.time_base
+
+    stream = _select_audio(ffmpeg.input(audiofile), stream_index)
 
     clips = list()
     for time in sub_times:  # times are in milliseconds
         start = int(time[0] * sps / 1000)  # convert to sample index
         end = int(time[1] * sps / 1000)
         # use start_pts for sample/millisecond level precision
-        clips.append(stream.audio.filter('atrim', start_pts=start, end_pts=end).filter('asetpts', 'PTS-STARTPTS'))
+        clips.append(stream.filter('atrim', start_pts=start, end_pts=end).filter('asetpts', 'PTS-STARTPTS'))
     combined = ffmpeg.concat(*clips, a=1, v=0)
 
     kwargs = {}
@@ -201,7 +385,8 @@ def ffmpeg_condense_audio(audiofile, sub_times, quality: Union[int, None], to_mo
 
 
 def export_condensed_audio(divided_times, audiofile: Path, quality: Union[int, None], to_mono: bool, outfile=None,
-                           use_absolute_numbering=False, codec=''):
+                           use_absolute_numbering=False, codec='', audio_info: Union[MediaInfo, None] = None,
+                           stream_index: Union[int, None] = None):
     # outfile is full path with extension
     audiofile = str(audiofile)
     if outfile is not None:
@@ -235,7 +420,7 @@ def export_condensed_audio(divided_times, audiofile: Path, quality: Union[int, N
                                os.path.splitext(outfile)[1]
             try:
                 ffmpeg_condense_audio(audiofile=audiofile, sub_times=split, outfile=outfilesplit, quality=quality,
-                                      to_mono=to_mono, codec=codec)
+                                      to_mono=to_mono, codec=codec, audio_info=audio_info, stream_index=stream_index)
                 logging.info(f"Wrote condensed audio to {outfilesplit}")
             except Error as e:
                 logging.error(
@@ -243,7 +428,7 @@ def export_condensed_audio(divided_times, audiofile: Path, quality: Union[int, N
 
 
 def export_condensed_video(divided_times, audiofile: Path, subfile: Path, videofile: Path, outfile=None,
-                           use_absolute_numbering=False):
+                           use_absolute_numbering=False, audio_stream_index: Union[int, None] = None):
     # outfile is full path with extension
     audiofile = str(audiofile)
     if outfile is not None:
@@ -278,7 +463,7 @@ def export_condensed_video(divided_times, audiofile: Path, subfile: Path, videof
             # todo: need to split subfiles with partition, split options
             try:
                 ffmpeg_condense_video(audiofile=audiofile, videofile=str(videofile), subfile=str(subfile),
-                                      sub_times=split, outfile=outfilesplit)
+                                      sub_times=split, outfile=outfilesplit, audio_stream_index=audio_stream_index)
             except Error as e:
                 logging.error(
                     f"ffmpeg couldn't export video. ffmpeg output: \n" + e.stderr.decode("utf-8"))
@@ -312,15 +497,18 @@ def ffmpeg_exec(duration: float, outfile: str, combined):
             #              "Will try using a temporary file to pass filter_complex arguments to ffmpeg.")
             logging.debug("ffmpeg command length exceeds 30000, will try writing to a temporary file")
             idx = args.index("-filter_complex") + 1
-            complex_filter = str(args[idx])
-            # write complex_filter to a temporary file
-            fp = tempfile.NamedTemporaryFile(
-                delete=False)  # don't delete b/c can't open file again when it's already open in windows
-            fp.write(complex_filter.encode(encoding="utf-8"))
-            fp.close()
-            logging.debug(f"using temporary file {fp.name}")
-            args[idx] = fp.name
-            args[idx - 1] = "-filter_complex_script"
+            complex_filter = str(args[idx]).encode(encoding="utf-8")
+            # write complex_filter to a temporary file, closed before ffmpeg opens it (windows can't open it twice)
+            with scratch.temporary_file(suffix='.filter', size=len(complex_filter)) as script:
+                script.write_bytes(complex_filter)
+                logging.debug(f"using temporary file {script}")
+                args[idx] = str(script)
+                args[idx - 1] = "-filter_complex_script"
+                run_args(args)
+        else:
+            run_args(args)
+
+    def run_args(args):
         args = ["ffmpeg"] + args  # + ['-progress', 'unix://{}'.format(socket_filename)]
 
         # ffmpeg.run(combined, quiet=logging.getLogger().getEffectiveLevel() >= logging.WARNING)
@@ -342,7 +530,7 @@ def ffmpeg_exec(duration: float, outfile: str, combined):
             raise Error('ffmpeg', out, err)
 
     # if os.name == 'posix':
-    if gevent is not None and hasattr(socket, 'AF_UNIX') and logging.root.level <= logging.INFO:
+    if hasattr(socket, 'AF_UNIX') and logging.root.level <= logging.INFO and load_gevent() is not None:
         with show_progress(total_duration=duration, desc=outfile) as socket_filename:
             combined = combined.global_args('-progress', 'unix://{}'.format(socket_filename))
             run(combined)
@@ -350,21 +538,17 @@ def ffmpeg_exec(duration: float, outfile: str, combined):
         run(combined)
 
 
-def ffmpeg_condense_video(audiofile: str, videofile: str, subfile: str, sub_times, outfile):
+def ffmpeg_condense_video(audiofile: str, videofile: str, subfile: str, sub_times, outfile,
+                          audio_stream_index: Union[int, None] = None):
     # logging.info(f"saving condensed video to {outfile}")
 
-    # get samples in audio file
-    audio_info = ffmpeg.probe(audiofile, cmd='ffprobe')
-    sps = int(
-        audio_info['streams'][0]['time_base'].split('/')[1])  # audio samples per second, inverse of sampling frequency
-    # samples = audio_info['streams'][0]['duration_ts']  # total samples in audio track
-
-    audiostream = ffmpeg.input(audiofile)
     videostream = ffmpeg.input(videofile)
+    # audio taken straight from the video's container only needs the file opened once
+    audiostream = videostream if audiofile == videofile else ffmpeg.input(audiofile)
     substream = ffmpeg.input(subfile)
     vid = videostream.video.filter_multi_output('split')
     # sub = videostream['s'].filter_multi_output('split')
-    aud = audiostream.audio.filter_multi_output('asplit')
+    aud = _select_audio(audiostream, audio_stream_index).filter_multi_output('asplit')
 
     clips = []
     for idx, time in enumerate(sub_times):  # times are in milliseconds
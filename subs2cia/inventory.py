@@ -0,0 +1,101 @@
+r"""
+inventory subcommand: probes every input file and writes one JSON line per file describing its streams and chapters.
+Files are probed in parallel a chunk at a time and written as soon as their chunk is done, so the output can be piped
+into other tools while a large library is still being scanned.
+"""
+import itertools
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Iterable, Iterator, List, TextIO
+
+from subs2cia.ffmpeg_tools import map_concurrently
+from subs2cia.sources import AVSFile, Stream, scan_directory
+
+
+def iter_input_files(inputs: List[Path], recursive: bool, include: List[str], exclude: List[str]) -> Iterator[Path]:
+    r"""
+    Yields input files as given, and the matching files of input directories as they are scanned
+    """
+    for path in inputs:
+        if path.is_dir():
+            for paths in scan_directory(path, recursive=recursive, include=include, exclude=exclude):
+                yield from paths
+        else:
+            yield path
+
+
+def inventory_record(filepath: Path) -> dict:
+    r"""
+    Probes filepath and describes it as a JSON-serializable dict.
+    Languages are canonical ISO 639 alpha-3 codes, taken from stream tags or, for standalone subtitle and audio files,
+    from file name suffixes the same way condense does. Unknown languages are null.
+    """
+    record = {'path': str(filepath)}
+    try:
+        source = AVSFile(filepath)
+        record['size'] = filepath.stat().st_size
+    except (AssertionError, OSError) as e:
+        record['error'] = str(e)
+        return record
+    source.probe()
+    source.get_type()
+    if source.info is None or source.info.streams is None:
+        record['error'] = "couldn't probe"
+        return record
+
+    record['type'] = source.type
+    record['duration'] = source.info.duration
+    streams = []
+    for idx, stream_info in enumerate(source.info.streams):
+        stream = Stream(file=source, type=stream_info.codec_type, stream_info=stream_info,
+                        index=idx if source.type == 'video' else None)
+        language = stream.get_language()
+        streams.append({
+            'index': idx,
+            'type': stream_info.codec_type,
+            'codec': stream_info.codec_name,
+            'language': language if language != 'unknownlang' else None,
+            'title': stream_info.title,
+            'width': stream_info.width,
+            'height': stream_info.height,
+            'sample_rate': stream_info.sample_rate,
+        })
+    record['streams'] = streams
+    record['chapters'] = [{'title': c.title, 'start': c.start_time, 'end': c.end_time}
+                          for c in source.info.chapters]
+    return record
+
+
+def write_inventory(files: Iterable[Path], out: TextIO, jobs: int = 1, chunk_size: int = 64) -> int:
+    r"""
+    Probes files in parallel and writes one JSON line per file to out, in input order
+    :param files: Files to describe, may be a lazily produced iterable
+    :param out: Text stream to write JSON lines to
+    :param jobs: Maximum number of concurrent ffprobe processes
+    :param chunk_size: Number of files probed before their lines are written
+    :return: Number of files written
+    """
+    files = iter(files)
+    count = 0
+    while True:
+        chunk = list(itertools.islice(files, max(chunk_size, jobs)))
+        if len(chunk) == 0:
+            break
+        for record in map_concurrently(inventory_record, chunk, jobs):
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        out.flush()
+        count += len(chunk)
+        logging.debug(f"Inventoried {count} files")
+    return count
+
+
+def inventory_start(args: dict, inputs: List[Path], include: List[str], exclude: List[str]):
+    files = iter_input_files(inputs, recursive=args['recursive'], include=include, exclude=exclude)
+    if args['inventory_output'] is None:
+        count = write_inventory(files, sys.stdout, jobs=args['probe_jobs'])
+    else:
+        with open(args['inventory_output'], 'w', encoding='utf-8') as f:
+            count = write_inventory(files, f, jobs=args['probe_jobs'])
+    logging.info(f"Inventoried {count} files")
@@ -3,21 +3,23 @@ import os
 import sys
 import shutil
 import glob
+import itertools
 
 # this line is for when main.py is run directly
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from subs2cia.argparser import get_args_subs2cia
-from subs2cia.sources import AVSFile, group_files
-from subs2cia.condense import Condense
-from subs2cia.CardExport import CardExport
 
 from pathlib import Path
 import logging
 from colorlog import ColoredFormatter
 from pprint import pprint
-from typing import Union, List
-import tqdm
+from typing import Union, List, TYPE_CHECKING
+
+# the processing pipeline (and its ffmpeg, pysubs2 and pycountry dependencies) is imported on first use so that
+# --help, -lp and other early exits stay fast
+if TYPE_CHECKING:
+    from subs2cia.sources import AVSFile
 
 presets = [
     {  # preset 0
@@ -49,6 +51,7 @@ class TqdmLoggingHandler(logging.Handler):
         super().__init__(level)
 
     def emit(self, record):
+        import tqdm
         try:
             msg = self.format(record)
             tqdm.tqdm.write(msg)
@@ -59,7 +62,9 @@ class TqdmLoggingHandler(logging.Handler):
             self.handleError(record)
 
 
-def condense_start(args, groups: List[List[AVSFile]]):
+def condense_start(args, groups: 'List[List[AVSFile]]'):
+    from subs2cia.condense import Condense
+
     condense_args = {key: args[key] for key in
                      ['outdir', 'outstem', 'condensed_video', 'padding', 'threshold', 'partition', 'split',
                       'demux_overwrite_existing', 'overwrite_existing_generated', 'keep_temporaries',
@@ -67,19 +72,29 @@ def condense_start(args, groups: List[List[AVSFile]]):
                       'subtitle_regex_filter',
                       'subtitle_regex_substrfilter', 'subtitle_regex_substrfilter_nokeep',
                       'audio_stream_index', 'subtitle_stream_index', 'ignore_range', 'ignore_chapters',
-                      'bitrate', 'mono_channel', 'interactive', 'no_condensed_subtitles', 'out_audiocodec']}
-
-    condensed_files = [Condense(g, **condense_args) for g in groups]
-    if logging.root.isEnabledFor(logging.INFO):
-        logging.info("Input/output file mapping:")
-        for cgroup in condensed_files:
-            logging.info(f"{cgroup.outstem}")
-            for cfile in cgroup.sources:
-                logging.info(f"    {cfile.filepath}")
+                      'bitrate', 'mono_channel', 'interactive', 'no_condensed_subtitles', 'out_audiocodec',
+                      'demux_audio', 'intermediate_format', 'demux_subtitles', 'subtitle_candidates']}
+
+    # groups may be streamed from a directory scan, in which case the total isn't known up front
+    total = len(groups) if isinstance(groups, list) else None
+    condensed_files = (Condense(g, **condense_args) for g in groups)
+    if total is not None:
+        condensed_files = list(condensed_files)
+        if logging.root.isEnabledFor(logging.INFO):
+            logging.info("Input/output file mapping:")
+            for cgroup in condensed_files:
+                logging.info(f"{cgroup.outstem}")
+                for cfile in cgroup.sources:
+                    logging.info(f"    {cfile.filepath}")
 
     # logging.root.addHandler(TqdmLoggingHandler())
 
     i = condensed_files
+    prefetcher = None
+    if args['prefetch'] > 0 and args['batch'] and not (args['dry_run'] or args['list_streams']):
+        from subs2cia.prefetch import Prefetcher
+        prefetcher = Prefetcher(max_bytes=args['prefetch'] * 2 ** 20)
+        i = prefetcher.prefetch_ahead(i, lambda c: [f.filepath for f in c.sources])
     # if logging.root.level == logging.INFO:
     #     # logging level of WARNING means quiet output
     #     # debug is too noisy for a progress bar to be _that_ useful
@@ -89,7 +104,12 @@ def condense_start(args, groups: List[List[AVSFile]]):
         # if logging.root.level == logging.INFO:
         #     i.set_postfix_str(f"{c.outstem}")
         #     i.update(0)
-        logging.info(f"({idx + 1}/{len(i)}): {c.outstem}")
+        if total is not None:
+            logging.info(f"({idx + 1}/{total}): {c.outstem}")
+        else:
+            logging.info(f"({idx + 1}): {c.outstem}")
+            for cfile in c.sources:
+                logging.info(f"    {cfile.filepath}")
         c.get_and_partition_streams()
         c.initialize_pickers()
         if args['dry_run']:
@@ -100,9 +120,13 @@ def condense_start(args, groups: List[List[AVSFile]]):
         c.choose_streams()
         c.export()
         c.cleanup()
+    if prefetcher is not None:
+        prefetcher.log_stats()
+
 
+def srs_export_start(args, groups: 'List[List[AVSFile]]'):
+    from subs2cia.CardExport import CardExport
 
-def srs_export_start(args, groups: List[List[AVSFile]]):
     srs_args = {key: args[key] for key in
                 ['outdir', 'outstem', 'condensed_video', 'padding', 'demux_overwrite_existing',
                  'overwrite_existing_generated', 'keep_temporaries', 'target_lang', 'out_audioext', 'use_all_subs',
@@ -116,11 +140,21 @@ def srs_export_start(args, groups: List[List[AVSFile]]):
                  'no_export_audio',
                  'export_video',
                  'export_header_row',
+                 'intermediate_format',
+                 'demux_subtitles',
 
                  ]
                 }
 
-    cardexport_group = [CardExport(g, **srs_args) for g in groups]
+    cardexport_group = (CardExport(g, **srs_args) for g in groups)
+    if isinstance(groups, list):
+        # created up front so that streams shared between groups are demuxed once, see demux_registry
+        cardexport_group = list(cardexport_group)
+    prefetcher = None
+    if args['prefetch'] > 0 and args['batch'] and not (args['dry_run'] or args['list_streams']):
+        from subs2cia.prefetch import Prefetcher
+        prefetcher = Prefetcher(max_bytes=args['prefetch'] * 2 ** 20)
+        cardexport_group = prefetcher.prefetch_ahead(cardexport_group, lambda c: [f.filepath for f in c.sources])
 
     for c in cardexport_group:
         c.get_and_partition_streams()
@@ -133,6 +167,8 @@ def srs_export_start(args, groups: List[List[AVSFile]]):
         c.choose_streams()
         c.export()
         c.cleanup()
+    if prefetcher is not None:
+        prefetcher.log_stats()
 
 
 def start():
@@ -180,6 +216,10 @@ def start():
     logging.info(f"subs2cia version {__version__}")
     logging.debug(f"Start arguments: {args}")
 
+    if args['profile_startup']:
+        from subs2cia.startup import profile_startup
+        profile_startup()
+
     if args['list_presets']:  # todo: user-defined presets
         list_presets()
         return
@@ -197,31 +237,53 @@ def start():
         logging.warning("No input files given, nothing to do.")
         exit(0)
 
+    from subs2cia.sources import AVSFile, group_files, probe_files, iter_directory_groups, \
+        default_include_patterns, default_exclude_patterns
+    from subs2cia import probe_cache, demux_cache, demux_registry, scratch
+
+    if not args['no_probe_cache']:
+        probe_cache.enable_probe_cache(max_entries=args['probe_cache_entries'])
+    probe_cache.set_header_reading(not args['no_header_probe'])
+    if args['cache_dir'] is not None:
+        demux_cache.enable_demux_cache(Path(args['cache_dir']), max_bytes=args['cache_size'] * 2 ** 20)
+    if args['scratch_dir'] is not None:
+        scratch.enable_scratch(Path(args['scratch_dir']), max_bytes=args['scratch_size'] * 2 ** 20)
+
     infiles = _resolve(args['infiles'])
+    include = args['include_patterns'] if args['include_patterns'] is not None else default_include_patterns
+    exclude = default_exclude_patterns + (args['exclude_patterns'] or [])
+
+    if args['command'] == 'inventory':
+        from subs2cia.inventory import inventory_start
+        inventory_start(args, [Path(file) for file in infiles], include=include, exclude=exclude)
+        probe_cache.log_probe_cache_stats()
+        return
 
     # convert to Path objects and see if any input files are actually directories
-    # for the moment, don't support processing entire directories.
-    # point users to globbing and asterisks if they want to process an entire directory
+    # directories are scanned lazily in batch mode, their groups are processed while the scan is still running
     infiles = [Path(file) for file in infiles]
-    for file in infiles:
-        if file.is_dir():
-            logging.error(f'Input file "{file}" is actually a directory, aborting.\n'
-                          f'If you want to process all files in this directory, use "{file}/*" instead.')
-            exit(2)
-
     if args['absolute_paths']:
-        sources = [AVSFile(Path(file).absolute()) for file in infiles]
-    else:
-        sources = [AVSFile(Path(file)) for file in infiles]
+        infiles = [file.absolute() for file in infiles]
+    directories = [file for file in infiles if file.is_dir()]
+    infiles = [file for file in infiles if not file.is_dir()]
+    if len(directories) > 0 and not args['batch']:
+        logging.error(f'Input file "{directories[0]}" is a directory, aborting.\n'
+                      f'Directories can only be processed in batch mode, add -b to process all files in it.')
+        exit(2)
+
+    sources = [AVSFile(file) for file in infiles]
 
-    for s in sources:
-        s.probe()
-        s.get_type()
+    probe_files(sources, jobs=args['probe_jobs'])
 
     if args['batch']:
         args['outstem'] = None
         logging.info(f"Running in batch mode, attempting to group similarly named files together.")
         groups = list(group_files(sources))
+        if len(directories) > 0:
+            dir_groups = (g for d in directories for g in
+                          iter_directory_groups(d, recursive=args['recursive'], include=include, exclude=exclude,
+                                                jobs=args['probe_jobs']))
+            groups = itertools.chain(groups, dir_groups)
     else:
         if len(sources) > 2:
             logging.warning(f"Redundant input files detected. Got {len(sources)} "
@@ -229,13 +291,18 @@ def start():
                             f"in batch mode. Only one output "
                             f"will be generated. ")
         groups = [list(sources)]
-    logging.debug(f"Have {len(groups)} group(s) to process.")
+    if isinstance(groups, list):
+        logging.debug(f"Have {len(groups)} group(s) to process.")
 
     commands = {
         'condense': condense_start,
         'srs': srs_export_start
     }
     commands[args['command']](args, groups)
+    probe_cache.log_probe_cache_stats()
+    demux_cache.log_demux_cache_stats()
+    scratch.log_scratch_stats()
+    demux_registry.log_demux_registry_stats()
 
 
 def _resolve(files):
@@ -1,5 +1,4 @@
-from subs2cia.sources import Stream
-import pycountry
+from subs2cia.sources import Stream, lookup_language
 import logging
 
 
@@ -21,7 +20,7 @@ def picker(streams: [Stream], target_lang: str = None, forced_stream: int = None
         yield streams[forced_stream]
 
     if target_lang is not None:
-        target_lang = pycountry.languages.lookup(target_lang)
+        target_lang = lookup_language(target_lang)
         target_lang = target_lang.alpha_3
 
     for s in streams:
@@ -0,0 +1,135 @@
+r"""
+Read-ahead of batch inputs: while one group is being processed, the source files of the next group are pulled into the
+OS page cache, so that inputs on network storage aren't read cold right when ffmpeg needs them.
+Files are hinted with posix_fadvise(WILLNEED) where available, and read sequentially by a background thread, which also
+works on filesystems that ignore the hint (e.g. most NFS and SMB mounts).
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, TypeVar, Union
+
+READ_SIZE = 2 ** 20
+# never prefetch more than this fraction of available memory, or prefetched pages get evicted again before they're used
+MEMORY_FRACTION = 0.25
+
+T = TypeVar('T')
+_end = object()
+
+
+def available_memory() -> Union[int, None]:
+    r"""
+    :return: Bytes of memory that can be used without swapping, including reclaimable page cache. None if unknown
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class Prefetcher:
+    def __init__(self, max_bytes: int):
+        r"""
+        Reads the files of upcoming groups ahead of time, one group at a time
+        :param max_bytes: Most bytes to read ahead for one group. Capped at MEMORY_FRACTION of available memory when
+            each prefetch starts
+        """
+        self.max_bytes = max_bytes
+        self.groups = 0
+        self.bytes_prefetched = 0
+        # time the background thread spent reading data before it was needed, which the group would otherwise have
+        # spent reading it cold. Reads that hit the cache anyway take next to no time, so they don't inflate it
+        self.time_saved = 0.0
+
+        self._thread = None
+        self._stop = None
+        self._bytes = 0
+        self._seconds = 0.0
+
+    def window(self) -> int:
+        available = available_memory()
+        if available is None:
+            return self.max_bytes
+        return max(0, min(self.max_bytes, int(available * MEMORY_FRACTION)))
+
+    def start(self, paths: List[Path]):
+        r"""
+        Starts prefetching paths in the background, in order, stopping any prefetch that is still running
+        """
+        self.finish()
+        window = self.window()
+        if window == 0 or len(paths) == 0:
+            return
+        self._stop = threading.Event()
+        self._bytes = 0
+        self._seconds = 0.0
+        self._thread = threading.Thread(target=self._read_ahead, args=(list(paths), window, self._stop),
+                                        name='subs2cia-prefetch', daemon=True)
+        self._thread.start()
+
+    def _read_ahead(self, paths: List[Path], window: int, stop: threading.Event):
+        buffer = memoryview(bytearray(READ_SIZE))
+        remaining = window
+        for path in paths:
+            if stop.is_set() or remaining <= 0:
+                return
+            try:
+                with open(str(path), 'rb', buffering=0) as f:
+                    if hasattr(os, 'posix_fadvise'):
+                        os.posix_fadvise(f.fileno(), 0, remaining, os.POSIX_FADV_WILLNEED)
+                    while remaining > 0 and not stop.is_set():
+                        start = time.perf_counter()
+                        n = f.readinto(buffer[:min(READ_SIZE, remaining)])
+                        self._seconds += time.perf_counter() - start
+                        if not n:
+                            break
+                        self._bytes += n
+                        remaining -= n
+            except OSError as e:
+                logging.debug(f"Couldn't prefetch {path}: {e}")
+
+    def finish(self):
+        r"""
+        Stops the running prefetch, called once its group is about to be processed. Whatever was read by then is
+        counted as prefetched.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.groups += 1
+        self.bytes_prefetched += self._bytes
+        self.time_saved += self._seconds
+        logging.debug(f"Prefetched {self._bytes / 2 ** 20:.1f} MiB in {self._seconds:.2f}s before it was needed")
+
+    def prefetch_ahead(self, items: Iterable[T], paths: Callable[[T], List[Path]]) -> Iterator[T]:
+        r"""
+        Yields items in order, prefetching the files of the next item while the current one is being processed
+        :param items: Groups to process, may be a lazily produced iterable
+        :param paths: Returns the files to prefetch for an item
+        """
+        items = iter(items)
+        current = next(items, _end)
+        while current is not _end:
+            upcoming = next(items, _end)
+            self.finish()
+            if upcoming is not _end:
+                self.start(paths(upcoming))
+            yield current
+            current = upcoming
+
+    def log_stats(self):
+        if self.groups == 0:
+            return
+        logging.info(f"Prefetched {self.bytes_prefetched / 2 ** 20:.1f} MiB for {self.groups} groups, saving about "
+                     f"{self.time_saved:.1f}s of reads")
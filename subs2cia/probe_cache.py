@@ -0,0 +1,165 @@
+r"""
+Persistent on-disk cache of ffprobe results, so that rerunning batch jobs doesn't re-probe files that haven't changed.
+Entries are keyed by absolute path and invalidated when the file's size or modification time changes.
+Matroska and MP4 files are read with the built-in header reader first, which doesn't need ffprobe or the cache.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Union
+
+import ffmpeg
+
+from subs2cia.container_headers import read_container_info
+
+DEFAULT_MAX_ENTRIES = 20000
+
+
+def default_cache_dir() -> Path:
+    r"""
+    Platform cache directory for subs2cia, e.g. ~/.cache/subs2cia
+    """
+    if os.name == 'nt' and 'LOCALAPPDATA' in os.environ:
+        base = Path(os.environ['LOCALAPPDATA'])
+    elif 'XDG_CACHE_HOME' in os.environ:
+        base = Path(os.environ['XDG_CACHE_HOME'])
+    else:
+        base = Path.home() / '.cache'
+    return base / 'subs2cia'
+
+
+class ProbeCache:
+    def __init__(self, dbpath: Path, max_entries: int = DEFAULT_MAX_ENTRIES):
+        r"""
+        SQLite-backed ffprobe cache with least-recently-used eviction
+        :param dbpath: Path to the SQLite database, created if it doesn't exist
+        :param max_entries: Once the cache holds more entries than this, the least recently used ones are evicted
+        """
+        self.dbpath = dbpath
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.dbpath.parent.mkdir(parents=True, exist_ok=True)
+        # inputs may be probed from worker threads, so share one connection behind a lock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.dbpath), isolation_level=None, check_same_thread=False,
+                                   timeout=30)  # other subs2cia processes may be writing concurrently
+        self._db.execute("CREATE TABLE IF NOT EXISTS probes ("
+                         "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, info TEXT, last_used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS probes_last_used ON probes (last_used)")
+
+    def get(self, filepath: Path) -> Union[dict, None]:
+        r"""
+        :return: Cached ffprobe output for filepath, or None if it isn't cached or the file has changed since
+        """
+        try:
+            key, st = self._key(filepath)
+        except OSError as e:
+            self.misses += 1
+            logging.debug(f"Probe cache miss for {filepath}, couldn't stat it: {e}")
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime_ns, info FROM probes WHERE path = ?", (key,)).fetchone()
+            if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+                self.misses += 1
+                logging.debug(f"Probe cache miss for {filepath} (hits={self.hits}, misses={self.misses})")
+                return None
+            self._db.execute("UPDATE probes SET last_used = ? WHERE path = ?", (time.time(), key))
+            self.hits += 1
+        logging.debug(f"Probe cache hit for {filepath} (hits={self.hits}, misses={self.misses})")
+        return json.loads(row[2])
+
+    def put(self, filepath: Path, info: dict):
+        try:
+            key, st = self._key(filepath)
+        except OSError as e:
+            logging.debug(f"Not caching probe results for {filepath}, couldn't stat it: {e}")
+            return
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO probes (path, size, mtime_ns, info, last_used) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             (key, st.st_size, st.st_mtime_ns, json.dumps(info), time.time()))
+            self._evict()
+
+    def _evict(self):
+        count = self._db.execute("SELECT COUNT(*) FROM probes").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        self._db.execute("DELETE FROM probes WHERE path IN "
+                         "(SELECT path FROM probes ORDER BY last_used ASC LIMIT ?)", (count - self.max_entries,))
+        logging.debug(f"Evicted {count - self.max_entries} entries from probe cache")
+
+    @staticmethod
+    def _key(filepath: Path):
+        return str(Path(filepath).absolute()), os.stat(str(filepath))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# process-wide cache, None if caching is disabled
+_cache = None
+# if set, try reading Matroska/MP4 headers directly before falling back to ffprobe
+_read_headers = True
+
+
+def enable_probe_cache(cache_dir: Union[Path, None] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+    global _cache
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    try:
+        _cache = ProbeCache(Path(cache_dir) / 'probe_cache.sqlite3', max_entries=max_entries)
+        logging.debug(f"Using probe cache at {_cache.dbpath}")
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Couldn't open probe cache in {cache_dir}, probing without a cache: {e}")
+        _cache = None
+
+
+def get_probe_cache() -> Union[ProbeCache, None]:
+    return _cache
+
+
+def set_header_reading(enabled: bool):
+    global _read_headers
+    _read_headers = enabled
+
+
+def probe(filepath: Path) -> dict:
+    r"""
+    Gets stream, chapter and format information for filepath in ffprobe's output format.
+    Matroska/MP4 headers are read directly if possible, otherwise runs ffprobe (including chapters),
+    going through the probe cache if it's enabled.
+    :raises ffmpeg.Error: if ffprobe fails. Failures are not cached.
+    """
+    if _read_headers:
+        info = read_container_info(filepath)
+        if info is not None:
+            logging.debug(f"Read container headers of {filepath} without ffprobe")
+            return info
+    if _cache is not None:
+        try:
+            info = _cache.get(filepath)
+        except sqlite3.Error as e:
+            logging.debug(f"Probe cache lookup failed for {filepath}: {e}")
+            info = None
+        if info is not None:
+            return info
+    info = ffmpeg.probe(str(filepath), 'ffprobe', **{'show_chapters': None})
+    if _cache is not None:
+        try:
+            _cache.put(filepath, info)
+        except sqlite3.Error as e:
+            logging.debug(f"Couldn't store probe results for {filepath} in probe cache: {e}")
+    return info
+
+
+def log_probe_cache_stats():
+    if _cache is None:
+        return
+    logging.debug(f"Probe cache: {_cache.hits} hits, {_cache.misses} misses")
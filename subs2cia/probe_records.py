@@ -0,0 +1,118 @@
+r"""
+Compact records of the ffprobe fields subs2cia uses.
+ffprobe output carries every stream's disposition, tags and codec parameters, and in large batch runs those dicts are
+kept alive for the whole run. These records keep only what subs2cia reads and drop the rest.
+"""
+import sys
+from typing import Tuple, Union
+
+
+def _denominator(time_base: Union[str, None]) -> Union[int, None]:
+    # "1/48000" -> 48000 ticks per second
+    if time_base is None:
+        return None
+    return int(time_base.split('/')[1])
+
+
+def _intern(s: Union[str, None]) -> Union[str, None]:
+    # codec names, types and language codes repeat across every file of a batch
+    return None if s is None else sys.intern(s)
+
+
+class ChapterInfo:
+    __slots__ = ('title', 'start_time', 'end_time')
+
+    def __init__(self, title: Union[str, None], start_time: float, end_time: float):
+        r"""
+        :param title: Chapter title, None if the chapter has no title tag
+        :param start_time: Start time in seconds
+        :param end_time: End time in seconds
+        """
+        self.title = title
+        self.start_time = start_time
+        self.end_time = end_time
+
+    @classmethod
+    def from_probe(cls, chapter: dict) -> 'ChapterInfo':
+        return cls(title=chapter.get('tags', {}).get('title'), start_time=float(chapter['start_time']),
+                   end_time=float(chapter['end_time']))
+
+    def __repr__(self):
+        return f"ChapterInfo(title={self.title!r}, start_time={self.start_time}, end_time={self.end_time})"
+
+
+class StreamInfo:
+    __slots__ = ('codec_type', 'codec_name', 'language', 'title', 'width', 'height',
+                 'time_base', 'codec_time_base', 'duration_ts', 'duration', 'sample_rate')
+
+    def __init__(self, codec_type: str, codec_name: Union[str, None] = None, language: Union[str, None] = None,
+                 title: Union[str, None] = None, width: Union[int, None] = None, height: Union[int, None] = None,
+                 time_base: Union[int, None] = None, codec_time_base: Union[int, None] = None,
+                 duration_ts: Union[int, None] = None, duration: Union[float, None] = None,
+                 sample_rate: Union[int, None] = None):
+        r"""
+        One stream of a probed file. Fields ffprobe didn't report are None.
+        :param time_base: Ticks per second of the stream's time base, e.g. 1000 for 1/1000
+        :param codec_time_base: Ticks per second of the codec time base, only reported by older ffprobe versions
+        :param duration: Stream duration in seconds
+        """
+        self.codec_type = codec_type
+        self.codec_name = codec_name
+        self.language = language
+        self.title = title
+        self.width = width
+        self.height = height
+        self.time_base = time_base
+        self.codec_time_base = codec_time_base
+        self.duration_ts = duration_ts
+        self.duration = duration
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_probe(cls, stream: dict) -> 'StreamInfo':
+        tags = stream.get('tags', {})
+        return cls(codec_type=_intern(stream['codec_type']),
+                   codec_name=_intern(stream.get('codec_name')),
+                   language=_intern(tags.get('language')),
+                   title=tags.get('title'),
+                   width=stream.get('width'),
+                   height=stream.get('height'),
+                   time_base=_denominator(stream.get('time_base')),
+                   codec_time_base=_denominator(stream.get('codec_time_base')),
+                   duration_ts=stream.get('duration_ts'),
+                   duration=float(stream['duration']) if 'duration' in stream else None,
+                   sample_rate=int(stream['sample_rate']) if 'sample_rate' in stream else None)
+
+    def __repr__(self):
+        return f"StreamInfo({', '.join(f'{k}={getattr(self, k)!r}' for k in self.__slots__ if getattr(self, k) is not None)})"
+
+
+class ProbeInfo:
+    __slots__ = ('streams', 'chapters', 'duration')
+
+    def __init__(self, streams: Union[Tuple[StreamInfo, ...], None], chapters: Tuple[ChapterInfo, ...],
+                 duration: Union[float, None]):
+        r"""
+        Probe results of one input file
+        :param streams: Streams in file order, None if the probe output had no stream list
+        :param chapters: Chapters in file order
+        :param duration: Container duration in seconds, None if unknown
+        """
+        self.streams = streams
+        self.chapters = chapters
+        self.duration = duration
+
+    @classmethod
+    def from_probe(cls, info: dict) -> 'ProbeInfo':
+        r"""
+        :param info: ffprobe output, as returned by ffmpeg.probe() or probe_cache.probe()
+        """
+        streams = None
+        if 'streams' in info:
+            streams = tuple(StreamInfo.from_probe(s) for s in info['streams'])
+        chapters = tuple(ChapterInfo.from_probe(c) for c in info.get('chapters') or [])
+        duration = info.get('format', {}).get('duration')
+        return cls(streams=streams, chapters=chapters, duration=float(duration) if duration is not None else None)
+
+    def __repr__(self):
+        return f"ProbeInfo(streams={self.streams!r}, chapters={self.chapters!r}, duration={self.duration})"
@@ -0,0 +1,245 @@
+r"""
+Scratch space for temporaries: demuxed streams and ffmpeg filter scripts are placed in a fast directory (e.g. /dev/shm)
+instead of next to the inputs, as long as they fit in a size budget. Anything that doesn't fit spills to where it would
+have been written otherwise.
+The scratch directory is private to the process and removed on exit, including on SIGTERM and uncaught exceptions.
+Directories left behind by processes that were killed outright are removed the next time the same root is used. Scratch
+directories are named after the host and pid that created them and hold a lock file for as long as they're in use, so
+that a root shared between hosts or containers never loses directories that are still being used.
+"""
+import atexit
+import contextlib
+import itertools
+import logging
+import os
+import re
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+from pathlib import Path
+from typing import Iterator, Union
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, where stale directories aren't removed anyway
+    fcntl = None
+
+DEFAULT_MAX_BYTES = 2 ** 30
+DIR_PREFIX = 'subs2cia-'
+LOCK_NAME = '.lock'
+
+
+def _host_tag() -> str:
+    # no dashes, which separate the host from the pid in directory names
+    return re.sub(r'[^A-Za-z0-9.]', '_', socket.gethostname()) or 'localhost'
+
+
+def _try_lock(directory: Path) -> Union[int, None]:
+    r"""
+    Takes the exclusive lock of a scratch directory without waiting
+    :return: File descriptor holding the lock, None if fcntl isn't available
+    :raises OSError: If another process holds the lock
+    """
+    if fcntl is None:
+        return None
+    fd = os.open(str(directory / LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale(root: Path):
+    r"""
+    Removes scratch directories in root that were created on this host by a process that no longer exists, and whose
+    lock nobody holds. Directories of other hosts are left alone, since their pids mean nothing here. Only on POSIX
+    systems, where a process can be checked for without signalling it.
+    """
+    if os.name != 'posix':
+        return
+    try:
+        entries = list(os.scandir(str(root)))
+    except OSError:
+        return
+    prefix = f"{DIR_PREFIX}{_host_tag()}-"
+    for entry in entries:
+        if not entry.name.startswith(prefix) or not entry.is_dir(follow_symlinks=False):
+            continue
+        pid = entry.name[len(prefix):].split('-')[0]
+        if not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid)):
+            continue
+        try:
+            fd = _try_lock(Path(entry.path))
+        except OSError:
+            # still in use, e.g. by a container sharing the hostname but not the pid namespace
+            continue
+        logging.debug(f"Removing stale scratch directory {entry.path}")
+        shutil.rmtree(entry.path, ignore_errors=True)
+        if fd is not None:
+            os.close(fd)
+
+
+class ScratchSpace:
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        r"""
+        Private directory under root holding at most max_bytes of temporaries
+        :param root: Fast location to create the scratch directory in, e.g. /dev/shm
+        :param max_bytes: Files that would push the scratch directory past this size spill to their usual location
+        """
+        self.max_bytes = max_bytes
+        self.peak_bytes = 0
+        self.placed = 0
+        self.spilled = 0
+
+        remove_stale(root)
+        self.directory = Path(tempfile.mkdtemp(prefix=f'{DIR_PREFIX}{_host_tag()}-{os.getpid()}-', dir=str(root)))
+        self._lock_fd = _try_lock(self.directory)  # held until cleanup
+        self._lock = threading.Lock()
+        self._sizes = {}  # bytes used by each file in the scratch directory, estimated until it's written
+        self._counter = itertools.count()
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def allocate(self, name: str, size: int, spill_path: Path) -> Path:
+        r"""
+        Picks where a temporary should be written
+        :param name: File name, only used to make scratch files recognizable
+        :param size: Estimated size of the file in bytes
+        :param spill_path: Where to write the file if it doesn't fit in the scratch directory
+        :return: Path in the scratch directory, or spill_path
+        """
+        with self._lock:
+            if self.used_bytes + size > self.max_bytes:
+                self.spilled += 1
+                logging.debug(f"Scratch space full, writing {spill_path} in place")
+                return spill_path
+            path = self.directory / f"{next(self._counter)}-{name}"
+            self._sizes[path] = size
+            self.placed += 1
+            self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+        return path
+
+    def settle(self, path: Path, spill_path: Path) -> Path:
+        r"""
+        Records the actual size of a file written to an allocated path. If the estimate was too low and the scratch
+        directory is now over budget, the file is moved to spill_path.
+        :return: Where the file is now
+        """
+        with self._lock:
+            if path not in self._sizes:
+                return path
+            try:
+                self._sizes[path] = path.stat().st_size
+            except OSError:
+                del self._sizes[path]
+                return path
+            self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+            if self.used_bytes <= self.max_bytes:
+                return path
+            del self._sizes[path]
+            self.spilled += 1
+        logging.debug(f"Scratch space over budget, moving {path} to {spill_path}")
+        shutil.move(str(path), str(spill_path))
+        return spill_path
+
+    def release(self, path: Path):
+        r"""
+        Deletes a temporary, in or outside the scratch directory
+        """
+        with self._lock:
+            self._sizes.pop(path, None)
+        with contextlib.suppress(FileNotFoundError):
+            path.unlink()
+
+    def cleanup(self):
+        with self._lock:
+            self._sizes.clear()
+        shutil.rmtree(str(self.directory), ignore_errors=True)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+# process-wide scratch space, None if temporaries are written next to their inputs
+_scratch = None
+
+
+def _exit_on_sigterm(signum, frame):
+    # turns SIGTERM into SystemExit so that atexit handlers, and with them scratch cleanup, still run
+    raise SystemExit(128 + signum)
+
+
+def enable_scratch(root: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+    global _scratch
+    try:
+        _scratch = ScratchSpace(Path(root), max_bytes=max_bytes)
+        logging.debug(f"Using scratch directory {_scratch.directory}")
+    except OSError as e:
+        logging.warning(f"Couldn't create scratch directory in {root}, writing temporaries in place: {e}")
+        _scratch = None
+        return
+    atexit.register(_scratch.cleanup)
+    if threading.current_thread() is threading.main_thread() and \
+            signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+
+def get_scratch() -> Union[ScratchSpace, None]:
+    return _scratch
+
+
+def discard(path: Path):
+    r"""
+    Deletes a temporary file, wherever it was placed
+    """
+    if _scratch is not None:
+        _scratch.release(path)
+    else:
+        path.unlink()
+
+
+@contextlib.contextmanager
+def temporary_file(suffix: str = '', size: int = 0) -> Iterator[Path]:
+    r"""
+    Path for a short-lived temporary file, deleted when the context exits. Placed in the scratch space if it fits,
+    otherwise in the system's temporary directory.
+    :param size: Estimated size of the file in bytes
+    """
+    fd, spill_path = tempfile.mkstemp(prefix=DIR_PREFIX, suffix=suffix)
+    os.close(fd)
+    spill_path = Path(spill_path)
+    path = spill_path
+    if _scratch is not None:
+        path = _scratch.allocate(f"tmp{suffix}", size, spill_path=spill_path)
+    try:
+        yield path
+    finally:
+        for p in {path, spill_path}:
+            if _scratch is not None:
+                _scratch.release(p)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    p.unlink()
+
+
+def log_scratch_stats():
+    if _scratch is None:
+        return
+    logging.debug(f"Scratch space: {_scratch.placed} files placed, {_scratch.spilled} spilled, peak usage "
+                  f"{_scratch.peak_bytes / 2 ** 20:.1f} MiB of {_scratch.max_bytes / 2 ** 20:.0f} MiB")
@@ -1,15 +1,78 @@
 # each output has a set of possible input files
 # all source_files does is take all of the input files and partitons them into three lists:
 
-from subs2cia.ffmpeg_tools import ffmpeg_demux
+from subs2cia.ffmpeg_tools import ffmpeg_demux_many, ffmpeg_read_subtitles, map_concurrently, MediaInfo, get_media_info, \
+    Error
+from subs2cia import probe_cache, demux_cache, demux_registry, scratch
+from subs2cia.probe_records import ProbeInfo, StreamInfo
 
 from pathlib import Path
 import logging
 import ffmpeg
-import pycountry
-from typing import List, Union
-from collections import defaultdict
-
+import os
+from fnmatch import fnmatch
+from typing import List, Union, Iterator, NamedTuple
+from collections import defaultdict, deque
+
+
+class Language(NamedTuple):
+    alpha_3: str
+    name: str
+
+
+# lowercased ISO 639 codes and names -> Language, built on first use and shared by the whole process
+_language_index = None
+# when the same string is a code or name of several languages, earlier fields take precedence
+_language_index_fields = ['alpha_3', 'alpha_2', 'bibliographic', 'name', 'common_name', 'inverted_name']
+
+
+def _load_iso639_entries() -> List[dict]:
+    # read pycountry's ISO 639-3 database directly, importing pycountry and building its objects takes several times
+    # longer than building the index itself
+    import importlib.util
+    import json
+    spec = importlib.util.find_spec('pycountry')
+    if spec is None:
+        raise ImportError("pycountry is required for language lookups")
+    for location in spec.submodule_search_locations or []:
+        dbpath = Path(location) / 'databases' / 'iso639-3.json'
+        if dbpath.is_file():
+            with open(str(dbpath), encoding='utf-8') as f:
+                return json.load(f)['639-3']
+    import pycountry
+    return [{field: getattr(lang, field) for field in _language_index_fields if hasattr(lang, field)}
+            for lang in pycountry.languages]
+
+
+def _get_language_index() -> dict:
+    global _language_index
+    if _language_index is None:
+        index = {}
+        for entry in _load_iso639_entries():
+            lang = Language(alpha_3=entry['alpha_3'], name=entry['name'])
+            for field in _language_index_fields:
+                key = entry.get(field)
+                if key is not None:
+                    index.setdefault(field, {})[key.lower()] = lang
+        _language_index = {}
+        for field in reversed(_language_index_fields):
+            _language_index.update(index.get(field, {}))
+        logging.debug(f"Built language index with {len(_language_index)} entries")
+    return _language_index
+
+
+def lookup_language(code: str) -> Language:
+    r"""
+    Looks up an ISO 639 language by alpha-2, alpha-3 or bibliographic code, or by name. Case insensitive.
+    The lookup index is built from pycountry on first use, later lookups are a single dictionary lookup.
+    :param code: Language code or name
+    :return: Language with the canonical alpha-3 code and name
+    :raises LookupError: if code isn't a recognized language
+    """
+    try:
+        return _get_language_index()[code.lower()]
+    except (KeyError, AttributeError):
+        raise LookupError(f"Could not find a language for {code!r}")
 
 
 class AVSFile:
@@ -18,8 +81,9 @@ class AVSFile:
             raise AssertionError(f"File {filepath} does not exist")
         # don't handle directories here
         self.filepath = filepath
-        self.info = None
+        self.info = None  # ProbeInfo
         self.type = None
+        self.media_info = None
 
     # returns string-encoded type (subtitle, audio, video)
     # determining type may just be as simple as reading the extension
@@ -27,29 +91,38 @@ class AVSFile:
     def probe(self):
         logging.debug(f"Probing {self.filepath}")
         try:
-            self.info = ffmpeg.probe(str(self.filepath), 'ffprobe', **{'show_chapters': None})
+            self.info = ProbeInfo.from_probe(probe_cache.probe(self.filepath))
         except ffmpeg.Error as e:
             logging.warning(
                 f"Couldn't probe file, skipping {str(self.filepath)}. ffmpeg output: \n" + e.stderr.decode("utf-8"))
 
         logging.debug(f"ffprobe results: {self.info}")
 
+    def get_media_info(self) -> MediaInfo:
+        r"""
+        Duration, sample rate, time base and chapters of the first stream, derived from the existing probe results.
+        Computed once and cached.
+        """
+        if self.media_info is None:
+            self.media_info = get_media_info(self.info)
+        return self.media_info
+
     def get_type(self):
         if self.info is None:  # ffprobe probably failed for some reason
             self.type = 'unknown'
             return
-        if 'streams' not in self.info:
+        if self.info.streams is None:
             logging.warning(f"Unexpected ffmpeg.probe output, ignoring file {str(self.filepath)}")
             logging.debug(self.info)
             self.type = None
             return
-        if len(self.info['streams']) > 1:
+        if len(self.info.streams) > 1:
             self.type = 'video'  # video files are treated as multi-stream objects
             return
-        stream = self.info['streams'][0]
-        if stream['codec_type'] == 'video':
+        stream = self.info.streams[0]
+        if stream.codec_type == 'video':
             logging.warning(f"File {str(self.filepath)} contains no audio or subtitle tracks!")
-        self.type = stream['codec_type']
+        self.type = stream.codec_type
 
     def __str__(self):
         return f"{str(self.filepath)} ({self.type})"
@@ -58,16 +131,43 @@ class AVSFile:
         return f"AVSFile(filepath={self.filepath.__repr__()})"
 
 
+def probe_files(sources: List[AVSFile], jobs: int = 1):
+    r"""
+    Probes and determines the type of each source file, running up to jobs ffprobe processes at once.
+    Files that can't be probed are reported and marked the same way as AVSFile.probe() does.
+    :param sources: AVSFiles to probe, updated in place
+    :param jobs: Maximum number of concurrent ffprobe processes
+    """
+    def probe(s: AVSFile):
+        s.probe()
+        s.get_type()
+
+    map_concurrently(probe, sources, jobs)
+
+
+# intermediate formats audio can be demuxed to: extension and ffmpeg output options
+audio_intermediate_formats = {
+    'flac': ('flac', {}),  # lossless, but a full decode and re-encode
+    'copy': ('mka', {'acodec': 'copy'}),  # no decode at all, decoded later by every step that reads it
+    'wav': ('wav', {'acodec': 'pcm_s16le', 'rf64': 'auto'}),  # cheapest to read back, largest on disk
+    'speech': ('speech.wav', {'acodec': 'pcm_s16le', 'ac': 1, 'ar': 24000}),  # mono downmix, enough for dialogue
+}
+
+
 # single ffmpeg stream
 class Stream:
     index = None
 
-    def __init__(self, file: AVSFile, type, stream_info, index=None, ):
+    def __init__(self, file: AVSFile, type, stream_info: StreamInfo, index=None, ):
         self.file = file
         self.index = index
         self.type = type
         # index of None indicates that demuxing with ffmpeg is not nessecary to extract data
         self.demux_file = None
+        self.demux_cached = False  # demux_file belongs to the demux cache, don't delete it
+        self.demux_key = None  # demux registry entry of demux_file, released on cleanup
+        self.demux_text = None  # subtitle stream extracted into memory instead of to demux_file
+        self.media_info = None
         self.lang = 'unknownlang'
         self.stream_info = stream_info
 
@@ -80,9 +180,9 @@ class Stream:
 
     def __str__(self):
         if self.is_standalone():
-            return f"standalone {self.stream_info['codec_name']} {self.type} at {str(self.file)}"
+            return f"standalone {self.stream_info.codec_name} {self.type} at {str(self.file)}"
         else:
-            return f"stream {self.index} ({self.type}, {f'{self.lang.name}, ' if self.lang != 'unknownlang' else ''}{self.stream_info['codec_name']}) in {self.file}"
+            return f"stream {self.index} ({self.type}, {f'{self.lang.name}, ' if self.lang != 'unknownlang' else ''}{self.stream_info.codec_name}) in {self.file}"
 
     def __repr__(self):
         return f"Stream(file={self.file.__repr__()}, type={self.type}, index={self.index})"
@@ -101,7 +201,7 @@ class Stream:
             if self.lang == 'unknownlang':
                 return self.lang
             try:
-                lang = pycountry.languages.lookup(self.lang)
+                lang = lookup_language(self.lang)
             except:
                 logging.warning(f"{self.lang} is not a language, treating {self.file.filepath} as unknown language")
                 self.lang = 'unknownlang'
@@ -109,69 +209,215 @@ class Stream:
             self.lang = lang
             return self.lang.alpha_3
         # look at metadata for language codes
-        if 'tags' not in self.file.info['streams'][self.index]:
-            return self.lang
-        if 'language' not in self.file.info['streams'][self.index]['tags']:
+        if self.stream_info.language is None:
             return self.lang
         try:
-            self.lang = pycountry.languages.lookup(self.file.info['streams'][self.index]['tags']['language'])
+            self.lang = lookup_language(self.stream_info.language)
         except LookupError as e:
-            logging.warning(f"{self} language {self.file.info['streams'][self.index]['tags']['language']} is not a "
+            logging.warning(f"{self} language {self.stream_info.language} is not a "
                             f"proper language code, setting to unknown language.")
             self.lang = 'unknownlang'
             return self.lang
         return self.lang.alpha_3
 
-    def demux(self, overwrite_existing: bool):
-        if self.demux_file is not None:
-            return self.demux_file
-        demux_path = self.file.filepath
-        if not self.is_standalone():
-            if self.type == 'subtitle':
-                subtitle_mapping = {
-                    'subrip': 'srt',
-                    'ass': 'ass'
-                }
-                # todo: bitmap subtitles
-                if self.stream_info is not None and 'codec_name' in self.stream_info:
-                    if self.stream_info['codec_name'] not in subtitle_mapping:
-                        extension = 'ass'
-                        logging.warning(f"Unknown subtitle type {self.stream_info['codec_name']} found, "
-                                     f"will attempt to convert to .ass")
-                    else:
-                        extension = subtitle_mapping[self.stream_info['codec_name']]
-
-            if self.type == 'audio':
-                # we could change what type to demux as similarly to subtitles,
-                # but it may cause compatability issues down the road so let's
-                # keep it as flac for now
-                extension = 'flac'
-            demux_path = self.file.filepath.parent / Path(
-                f'{self.file.filepath.name}.stream{self.index}.{self.type}.{self.get_language()}.{extension}')
-
-            if overwrite_existing or not demux_path.exists() or demux_path.stat().st_size == 0:
-                demux_path = ffmpeg_demux(self.file.filepath, self.index, demux_path)
-                if demux_path is None:
-                    logging.error(
-                        f"Couldn't demux stream {self.index} from {str(self.file.filepath)} (type={self.type})")
-                    return None
-        self.demux_file = AVSFile(demux_path)
-        self.demux_file.probe()
-        self.demux_file.get_type()
+    def get_demux_extension(self, audio_format: str = 'flac') -> str:
+        r"""
+        Extension (without the leading dot) of the file the stream is demuxed to
+        :param audio_format: Intermediate format of audio streams, see audio_intermediate_formats
+        """
+        if self.type == 'subtitle':
+            subtitle_mapping = {
+                'subrip': 'srt',
+                'ass': 'ass'
+            }
+            extension = 'ass'
+            # todo: bitmap subtitles
+            if self.stream_info is not None and self.stream_info.codec_name is not None:
+                if self.stream_info.codec_name not in subtitle_mapping:
+                    logging.warning(f"Unknown subtitle type {self.stream_info.codec_name} found, "
+                                 f"will attempt to convert to .ass")
+                else:
+                    extension = subtitle_mapping[self.stream_info.codec_name]
+
+        if self.type == 'audio':
+            extension = audio_intermediate_formats[audio_format][0]
+        return extension
+
+    def get_demux_path(self, audio_format: str = 'flac') -> Path:
+        r"""
+        Path the stream is demuxed to, next to its source file
+        """
+        return self.file.filepath.parent / Path(f'{self.file.filepath.name}.stream{self.index}.{self.type}.'
+                                                f'{self.get_language()}.{self.get_demux_extension(audio_format)}')
+
+    def estimate_demux_size(self) -> int:
+        r"""
+        Rough size of the demuxed stream in bytes, as 16-bit stereo PCM for audio. Only used to decide whether it fits
+        in the scratch space, settling the written file corrects it.
+        """
+        if self.type != 'audio':
+            return 2 ** 20
+        try:
+            media_info = self.get_media_info()
+        except Error:
+            return self.file.filepath.stat().st_size
+        return int(media_info.duration / 1000 * (media_info.sample_rate or 48000) * 2 * 2)
+
+    def demux(self, overwrite_existing: bool, audio_format: str = 'flac', temporary: bool = True):
+        if self.demux_file is None:
+            demux_streams([self], overwrite_existing=overwrite_existing, audio_format=audio_format,
+                          temporary=temporary)
         return self.demux_file
 
+    def read_subtitles(self) -> Union[str, None]:
+        r"""
+        Extracts an embedded subtitle stream into memory, without writing, probing or cleaning up a demuxed file
+        :return: Subtitle text in get_demux_extension() format, None if it couldn't be extracted
+        """
+        if self.demux_text is None:
+            read_subtitle_streams([self])
+        return self.demux_text
+
     def cleanup_demux(self):
-        if self.demux_file is not None and self.index is not None:
-            logging.info(f"Deleting temporary file {str(self.demux_file.filepath)}")
-            self.demux_file.filepath.unlink()
+        # demuxed files may be shared with streams of other groups, the registry deletes them once they're unused
+        if self.demux_key is not None:
+            demux_registry.get_demux_registry().release(self.demux_key)
+            self.demux_key = None
+
+    def get_media_info(self) -> MediaInfo:
+        r"""
+        Duration, sample rate, time base and chapters of the stream's data: the demuxed file if the stream has been
+        demuxed, otherwise taken from the source file's probe results.
+        """
+        if self.demux_file is not None:
+            return self.demux_file.get_media_info()
+        if self.is_standalone():
+            return self.file.get_media_info()
+        if self.media_info is None:
+            self.media_info = get_media_info(self.file.info, stream_idx=self.index)
+        return self.media_info
 
     # return a readable path to the data
     def get_data_path(self) -> Path:
-        if self.is_standalone() or self.type == 'video':
+        if self.is_standalone() or self.type == 'video' or self.demux_file is None:
             return self.file.filepath
         else:
             return self.demux_file.filepath
 
+    # index of the stream within get_data_path(), None if the file only holds this stream
+    def get_data_stream_index(self) -> Union[int, None]:
+        if self.is_standalone() or self.demux_file is not None:
+            return None
+        return self.index
+
+
+def demux_streams(streams: List[Stream], overwrite_existing: bool, audio_format: str = 'flac', temporary: bool = True):
+    r"""
+    Demuxes streams, reading each source file once: all requested streams of a file are extracted in a single ffmpeg
+    invocation. Fills in each Stream's demux_file, which stays None for streams that couldn't be demuxed.
+    Standalone streams and streams that are already demuxed are used as-is.
+    Streams already demuxed by another group in this run are shared through the demux registry.
+    If the demux cache is enabled, streams are demuxed into and reused from the cache instead of next to their source.
+    Otherwise, temporary streams are demuxed into the scratch space if one is enabled and they fit.
+    :param streams: Streams that may be needed, from any number of source files
+    :param overwrite_existing: If not set, previously demuxed files on disk are reused
+    :param audio_format: Intermediate format of audio streams, see audio_intermediate_formats
+    :param temporary: If set, the demuxed files are deleted after use and may be placed in the scratch space
+    """
+    by_source = {}
+    for stream in streams:
+        if stream.demux_file is not None:
+            continue
+        if stream.is_standalone():
+            stream.demux_file = AVSFile(stream.file.filepath)
+            stream.demux_file.probe()
+            stream.demux_file.get_type()
+            continue
+        by_source.setdefault(stream.file.filepath, []).append(stream)
+
+    cache = demux_cache.get_demux_cache()
+    registry = demux_registry.get_demux_registry()
+    scratch_space = scratch.get_scratch() if temporary else None
+    for filepath, planned in by_source.items():
+        planned = list({s.index: s for s in planned}.values())  # same stream may be requested twice
+        unregistered = []
+        for stream in planned:
+            stream.demux_key = registry.key(filepath, stream.index, stream.get_demux_extension(audio_format))
+            entry = registry.acquire(stream.demux_key)
+            if entry is None:
+                unregistered.append(stream)
+                continue
+            stream.demux_file = entry.demux_file
+            stream.demux_cached = entry.cached
+        planned = unregistered
+        paths = [s.get_demux_path(audio_format) for s in planned]
+        extensions = [s.get_demux_extension(audio_format) for s in planned]
+        options = [audio_intermediate_formats[audio_format][1] if s.type == 'audio' else {} for s in planned]
+        keys = [None] * len(planned)
+        spill_paths = [None] * len(planned)  # usual location of streams placed in the scratch space
+        needed = []
+        for i, (stream, path) in enumerate(zip(planned, paths)):
+            if cache is not None:
+                try:
+                    keys[i] = cache.key(filepath, stream.index, extensions[i])
+                except OSError as e:
+                    logging.warning(f"Couldn't read {filepath} to look up demuxed streams, not caching: {e}")
+                    keys[i] = None
+            if keys[i] is not None:
+                cached = None if overwrite_existing else cache.get(keys[i])
+                if cached is not None:
+                    paths[i] = cached
+                    continue
+                paths[i] = cache.path_for(keys[i], extensions[i])
+                paths[i].parent.mkdir(exist_ok=True)
+                needed.append((stream.index, paths[i], options[i]))
+            elif overwrite_existing or not path.exists() or path.stat().st_size == 0:
+                if scratch_space is not None:
+                    paths[i] = scratch_space.allocate(path.name, stream.estimate_demux_size(), spill_path=path)
+                    spill_paths[i] = path
+                needed.append((stream.index, paths[i], options[i]))
+        results = dict(zip([idx for idx, _, _ in needed], ffmpeg_demux_many(filepath, needed)))
+        for stream, path, key, spill_path in zip(planned, paths, keys, spill_paths):
+            if stream.index in results and results[stream.index] is None:
+                logging.error(
+                    f"Couldn't demux stream {stream.index} from {str(filepath)} (type={stream.type})")
+                if spill_path is not None:
+                    scratch_space.release(path)
+                stream.demux_key = None
+                continue
+            if spill_path is not None:
+                path = scratch_space.settle(path, spill_path)
+            if key is not None:
+                if stream.index in results:
+                    cache.put(key, path)
+                stream.demux_cached = True
+            demux_file = AVSFile(path)
+            demux_file.probe()
+            demux_file.get_type()
+            entry = registry.add(stream.demux_key, demux_file, cached=stream.demux_cached)
+            stream.demux_file = entry.demux_file
+
+
+def read_subtitle_streams(streams: List[Stream]):
+    r"""
+    Extracts embedded subtitle streams into memory, reading each source file once. Fills in each Stream's demux_text,
+    which stays None for streams that couldn't be extracted. Standalone streams are skipped, they're read directly.
+    :param streams: Subtitle streams, from any number of source files
+    """
+    by_source = {}
+    for stream in streams:
+        if stream.demux_text is not None or stream.is_standalone():
+            continue
+        by_source.setdefault(stream.file.filepath, {})[stream.index] = stream  # same stream may be requested twice
+
+    for filepath, planned in by_source.items():
+        planned = list(planned.values())
+        texts = ffmpeg_read_subtitles(filepath, [(s.index, s.get_demux_extension()) for s in planned])
+        for stream, text in zip(planned, texts):
+            if text is None:
+                logging.error(f"Couldn't read subtitle stream {stream.index} from {str(filepath)}")
+            stream.demux_text = text
+
 
 def common_count(t0, t1):
     # returns the length of the longest common prefix
@@ -183,11 +429,7 @@ def common_count(t0, t1):
 
 
 def is_language(s):
-    try:
-        pycountry.languages.lookup(s)
-        return True
-    except:
-        return False
+    return isinstance(s, str) and s.lower() in _get_language_index()
 
 
 # Strip extensions and language info from local assets, Plex style.
@@ -208,19 +450,26 @@ def strip_extensions(p: Path) -> Path:
     return p
 
 
+def group_key(p: Path) -> str:
+    r"""
+    Name files are grouped by in batch mode, e.g. "video0" for "video0.mkv", "video0.ja.srt" and "video0.forced.srt"
+    """
+    return strip_extensions(p).name
+
+
 def group_names_better(sources: List[AVSFile]) -> List[List[AVSFile]]:
-    all_groups = []
-    while(len(sources) > 0):
-        group = [sources.pop(0)]
-        to_remove = []
-        for f in sources:
-            if strip_extensions(f.filepath).name == strip_extensions(group[0].filepath).name:
-                group.append(f)
-                to_remove.append(f)
-        for f in to_remove:
-            sources.remove(f)
-        all_groups.append(group)
-    return all_groups
+    r"""
+    Groups files by group_key() in a single pass.
+    Groups are ordered by their first file, files within a group keep their input order.
+    """
+    all_groups = {}
+    for f in sources:
+        key = group_key(f.filepath)
+        if key in all_groups:
+            all_groups[key].append(f)
+        else:
+            all_groups[key] = [f]
+    return list(all_groups.values())
 
 
 def group_files(sources: [AVSFile]):
@@ -234,8 +483,8 @@ def get_and_partition_streams(sources: List[AVSFile]):
     for sourcefile in sources:
         if sourcefile.type == 'video':
             # dig into streams
-            for idx, stream_info in enumerate(sourcefile.info['streams']):
-                stype = stream_info['codec_type']
+            for idx, stream_info in enumerate(sourcefile.info.streams):
+                stype = stream_info.codec_type
                 partitioned_streams[stype].append(Stream(file=sourcefile, type=stype,
                                                               index=idx, stream_info=stream_info))
             continue
@@ -244,10 +493,96 @@ def get_and_partition_streams(sources: List[AVSFile]):
             logging.info(f'Skipping input file "{sourcefile.filepath}": ffmpeg couldn\'t probe')
             continue
         partitioned_streams[sourcefile.type].append(Stream(file=sourcefile, type=sourcefile.type,
-                                                                stream_info=sourcefile.info['streams'][0],
+                                                                stream_info=sourcefile.info.streams[0],
                                                                 index=None))
         # for stream in sourcefile
     for k in partitioned_streams:
         # logging.debug(f"Found {len(partitioned_streams[k])} {k} input streams")
         logging.debug(f"{k} streams found: {partitioned_streams[k]}")
     return partitioned_streams
+
+
+# used when scanning directories and no --include patterns are given
+default_include_patterns = ['*.mkv', '*.mp4', '*.m4v', '*.webm', '*.avi', '*.mov', '*.ts', '*.m2ts',
+                            '*.mka', '*.flac', '*.mp3', '*.m4a', '*.aac', '*.opus', '*.ogg', '*.wav',
+                            '*.srt', '*.ass', '*.ssa', '*.vtt']
+# subs2cia's own outputs and demuxed temporaries
+default_exclude_patterns = ['*.condensed.*', '*.stream[0-9]*.*']
+
+
+def scan_directory(root: Path, recursive: bool, include: List[str], exclude: List[str]) -> Iterator[List[Path]]:
+    r"""
+    Walks a directory tree with os.scandir, yielding the matching files of one directory at a time, sorted by name.
+    Only one directory listing is held in memory at a time, so the size of the tree doesn't matter.
+    :param root: Directory to scan
+    :param recursive: If set, descends into subdirectories
+    :param include: Only files whose name matches one of these glob patterns are yielded
+    :param exclude: Files and subdirectories whose name matches one of these glob patterns are skipped
+    Symlinked directories are followed, but each directory is scanned once, so links pointing back up the tree don't
+    make it scan the same files again.
+    """
+    pending = [root]
+    visited = set()  # (st_dev, st_ino) of scanned directories
+    while len(pending) > 0:
+        directory = pending.pop()
+        try:
+            st = os.stat(str(directory))
+        except OSError as e:
+            logging.warning(f"Couldn't scan directory {directory}, skipping: {e}")
+            continue
+        if (st.st_dev, st.st_ino) in visited:
+            logging.debug(f"Already scanned {directory}, skipping")
+            continue
+        visited.add((st.st_dev, st.st_ino))
+        files = []
+        subdirectories = []
+        try:
+            with os.scandir(str(directory)) as it:
+                for entry in it:
+                    if any(fnmatch(entry.name, pattern) for pattern in exclude):
+                        continue
+                    if entry.is_dir():
+                        if recursive:
+                            subdirectories.append(Path(entry.path))
+                        continue
+                    if entry.is_file() and any(fnmatch(entry.name, pattern) for pattern in include):
+                        files.append(Path(entry.path))
+        except OSError as e:
+            logging.warning(f"Couldn't scan directory {directory}, skipping: {e}")
+            continue
+        if len(files) > 0:
+            yield sorted(files)
+        # depth-first, in name order
+        pending.extend(sorted(subdirectories, reverse=True))
+
+
+def iter_directory_groups(root: Path, recursive: bool, include: List[str], exclude: List[str],
+                          jobs: int = 1) -> Iterator[List[AVSFile]]:
+    r"""
+    Streams probed, batch-mode file groups from a directory tree while it's still being scanned.
+    Files are grouped per directory, and up to jobs groups are probed at a time, so memory use stays flat regardless of
+    how large the tree is.
+    :param root: Directory to scan
+    :param recursive: If set, descends into subdirectories
+    :param include: Glob patterns of file names to include
+    :param exclude: Glob patterns of file and directory names to skip
+    :param jobs: Maximum number of concurrent ffprobe processes
+    :return: Iterator over groups of AVSFiles, in the same form as group_files()
+    """
+    for paths in scan_directory(root, recursive=recursive, include=include, exclude=exclude):
+        logging.debug(f"Found {len(paths)} input files in {paths[0].parent}")
+        sources = []
+        for p in paths:
+            try:
+                sources.append(AVSFile(p))
+            except AssertionError as e:
+                # removed since it was scanned
+                logging.warning(f"Skipping {p}: {e}")
+        if len(sources) == 0:
+            continue
+        groups = deque(group_files(sources))
+        while len(groups) > 0:
+            chunk = [groups.popleft() for _ in range(min(max(jobs, 1), len(groups)))]
+            probe_files([f for g in chunk for f in g], jobs=jobs)
+            for group in chunk:
+                yield group
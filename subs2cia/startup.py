@@ -0,0 +1,90 @@
+r"""
+Startup profiling for --profile-startup.
+Heavy dependencies are imported lazily throughout subs2cia, so this module imports them one at a time in dependency
+order and times each step, roughly isolating each module's own cost.
+"""
+import importlib
+import logging
+import sys
+import time
+from typing import Callable, List, Tuple
+
+# dependencies first, so that each subs2cia module's timing mostly reflects its own import cost
+profiled_modules = [
+    'colorlog',
+    'tqdm',
+    'ffmpeg',
+    'pysubs2',
+    'gevent',
+    'numpy',
+    'subs2cia.probe_records',
+    'subs2cia.ffmpeg_tools',
+    'subs2cia.container_headers',
+    'subs2cia.probe_cache',
+    'subs2cia.demux_cache',
+    'subs2cia.demux_registry',
+    'subs2cia.prefetch',
+    'subs2cia.scratch',
+    'subs2cia.sources',
+    'subs2cia.pickers',
+    'subs2cia.timings',
+    'subs2cia.subtools',
+    'subs2cia.Common',
+    'subs2cia.condense',
+    'subs2cia.CardExport',
+]
+
+
+def _init_language_lookup():
+    from subs2cia.sources import lookup_language
+    lookup_language('ja')
+
+
+def _init_punct_tbl():
+    from subs2cia.subtools import punct_tbl
+    'サンプル、テキスト！ sample text!'.translate(punct_tbl)
+
+
+# one-time initialization done on first use, after the module itself has been imported.
+# gevent monkey-patching is deliberately left out: it's deferred until the first progress bar and changes how
+# the rest of the run behaves.
+profiled_inits = [
+    ('language lookup (first call)', _init_language_lookup),
+    ('punctuation table (first call)', _init_punct_tbl),
+]
+
+
+def _timed(fn: Callable) -> Tuple[float, str]:
+    start = time.perf_counter()
+    try:
+        fn()
+        status = ''
+    except ImportError as e:
+        status = f'unavailable ({e})'
+    return time.perf_counter() - start, status
+
+
+def profile_startup() -> List[Tuple[str, float, str]]:
+    r"""
+    Imports and initializes each profiled module and reports how long each step took.
+    Modules that are already imported (e.g. by the CLI entry point) are reported as such instead of being timed.
+    :return: List of (step name, seconds, status) tuples
+    """
+    results = []
+    for name in profiled_modules:
+        if name in sys.modules:
+            results.append((name, 0.0, 'already imported'))
+            continue
+        elapsed, status = _timed(lambda: importlib.import_module(name))
+        results.append((name, elapsed, status))
+    for name, fn in profiled_inits:
+        elapsed, status = _timed(fn)
+        results.append((name, elapsed, status))
+
+    print("Startup profile:")
+    for name, elapsed, status in results:
+        print(f"{elapsed * 1000:9.1f} ms  {name}{f' [{status}]' if status else ''}")
+    print(f"{sum(r[1] for r in results) * 1000:9.1f} ms  total")
+    print("")
+    logging.debug(f"Startup profile: {results}")
+    return results
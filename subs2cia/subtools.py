@@ -1,5 +1,8 @@
 from subs2cia.sources import Stream
-from subs2cia.ffmpeg_tools import ffmpeg_demux, ffmpeg_trim_audio_clip_atrim_encode, ffmpeg_get_frame_fast
+from subs2cia.ffmpeg_tools import ffmpeg_demux, ffmpeg_trim_audio_clip_atrim_encode, ffmpeg_get_frame_fast, \
+    MediaInfo, get_media_info
+from subs2cia.probe_records import ProbeInfo
+from subs2cia import timings
 
 import logging
 import pysubs2 as ps2  # for reading in subtitles
@@ -7,15 +10,30 @@ from pathlib import Path
 from datetime import timedelta
 import ffmpeg
 import re
+import bisect
 import copy
-import sys
+import itertools
 import unicodedata
 
-codepoints = range(sys.maxunicode + 1)
-punct_tbl = dict.fromkeys(i for i in range(sys.maxunicode)
-                      if unicodedata.category(chr(i)).startswith('P') or unicodedata.category(chr(i)).startswith('S'))
+from typing import Iterator, List, Union
 
-from typing import List, Union
+
+class _PunctuationTable(dict):
+    r"""
+    str.translate() table that deletes punctuation and symbol characters.
+    Codepoints are classified the first time they are looked up and memoized, rather than classifying all of unicode
+    when the module is imported.
+    """
+    def __missing__(self, codepoint: int):
+        if unicodedata.category(chr(codepoint))[0] in ('P', 'S'):
+            value = None  # delete
+        else:
+            value = codepoint  # keep as-is
+        self[codepoint] = value
+        return value
+
+
+punct_tbl = _PunctuationTable()
 
 
 def overlap_range(range1: List[int], range2: List[int]):
@@ -83,30 +101,119 @@ def ignore_nibble(ignore_ranges: List[List[int]], e: ps2.SSAEvent):
     return [e]
 
 
+def merge_ignore_ranges(ignore_ranges: List[List[int]]) -> List[List[int]]:
+    r"""
+    Sorts ignore ranges by start and merges ranges that overlap each other. Ranges that only touch are kept apart, an
+    event spanning exactly one of them isn't trimmed, same as when it's tested against each range on its own.
+    :param ignore_ranges: List of IRs, in any order
+    :return: New list of non-overlapping IRs, sorted by start (and so also by end)
+    """
+    merged = []
+    for ir in sorted(ignore_ranges, key=lambda x: x[0]):
+        assert len(ir) == 2
+        if len(merged) > 0 and ir[0] < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], ir[1])
+        else:
+            merged.append([ir[0], ir[1]])
+    return merged
+
+
+def clip_event(e: ps2.SSAEvent, ignore_ranges: List[List[int]], first: int = 0) -> List[ps2.SSAEvent]:
+    r"""
+    Trims, splits or drops an event so that it doesn't overlap any ignore range, see ssaevent_trim
+    :param e: SSAEvent to clip
+    :param ignore_ranges: Non-overlapping IRs sorted by start, see merge_ignore_ranges
+    :param first: Index of the first IR that may overlap e, IRs before it must end before e starts
+    :return: List of events left after clipping, in order. May be empty
+    """
+    pieces = []
+    for idx in range(first, len(ignore_ranges)):
+        ir = ignore_ranges[idx]
+        if ir[0] >= e.end:  # this and all following IRs start after the event
+            break
+        if not overlap_range(ir, [e.start, e.end]):
+            continue
+        trimmed = ssaevent_trim(e, ir)
+        if len(trimmed) == 0 or trimmed[-1].start < ir[1]:
+            # dropped, or trimmed to end before ir and so before every following IR
+            return pieces + trimmed
+        # part after ir may still overlap following IRs
+        pieces += trimmed[:-1]
+        e = trimmed[-1]
+    pieces.append(e)
+    return pieces
+
+
 class SubGroup:
+    __slots__ = ('contains_only_ephemeral', 'events', 'ephemeral_events', 'threshold', 'padding',
+                 '_min_start', '_max_end', '_range', '_limits')
+
     def __init__(self, events: [ps2.SSAEvent], ephemeral: bool, threshold: int, padding: int):
+        r"""
+        Run of subtitle events that is condensed as one piece of audio. The earliest start and latest end of its events
+        are kept up to date as events are added, and the padded range and limits are computed from them once.
+        Add events with add_events(), not through the events list, so the bounds stay correct.
+        :param events: Events the group starts out with
+        :param ephemeral: If set, the group only contains non-dialogue events
+        :param threshold: in milliseconds
+        :param padding: in milliseconds
+        """
         self.contains_only_ephemeral = ephemeral  # if true, won't affect merging/splitting
-        self.events = events
+        self.events = []
         self.ephemeral_events = []  # not empty only when mixing ephemeral and dialogue events
 
         self.threshold = threshold
         self.padding = padding
 
+        self._min_start = float('inf')  # there may be 0 events
+        self._max_end = float('-inf')
+        self._range = None
+        self._limits = None
+        self.add_events(events)
+
+    def add_events(self, events: [ps2.SSAEvent]):
+        r"""
+        Appends events to the group, extending its bounds
+        """
+        for e in events:
+            if e.start < self._min_start:
+                self._min_start = e.start
+            if e.end > self._max_end:
+                self._max_end = e.end
+        self.events += events
+        self._range = None
+        self._limits = None
+
+    def absorb_run(self, groups: List['SubGroup'], events_start: int, events_end: int, group_range: List[int]):
+        r"""
+        Appends the events of the groups merged into this one, taking the bounds of the merged run as already computed
+        by timings.merge_times instead of comparing each event again
+        :param groups: Groups that follow this one in the merged run
+        :param events_start: Earliest start of the events of the run
+        :param events_end: Latest end of the events of the run, clamped to 0 like events_end
+        :param group_range: Padded range of the run, like group_range
+        """
+        self.events += [e for group in groups for e in group.events]
+        self._min_start = events_start
+        self._max_end = events_end
+        self._range = tuple(group_range)
+        self._limits = None
+
     @property
     def events_start(self):
-        lowest = float('inf')
-        for e in self.events:  # there may be 0 events
-            if e.start < lowest:
-                lowest = e.start
-        return lowest
+        return self._min_start
 
     @property
     def events_end(self):
-        highest = 0
-        for e in self.events:  # there may be 0 events
-            if e.end > highest:
-                highest = e.end
-        return highest
+        return self._max_end if self._max_end > 0 else 0
+
+    def _bounds(self, extend, offset=0):
+        start = self._min_start + offset
+        end = self._max_end + offset
+        end = end if end > 0 else 0
+        if self.contains_only_ephemeral:
+            return start, end
+        return start - extend if start - extend > 0 else 0, end + extend
 
     @property
     def group_range(self):
@@ -114,10 +221,9 @@ class SubGroup:
         Subtitle group start, end with padding
         :return: [range_start, range_end]
         """
-        if self.contains_only_ephemeral:
-            return [self.events_start, self.events_end]
-        grange = self.padding
-        return [self.events_start - grange if self.events_start - grange > 0 else 0, self.events_end + grange]
+        if self._range is None:
+            self._range = self._bounds(self.padding)
+        return list(self._range)
 
     @property
     def group_limits(self):
@@ -125,18 +231,60 @@ class SubGroup:
         Subtitle group start/end extended with padding and threshold
         :return: [limit_start, limit_end]
         """
-        if self.contains_only_ephemeral:
-            return [self.events_start, self.events_end]
-        limit = self.threshold/2 + self.padding  # divide by two: threshold is distance to next group
-        return [self.events_start - limit if self.events_start - limit > 0 else 0, self.events_end + limit]
+        if self._limits is None:
+            self._limits = self._bounds(self.threshold/2 + self.padding)  # divide by two: threshold is distance to next group
+        return list(self._limits)
+
+    def shifted_range(self, offset: int):
+        r"""
+        Range the group would have if all its events were moved by offset milliseconds
+        :return: [range_start, range_end]
+        """
+        return list(self._bounds(self.padding, offset))
 
     def __repr__(self):
-        s = f"<SubGroup |{self.group_limits[0]} {self.group_range[0]} {(self.events_start, self.events_end)} {self.group_range[1]} {self.group_limits[1]}|>"
+        limits = self.group_limits
+        grange = self.group_range
+        s = f"<SubGroup |{limits[0]} {grange[0]} {(self.events_start, self.events_end)} {grange[1]} {limits[1]}|>"
         return s
 
 
+class GroupRangeIndex:
+    def __init__(self, groups: List[SubGroup]):
+        r"""
+        Index over the ranges of merged subtitle groups, to find the groups a time falls inside of without testing each
+        group. Merged groups are in order and don't overlap, so both their range starts and range ends are sorted and
+        the groups containing a time are a contiguous run found by bisecting. Falls back to testing each group if the
+        ranges aren't sorted.
+        :param groups: Merged SubGroups, in order
+        """
+        self.ranges = [g.group_range for g in groups]
+        self.starts = [r[0] for r in self.ranges]
+        self.ends = [r[1] for r in self.ranges]
+        self.sorted = all(self.starts[i] <= self.starts[i + 1] and self.ends[i] <= self.ends[i + 1]
+                          for i in range(len(self.ranges) - 1))
+
+    def containing(self, t) -> range:
+        r"""
+        :return: Indices of the groups whose range strictly contains t, i.e. range_start < t < range_end
+        """
+        if self.sorted:
+            # starts before t are a prefix, ends after t a suffix
+            return range(bisect.bisect_right(self.ends, t), bisect.bisect_left(self.starts, t))
+        return [idx for idx, (start, end) in enumerate(self.ranges) if start < t < end]
+
+    def overlapping(self, start, end) -> List[int]:
+        r"""
+        :return: Indices of the groups whose range strictly contains start or end, in order
+        """
+        hits = set(self.containing(start))
+        hits.update(self.containing(end))
+        return sorted(hits)
+
+
 class SubtitleManipulator:
-    def __init__(self, subpath: Path, threshold: int, padding: int, ignore_range: Union[List[List[int]], None], audio_length: int):
+    def __init__(self, subpath: Path, threshold: int, padding: int, ignore_range: Union[List[List[int]], None], audio_length: int,
+                 subtext: Union[str, None] = None):
         r"""
         Class for subtitle manipulation
         :param subpath: Path to pysubs2-compatible subtitle file
@@ -144,8 +292,11 @@ class SubtitleManipulator:
         :param padding: in milliseconds
         :param ignore_range: list of ranges. each range is a list of two tuples. each tuple contains two values, a "sign" and a "duration".
         :param audio_length: How long the audio is in milliseconds.
+        :param subtext: Subtitle data already in memory, parsed instead of reading subpath. subpath's extension is still
+            used as the format if pysubs2 can't detect it.
         """
         self.subpath = subpath
+        self.subtext = subtext
         self.ssadata = None
         self.condensed_ssadata = None
         self.ssa_events = None
@@ -183,21 +334,26 @@ class SubtitleManipulator:
                                          f"({to_append[1]}ms) is before start of range ({to_append[0]}ms)")
                 self.ignore_range.append(to_append)
 
+    def parse(self, format_: Union[str, None] = None) -> ps2.SSAFile:
+        if self.subtext is not None:
+            return ps2.SSAFile.from_string(self.subtext, format_=format_)
+        return ps2.load(str(self.subpath), format_=format_)
+
     def load(self, include_all: bool, regex: str, substrreplace_regex: str, substrreplace_nokeepchanges: bool):
-        if not self.subpath.exists():
+        if self.subtext is None and not self.subpath.exists():
             logging.warning(f"Subtitle file {self.subpath} does not exist")
             return
 
-        logging.debug(f"Loading subtitles at {self.subpath}")
+        logging.debug(f"Loading subtitles at {self.subpath}{' from memory' if self.subtext is not None else ''}")
         try:
-            self.ssadata = ps2.load(str(self.subpath))
+            self.ssadata = self.parse()
         except (ps2.FormatAutodetectionError) as e:
             # retry by forcing format
             logger = logging.getLogger(__name__)
             logger.exception(e)
             logging.warning(f"Subtitle file format not recognized by pysubs2, will try forcing extension {self.subpath.suffix[1:]} as format ({self.subpath})")
             try:
-                self.ssadata = ps2.load(str(self.subpath), format_=self.subpath.suffix[1:])
+                self.ssadata = self.parse(format_=self.subpath.suffix[1:])
             except Exception as e:
                 logger = logging.getLogger(__name__)
                 logger.exception(e)
@@ -215,10 +371,12 @@ class SubtitleManipulator:
         self.ssa_events = self.ssadata.events
         self.ssa_events.sort(key=lambda x: x.start)
 
-        pool = self.ssa_events
+        # events are sorted by start and IRs by end, so IRs ending before an event starts can be skipped for every
+        # event after it as well
+        ignore_ranges = merge_ignore_ranges(self.ignore_range) if self.ignore_range is not None else []
+        first_range = 0
         self.groups = []
-        while len(pool) > 0:
-            e = pool.pop(0)
+        for e in self.ssa_events:
             ignored = False
             if substrreplace_regex:
                 new_subtitle_line = re.sub(substrreplace_regex, '', e.plaintext)
@@ -239,43 +397,64 @@ class SubtitleManipulator:
                     # do we want to use the original e.plaintext or the stripped and non-empty new_subtitle_line?
                     if not substrreplace_nokeepchanges:
                         e.plaintext = new_subtitle_line
-            if self.ignore_range is not None:
-                if any([overlap_range(ir, [e.start, e.end]) for ir in self.ignore_range]):
-                    trimmed = ignore_nibble(self.ignore_range, e)
-                    pool = trimmed + pool
-                    continue  # trimmed events may still overlap other ranges, will need to retest
-            self.groups.append(SubGroup([e], ephemeral=ignored or not is_dialogue(e, include_all, regex),
-                                        threshold=self.threshold,
-                                        padding=self.padding))
+            pieces = [e]
+            if len(ignore_ranges) > 0:
+                while first_range < len(ignore_ranges) and ignore_ranges[first_range][1] <= e.start:
+                    first_range += 1
+                pieces = clip_event(e, ignore_ranges, first_range)
+                if len(pieces) == 0:
+                    continue
+            # pieces of a split event share its text
+            ephemeral = ignored or not is_dialogue(e, include_all, regex)
+            for piece in pieces:
+                self.groups.append(SubGroup([piece], ephemeral=ephemeral,
+                                            threshold=self.threshold,
+                                            padding=self.padding))
 
     def merge_groups(self):
         merged = []
         self.ephemeral = []
+        dialogue = []
         for group in self.groups:
             # ephermal groups are not merged with any other groups so they can be dealt with seperately
             if group.contains_only_ephemeral:
                 self.ephemeral.append(group)
-                continue
-            if len(merged) == 0:  # first group
-                merged.append(group)
-                continue
-            if merged[-1].group_limits[1] > group.group_limits[0]:
-                merged[-1].events += group.events
             else:
-                merged.append(group)
+                dialogue.append(group)
+        runs = None
+        if len(dialogue) > 0:
+            runs = timings.merge_times([g.events_start for g in dialogue], [g.events_end for g in dialogue],
+                                       threshold=self.threshold, padding=self.padding)
+        if runs is not None:
+            firsts, run_starts, run_ends, range_starts, range_ends = [a.tolist() for a in runs]
+            firsts.append(len(dialogue))
+            for run, (first, end) in enumerate(zip(firsts, firsts[1:])):
+                dialogue[first].absorb_run(dialogue[first + 1:end], run_starts[run], run_ends[run],
+                                           [range_starts[run], range_ends[run]])
+                merged.append(dialogue[first])
+        else:
+            for group in dialogue:
+                if len(merged) == 0:  # first group
+                    merged.append(group)
+                    continue
+                if merged[-1].group_limits[1] > group.group_limits[0]:
+                    merged[-1].add_events(group.events)
+                else:
+                    merged.append(group)
         self.groups = merged
         logging.debug(f"Merged groups {merged}")
         # add ephemeral groups back into rest of groups
+        index = GroupRangeIndex(self.groups)
         for egroup in self.ephemeral:  # assuming each egroup contains one ssaevent
-            for group in self.groups:
-                # if egroup is valid inside group range
-                    # create a new ssaevent from egroup that fits inside group
-                if group.group_range[0] < egroup.events_start < group.group_range[1] or \
-                group.group_range[0] < egroup.events_end < group.group_range[1]:
-                    new_event = egroup.events[0].copy()
-                    new_event.start = new_event.start if new_event.start > group.group_range[0] else group.group_range[0]
-                    new_event.end = new_event.end if new_event.end < group.group_range[1] else group.group_range[1]
-                    group.ephemeral_events.append(new_event)
+            # groups whose range the ephemeral event starts or ends in
+            for idx in index.overlapping(egroup.events_start, egroup.events_end):
+                group = self.groups[idx]
+                range_start, range_end = index.ranges[idx]
+                # create a new ssaevent from egroup that fits inside group
+                new_event = egroup.events[0].copy()
+                new_event.start = new_event.start if new_event.start > range_start else range_start
+                new_event.end = new_event.end if new_event.end < range_end else range_end
+                group.ephemeral_events.append(new_event)
         logging.debug("Inserted ephemeral events")
 
     def get_times(self):
@@ -285,34 +464,42 @@ class SubtitleManipulator:
             times.append(g.group_range)
         return times
 
-    def condense(self):
+    def group_shifts(self) -> List[int]:
         r"""
         laststart = 0
         for each group g
-            shift all event times in g back by g.group_range[0] - laststart milliseconds
-        :return:
+            shift g back by g.group_range[0] - laststart milliseconds
+            laststart = end of g's range after shifting
+        :return: Offset to add to the event times of each group, in group order
         """
+        shifts = []
         laststart = 0
-        groups = copy.deepcopy(self.groups)
-        for g in groups:
+        for g in self.groups:
             shift = g.group_range[0] - laststart
-            for e in g.events:
-                e.start -= shift
-                e.end -= shift
-            for e in g.ephemeral_events:
-                e.start -= shift
-                e.end -= shift
-            laststart = g.group_range[1]
-        logging.debug("Shifted subtitle groups")
-        # extract shifted SSAevents
-        condensed_events = []
-        for g in groups:
-            for e in g.events:
-                condensed_events.append(e)
-            for e in g.ephemeral_events:
-                condensed_events.append(e)
+            shifts.append(-shift)
+            laststart = g.shifted_range(-shift)[1]
+        return shifts
+
+    def condensed_events(self) -> Iterator[ps2.SSAEvent]:
+        r"""
+        Yields the events of each group, followed by its ephemeral events, moved by its shift. Events are shallow copies
+        sharing text and style with the loaded events, which are left unchanged.
+        """
+        for g, offset in zip(self.groups, self.group_shifts()):
+            for e in itertools.chain(g.events, g.ephemeral_events):
+                shifted = copy.copy(e)
+                shifted.start = e.start + offset
+                shifted.end = e.end + offset
+                yield shifted
+
+    def condense(self):
+        r"""
+        Builds condensed_ssadata: the loaded subtitle file with only the events of the groups, shifted so that the
+        groups follow each other like the condensed audio does
+        """
         self.condensed_ssadata = copy.copy(self.ssadata)
-        self.condensed_ssadata.events = condensed_events
+        self.condensed_ssadata.events = list(self.condensed_events())
+        logging.debug("Shifted subtitle groups")
 
 
 def decide_partitions(sub_times, partition=0):
@@ -374,6 +561,9 @@ def split_times(sub_times, partition_indicies, splitsize=0):
 
 def partition_and_split(sub_times, partition_size=0, split_size=0):
     # returns a list tuple index pairs in [start, end) format for sub_times
+    divided_times = timings.partition_and_split(sub_times, partition_size=partition_size, split_size=split_size)
+    if divided_times is not None:
+        return divided_times
     partitions = decide_partitions(sub_times,
                                    partition=partition_size)
     """
@@ -528,23 +718,14 @@ def get_partitioned_and_split_times_duration(sub_times):
 #     return audio_total
 
 
+# prefer Stream.get_media_info(), which reuses existing probe results
 def get_audiofile_duration(audiofile: Path):
-    stream_idx = 0
-    audio_info = ffmpeg.probe(str(audiofile), cmd='ffprobe')
-    sps = int(
-        audio_info['streams'][stream_idx]['time_base'].split('/')[1])  # audio samples per second, inverse of sampling frequency
-    samples = audio_info['streams'][stream_idx]['duration_ts']  # total samples in audio track
-    audio_total = samples / sps * 1000
-    return audio_total
-
-
-def get_compression_ratio(sub_times, audiofile: Path, verbose=True):
-    # audio_info = ffmpeg.probe(str(audiofile), cmd='ffprobe')
-    # sps = int(
-    #     audio_info['streams'][0]['time_base'].split('/')[1])  # audio samples per second, inverse of sampling freq
-    # samples = audio_info['streams'][0]['duration_ts']  # total samples in audio track
-    # audio_total = samples / sps * 1000
-    audio_total = get_audiofile_duration(audiofile)
+    audio_info = get_media_info(ProbeInfo.from_probe(ffmpeg.probe(str(audiofile), cmd='ffprobe')))
+    return audio_info.duration
+
+
+def get_compression_ratio(sub_times, audio_info: MediaInfo, verbose=True):
+    audio_total = audio_info.duration
     # total = list()
     # for split in sub_times:
     #     for partition in split:
@@ -1,9 +1,7 @@
 from subs2cia.argparser import get_args_subzipper
-from subs2cia.sources import is_language
 
 import logging
 from pathlib import Path
-import pycountry
 from pprint import pprint
 
 
@@ -11,6 +9,8 @@ def start():
     args = get_args_subzipper()
     args = vars(args)
 
+    from subs2cia.sources import is_language, lookup_language
+
     if args['verbose']:
         # if args['debug']:
         logging.basicConfig(level=logging.DEBUG)
@@ -40,7 +40,7 @@ def start():
     lang = None
     if args['lang'] is not None:
         if is_language(args['lang']):
-            lang = pycountry.languages.lookup(args['lang'])
+            lang = lookup_language(args['lang'])
             lang = lang.alpha_3
             logging.info(f'Appending language code {lang}')
         else:
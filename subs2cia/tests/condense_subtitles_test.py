@@ -0,0 +1,74 @@
+import argparse
+import copy
+import time
+import tracemalloc
+from subs2cia.tests.synthetic_subtitles import SyntheticSubtitles, dialogue_with_signs
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=f'condensed subtitle memory and speed test')
+
+    parser.add_argument('-n', '--count', metavar='N', dest='count', default=50000, type=int,
+                        help='Number of synthetic dialogue lines, each with a sign event near it')
+
+    args = parser.parse_args()
+    return args
+
+
+# condense before it stopped deep-copying the groups
+def condense_deepcopy(self):
+    laststart = 0
+    groups = copy.deepcopy(self.groups)
+    for g in groups:
+        shift = g.group_range[0] - laststart
+        for e in g.events:
+            e.start -= shift
+            e.end -= shift
+        for e in g.ephemeral_events:
+            e.start -= shift
+            e.end -= shift
+        # end of the range of the shifted events, which the group doesn't know about
+        laststart = max([e.end for e in g.events] + [0]) + g.padding
+    condensed_events = []
+    for g in groups:
+        for e in g.events:
+            condensed_events.append(e)
+        for e in g.ephemeral_events:
+            condensed_events.append(e)
+    self.condensed_ssadata = copy.copy(self.ssadata)
+    self.condensed_ssadata.events = condensed_events
+
+
+def summary(events):
+    return [e.as_dict() for e in events]
+
+
+def measured(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    subdata = SyntheticSubtitles(dialogue_with_signs(args.count, text_length=40)).load_all()
+    subdata.merge_groups()
+    loaded = summary(e for g in subdata.groups for e in g.events + g.ephemeral_events)
+
+    elapsed, peak = measured(lambda: condense_deepcopy(subdata))
+    reference = summary(subdata.condensed_ssadata.events)
+    subdata.condensed_ssadata = None
+    print(f"deep copy:   {elapsed * 1000:7.0f}ms, peak {peak / 2 ** 20:7.1f} MiB")
+
+    elapsed, peak = measured(subdata.condense)
+    print(f"shifts only: {elapsed * 1000:7.0f}ms, peak {peak / 2 ** 20:7.1f} MiB "
+          f"for {len(subdata.condensed_ssadata.events)} condensed events")
+
+    assert summary(subdata.condensed_ssadata.events) == reference
+    assert summary(e for g in subdata.groups for e in g.events + g.ephemeral_events) == loaded
+    print("same condensed events, loaded events unchanged")
@@ -0,0 +1,70 @@
+import argparse
+import logging
+import time
+from pathlib import Path
+from subs2cia.container_headers import read_container_info
+from subs2cia.ffmpeg_tools import get_media_info
+from subs2cia.probe_records import ProbeInfo
+import ffmpeg
+from pprint import pprint
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=f'container header reader manual testing')
+
+    parser.add_argument('-V', '--video', metavar='<input file>', dest='infiles', default=None, required=True,
+                        nargs='+', type=str, help='Matroska/MP4 files to compare against ffprobe')
+
+    parser.add_argument('-v', '--verbose', action='store_true', dest='verbose', default=False,
+                        help='Verbose output if set.')
+
+    args = parser.parse_args()
+    return args
+
+
+# fields subs2cia reads from ffprobe output
+def summarize(info):
+    streams = [(s['index'], s['codec_type'], s.get('codec_name'), s.get('width'), s.get('height'),
+                s.get('tags', {}).get('language'), s.get('tags', {}).get('title'), s.get('sample_rate'),
+                s.get('time_base'), s.get('tags', {}).get('DURATION')) for s in info['streams']]
+    chapters = [(c['tags'].get('title'), float(c['start_time']), float(c['end_time'])) for c in info['chapters']]
+    # duration, sample rate and time base as used for the compression ratio, ignore ranges and trimming
+    probe_info = ProbeInfo.from_probe(info)
+    media_infos = [(idx, media_info(probe_info, idx)) for idx, s in enumerate(info['streams'])
+                   if s['codec_type'] == 'audio']
+    return streams, chapters, media_infos
+
+
+def media_info(probe_info, idx):
+    try:
+        m = get_media_info(probe_info, idx)
+    except TypeError:
+        return None  # no duration at all, e.g. live recordings
+    return round(m.duration, 3), m.sample_rate, m.time_base
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    for infile in args.infiles:
+        start = time.perf_counter()
+        headers = read_container_info(Path(infile))
+        header_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        probed = ffmpeg.probe(infile, 'ffprobe', **{'show_chapters': None})
+        probe_time = time.perf_counter() - start
+
+        print(f"{infile}: header reader {header_time * 1000:.2f}ms, ffprobe {probe_time * 1000:.2f}ms")
+        if headers is None:
+            print("header reader fell back to ffprobe")
+            continue
+        if summarize(headers) == summarize(probed):
+            print("match")
+        else:
+            print("MISMATCH")
+            pprint(summarize(headers))
+            pprint(summarize(probed))
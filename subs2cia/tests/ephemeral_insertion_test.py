@@ -0,0 +1,71 @@
+import argparse
+import time
+from subs2cia.tests.synthetic_subtitles import SyntheticSubtitles, dialogue_with_signs
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=f'ephemeral event insertion scaling test')
+
+    parser.add_argument('-n', '--count', metavar='N', dest='count', default=100000, type=int,
+                        help='Largest number of synthetic dialogue lines, each with a sign event near it')
+
+    parser.add_argument('--check', metavar='N', dest='check', default=3000, type=int,
+                        help='Number of dialogue lines to compare against the old O(E*G) insertion')
+
+    parser.add_argument('-t', '--threshold', metavar='ms', dest='threshold', default=1500, type=int,
+                        help='Merge threshold, 0 gives touching groups as in srs')
+
+    args = parser.parse_args()
+    return args
+
+
+# ephemeral insertion before it was indexed
+def insert_ephemeral_quadratic(self):
+    for egroup in self.ephemeral:
+        for group in self.groups:
+            if group.group_range[0] < egroup.events_start < group.group_range[1] or \
+                    group.group_range[0] < egroup.events_end < group.group_range[1]:
+                new_event = egroup.events[0].copy()
+                new_event.start = new_event.start if new_event.start > group.group_range[0] else group.group_range[0]
+                new_event.end = new_event.end if new_event.end < group.group_range[1] else group.group_range[1]
+                group.ephemeral_events.append(new_event)
+
+
+def ephemeral_summary(subdata):
+    return [[(e.start, e.end, e.text) for e in g.ephemeral_events] for g in subdata.groups]
+
+
+def loaded(n, threshold):
+    return SyntheticSubtitles(dialogue_with_signs(n), threshold=threshold).load_all()
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    subdata = loaded(args.check, args.threshold)
+    subdata.merge_groups()
+    reference = loaded(args.check, args.threshold)
+    reference.merge_groups()
+    for g in reference.groups:
+        g.ephemeral_events = []
+    insert_ephemeral_quadratic(reference)
+    assert ephemeral_summary(subdata) == ephemeral_summary(reference)
+    print(f"{args.check} lines: same ephemeral events as the quadratic insertion "
+          f"({sum(len(g.ephemeral_events) for g in subdata.groups)} in {len(subdata.groups)} groups)")
+
+    n = 1000
+    timings = []
+    while n <= args.count:
+        subdata = loaded(n, args.threshold)
+        start = time.perf_counter()
+        subdata.merge_groups()
+        elapsed = time.perf_counter() - start
+        timings.append((n, elapsed))
+        print(f"{n:8} lines, {len(subdata.groups):8} groups, {len(subdata.ephemeral):8} signs: "
+              f"{elapsed * 1000:9.1f}ms ({elapsed / n * 1e6:.2f}us/line)")
+        n *= 10
+
+    # linear scaling keeps time per line roughly constant, allow generous slack for timing noise
+    per_line = [elapsed / n for n, elapsed in timings]
+    assert max(per_line) < 3 * min(per_line), "merging time per line grew with the number of lines"
+    print("linear")
@@ -0,0 +1,67 @@
+import argparse
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from subs2cia.sources import group_names_better, strip_extensions
+
+suffixes = ['.mkv', '.ja.srt', '.en.srt', '.en.forced.srt', '.forced.ass', '.jpn.ass', '.condensed.mp3']
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=f'batch mode grouping scaling test')
+
+    parser.add_argument('-n', '--count', metavar='N', dest='count', default=100000, type=int,
+                        help='Largest number of synthetic file names to group')
+
+    parser.add_argument('--check', metavar='N', dest='check', default=300, type=int,
+                        help='Number of file names to compare against the old O(n^2) grouping')
+
+    args = parser.parse_args()
+    return args
+
+
+# files only need a filepath to be grouped, so the synthetic files don't have to exist
+def synthetic_sources(n):
+    episodes = [f"Show - S{e // 100 + 1:02}E{e % 100 + 1:02}" for e in range(n // len(suffixes) + 1)]
+    return [SimpleNamespace(filepath=Path(f"{episodes[i // len(suffixes)]}{suffixes[i % len(suffixes)]}"))
+            for i in range(n)]
+
+
+# grouping before it was made linear
+def group_names_quadratic(sources):
+    all_groups = []
+    while len(sources) > 0:
+        group = [sources.pop(0)]
+        to_remove = []
+        for f in sources:
+            if strip_extensions(f.filepath).name == strip_extensions(group[0].filepath).name:
+                group.append(f)
+                to_remove.append(f)
+        for f in to_remove:
+            sources.remove(f)
+        all_groups.append(group)
+    return all_groups
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    sources = synthetic_sources(args.check)
+    assert group_names_better(list(sources)) == group_names_quadratic(list(sources))
+    print(f"{args.check} files: same groups as the quadratic grouping")
+
+    n = 1000
+    timings = []
+    while n <= args.count:
+        sources = synthetic_sources(n)
+        start = time.perf_counter()
+        groups = group_names_better(sources)
+        elapsed = time.perf_counter() - start
+        timings.append((n, elapsed))
+        print(f"{n:8} files, {len(groups):8} groups: {elapsed * 1000:9.1f}ms ({elapsed / n * 1e6:.2f}us/file)")
+        n *= 10
+
+    # linear scaling keeps time per file roughly constant, allow generous slack for timing noise
+    per_file = [elapsed / n for n, elapsed in timings]
+    assert max(per_file) < 3 * min(per_file), "grouping time per file grew with the number of files"
+    print("linear")
@@ -0,0 +1,67 @@
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+from subs2cia.ffmpeg_tools import ffmpeg_demux, export_condensed_audio, ffmpeg_trim_audio_clip_atrim_encode, \
+    get_media_info
+from subs2cia.probe_cache import probe
+from subs2cia.probe_records import ProbeInfo
+from subs2cia.sources import audio_intermediate_formats
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=f'audio intermediate format benchmark')
+
+    parser.add_argument('-V', '--video', metavar='<input file>', dest='videofile', default=None, required=True,
+                        type=str,
+                        help='Video file')
+
+    parser.add_argument('-si', '--stream-index', metavar='<index>', dest='stream_index', default=1, type=int,
+                        help='Index of the audio stream to demux')
+
+    parser.add_argument('-n', '--clips', metavar='N', dest='clips', default=20, type=int,
+                        help='Number of card clips to cut from each intermediate file')
+
+    parser.add_argument('-v', '--verbose', action='store_true', dest='verbose', default=False,
+                        help='Verbose output if set.')
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    videofile = Path(args.videofile)
+    duration_ms = int(get_media_info(ProbeInfo.from_probe(probe(videofile)), args.stream_index).duration)
+    # one second of speech every ten seconds, roughly what a subtitle track looks like
+    times = [(t, t + 1000) for t in range(0, duration_ms - 1000, 10000)][:max(args.clips, 1)]
+
+    print(f"{'format':8} {'demux':>9} {'size':>12} {'condense':>9} {'clips':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for name, (extension, options) in audio_intermediate_formats.items():
+            intermediate = tmp / f"intermediate.{extension}"
+            start = time.perf_counter()
+            ffmpeg_demux(videofile, args.stream_index, intermediate, **options)
+            demux_time = time.perf_counter() - start
+            size = intermediate.stat().st_size
+
+            start = time.perf_counter()
+            export_condensed_audio([[times]], intermediate, quality=None, to_mono=False,
+                                   outfile=tmp / f"{name}.condensed.mp3")
+            condense_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for t0, t1 in times:
+                ffmpeg_trim_audio_clip_atrim_encode(intermediate, stream_index=0, timestamp_start=t0,
+                                                    timestamp_end=t1, quality=None, to_mono=False,
+                                                    normalize_audio=False, outpath=tmp / f"{name}_{t0}.mp3")
+            clips_time = time.perf_counter() - start
+
+            print(f"{name:8} {demux_time * 1000:7.0f}ms {size:12} {condense_time * 1000:7.0f}ms "
+                  f"{clips_time * 1000:7.0f}ms")
@@ -0,0 +1,50 @@
+import argparse
+import os
+import tempfile
+from pathlib import Path
+from subs2cia.inventory import iter_input_files
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=f'inventory directory scan symlink loop test')
+
+    parser.add_argument('-d', '--depth', metavar='N', dest='depth', default=3, type=int,
+                        help='Depth of the synthetic directory tree')
+
+    args = parser.parse_args()
+    return args
+
+
+# one file per directory, a symlink back to the root at the bottom and one to a sibling directory
+def synthetic_tree(root: Path, depth: int):
+    files = []
+    directory = root
+    for level in range(depth):
+        directory = directory / f"s{level}"
+        directory.mkdir()
+        files.append(directory / f"episode{level}.mkv")
+        files[-1].touch()
+    os.symlink(os.path.join(*(['..'] * depth)), str(directory / 'loop'))
+    (root / 'other').mkdir()
+    files.append(root / 'other' / 'extra.mkv')
+    files[-1].touch()
+    os.symlink(os.path.join('..', 'other'), str(root / 's0' / 'other_link'))
+    return files
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    if not hasattr(os, 'symlink'):
+        print("symlinks not supported, skipping")
+        raise SystemExit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        files = synthetic_tree(root, args.depth)
+        found = list(iter_input_files([root], recursive=True, include=['*'], exclude=[]))
+        print(f"{len(files)} files, found {len(found)}")
+        # each directory is scanned once, whichever path reaches it first
+        assert len(found) == len(files), found
+        assert sorted(f.name for f in found) == sorted(f.name for f in files)
+    print("each file found once")
@@ -0,0 +1,80 @@
+import argparse
+import time
+import pycountry
+from subs2cia.sources import lookup_language, is_language
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=f'language lookup index manual testing')
+
+    parser.add_argument('-n', '--iterations', metavar='N', dest='iterations', default=200, type=int,
+                        help='Number of times to look up each benchmark code')
+
+    parser.add_argument('-v', '--verbose', action='store_true', dest='verbose', default=False,
+                        help='Print every code that resolves differently than pycountry.languages.lookup')
+
+    args = parser.parse_args()
+    return args
+
+
+def pycountry_lookup(code):
+    try:
+        return pycountry.languages.lookup(code).alpha_3
+    except LookupError:
+        return None
+
+
+def index_lookup(code):
+    try:
+        return lookup_language(code).alpha_3
+    except LookupError:
+        return None
+
+
+# typical stream language tags, file name suffixes and -tl arguments, including misses
+benchmark_codes = ['jpn', 'eng', 'und', 'ja', 'en', 'fre', 'ger', 'chi', 'Japanese', 's01e01', 'forced', 'condensed']
+
+
+def bench(fn, codes, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for code in codes:
+            fn(code)
+    return (time.perf_counter() - start) / (iterations * len(codes))
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    start = time.perf_counter()
+    lookup_language('ja')
+    print(f"index build: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    # ffmpeg writes ISO 639-2 codes: terminologic (alpha-3) or bibliographic
+    emitted = set()
+    for lang in pycountry.languages:
+        emitted.add(lang.alpha_3)
+        if hasattr(lang, 'bibliographic'):
+            emitted.add(lang.bibliographic)
+    mismatched = [c for c in sorted(emitted) if index_lookup(c) != pycountry_lookup(c)]
+    print(f"{len(emitted)} alpha-3/bibliographic codes, {len(mismatched)} resolve differently than pycountry")
+    if args.verbose:
+        for c in mismatched:
+            print(f"    {c}: index {index_lookup(c)}, pycountry {pycountry_lookup(c)}")
+
+    # newer pycountry versions match names before alpha-2 codes, e.g. 'en' -> 'enc' (En), the index prefers codes
+    alpha_2 = sorted(lang.alpha_2 for lang in pycountry.languages if hasattr(lang, 'alpha_2'))
+    mismatched = [c for c in alpha_2 if index_lookup(c) != pycountry_lookup(c)]
+    print(f"{len(alpha_2)} alpha-2 codes, {len(mismatched)} resolve differently than pycountry")
+    if args.verbose:
+        for c in mismatched:
+            print(f"    {c}: index {index_lookup(c)}, pycountry {pycountry_lookup(c)}")
+
+    for code in ['ja', 'JPN', 'Japanese', 'ger', 'deu', 'zh', 'und']:
+        print(f"{code!r} -> {index_lookup(code)}")
+    assert not is_language('s01e01') and not is_language('forced') and is_language('ja')
+
+    pycountry_time = bench(pycountry_lookup, benchmark_codes, args.iterations)
+    index_time = bench(index_lookup, benchmark_codes, args.iterations)
+    print(f"pycountry.languages.lookup: {pycountry_time * 1e6:10.2f}us/lookup")
+    print(f"lookup_language:            {index_time * 1e6:10.2f}us/lookup")
@@ -0,0 +1,45 @@
+import argparse
+import json
+import tracemalloc
+from pathlib import Path
+from subs2cia import probe_cache
+from subs2cia.probe_records import ProbeInfo
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=f'compact probe record memory benchmark')
+
+    parser.add_argument('-V', '--video', metavar='<input file>', dest='infile', default=None, required=True,
+                        type=str, help='File to probe, its probe results are copied once per simulated input')
+
+    parser.add_argument('-n', '--count', metavar='N', dest='count', default=5000, type=int,
+                        help='Number of simulated input files')
+
+    args = parser.parse_args()
+    return args
+
+
+# every input of a batch run has its own copy of the probe results
+def measure(make, count):
+    tracemalloc.start()
+    kept = [make() for _ in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    probe_cache.set_header_reading(True)
+    info = probe_cache.probe(Path(args.infile))
+    serialized = json.dumps(info)
+
+    record = ProbeInfo.from_probe(info)
+    print(record)
+
+    dict_size = measure(lambda: json.loads(serialized), args.count)
+    record_size = measure(lambda: ProbeInfo.from_probe(json.loads(serialized)), args.count)
+    print(f"ffprobe dicts:  {dict_size / args.count:10.0f} bytes/file, {dict_size / 2 ** 20:8.2f}MiB total")
+    print(f"ProbeInfo:      {record_size / args.count:10.0f} bytes/file, {record_size / 2 ** 20:8.2f}MiB total")
@@ -37,14 +37,12 @@ if __name__ == '__main__':
         print(f"Available {k} streams:")
         for idx, stream in enumerate(partitioned_streams[k]):
             desc_str = ''
-            if "codec_name" in stream.stream_info:
-                desc_str = desc_str + "codec: " + stream.stream_info['codec_name'] + ", "
-            if "tags" in stream.stream_info:
-                tags = stream.stream_info['tags']
-                if "language" in tags:
-                    desc_str = desc_str + "lang_code: " + tags['language'] + ", "
-                if "title" in tags:
-                    desc_str = desc_str + "title: " + tags['title'] + ", "
+            if stream.stream_info.codec_name is not None:
+                desc_str = desc_str + "codec: " + stream.stream_info.codec_name + ", "
+            if stream.stream_info.language is not None:
+                desc_str = desc_str + "lang_code: " + stream.stream_info.language + ", "
+            if stream.stream_info.title is not None:
+                desc_str = desc_str + "title: " + stream.stream_info.title + ", "
             if desc_str == '':
                 desc_str = f"Stream {idx: 3}: no information found"
             else:
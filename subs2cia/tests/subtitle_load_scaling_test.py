@@ -0,0 +1,98 @@
+import argparse
+import re
+import time
+from subs2cia.subtools import SubGroup, overlap_range, ignore_nibble, is_dialogue, punct_tbl
+from subs2cia.tests.synthetic_subtitles import SyntheticSubtitles, layered_lines
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=f'subtitle loading scaling test')
+
+    parser.add_argument('-n', '--count', metavar='N', dest='count', default=1000000, type=int,
+                        help='Largest number of synthetic subtitle events to load')
+
+    parser.add_argument('--check', metavar='N', dest='check', default=5000, type=int,
+                        help='Number of events to compare against the old O(n^2) loading')
+
+    args = parser.parse_args()
+    return args
+
+
+# -I style ranges spread over the synthetic events, some overlapping each other, one counted from the end
+def synthetic_ignore_ranges(length):
+    ranges = []
+    for k in range(1, 9):
+        start = length * k // 10 + 750
+        ranges.append([('', start), ('+', 4100 + 900 * k)])
+    ranges.append([('', length * 3 // 10 + 3000), ('', length * 3 // 10 + 12000)])  # overlaps the third range
+    ranges.append([('', 0), ('', 2700)])
+    ranges.append([('e', 5000), ('e', 0)])
+    return ranges
+
+
+def synthetic_subtitles(n):
+    events = layered_lines(n)
+    return SyntheticSubtitles(events, ignore_range=synthetic_ignore_ranges(events[-1].end))
+
+
+# event ingestion before it was made a single sweep
+def load_quadratic(self, include_all, regex, substrreplace_regex, substrreplace_nokeepchanges):
+    self.ssadata = self.parse()
+    self.ssa_events = self.ssadata.events
+    self.ssa_events.sort(key=lambda x: x.start)
+
+    pool = self.ssa_events
+    self.groups = []
+    while len(pool) > 0:
+        e = pool.pop(0)
+        ignored = False
+        if substrreplace_regex:
+            new_subtitle_line = re.sub(substrreplace_regex, '', e.plaintext)
+            if new_subtitle_line != e.plaintext:
+                if len(new_subtitle_line) == 0 or new_subtitle_line.isspace() or \
+                        len(new_subtitle_line.translate(punct_tbl)) == 0:
+                    if substrreplace_nokeepchanges:
+                        ignored = True
+                    else:
+                        continue
+                if not substrreplace_nokeepchanges:
+                    e.plaintext = new_subtitle_line
+        if self.ignore_range is not None:
+            if any([overlap_range(ir, [e.start, e.end]) for ir in self.ignore_range]):
+                trimmed = ignore_nibble(self.ignore_range, e)
+                pool = trimmed + pool
+                continue
+        self.groups.append(SubGroup([e], ephemeral=ignored or not is_dialogue(e, include_all, regex),
+                                    threshold=self.threshold,
+                                    padding=self.padding))
+
+
+def group_summary(subdata):
+    return [(g.events[0].start, g.events[0].end, g.events[0].text, g.contains_only_ephemeral) for g in subdata.groups]
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    subdata = synthetic_subtitles(args.check).load_all()
+    reference = synthetic_subtitles(args.check)
+    load_quadratic(reference, include_all=False, regex=None, substrreplace_regex='', substrreplace_nokeepchanges=False)
+    assert group_summary(subdata) == group_summary(reference)
+    print(f"{args.check} events: same groups as the quadratic loading ({len(subdata.groups)} groups)")
+
+    n = 1000
+    timings = []
+    while n <= args.count:
+        subdata = synthetic_subtitles(n)
+        start = time.perf_counter()
+        subdata.load(include_all=False, regex=None, substrreplace_regex='', substrreplace_nokeepchanges=False)
+        elapsed = time.perf_counter() - start
+        timings.append((n, elapsed))
+        print(f"{n:8} events, {len(subdata.groups):8} groups: {elapsed * 1000:9.1f}ms "
+              f"({elapsed / n * 1e6:.2f}us/event)")
+        n *= 10
+
+    # linear scaling keeps time per event roughly constant, allow generous slack for timing noise
+    per_event = [elapsed / n for n, elapsed in timings]
+    assert max(per_event) < 3 * min(per_event), "loading time per event grew with the number of events"
+    print("linear")
@@ -0,0 +1,70 @@
+r"""
+Synthetic subtitle data shared by the subtitle scaling tests, so they can run on any number of events without
+writing subtitle files
+"""
+import copy
+from pathlib import Path
+from typing import List, Union
+import pysubs2 as ps2
+from subs2cia.subtools import SubtitleManipulator
+
+
+class SyntheticSubtitles(SubtitleManipulator):
+    def __init__(self, events: List[ps2.SSAEvent], threshold: int = 1500, padding: int = 200,
+                 ignore_range: Union[List[List[tuple]], None] = None, audio_length: Union[int, None] = None,
+                 copy_events: bool = False):
+        r"""
+        SubtitleManipulator whose load() reads events from memory instead of parsing a file
+        :param events: Events to load. load() sorts and trims them in place unless copy_events is set
+        :param audio_length: Defaults to the end of the last event
+        :param copy_events: If set, each load() works on a deep copy of events, so the same events can be loaded again
+        """
+        self.events = events
+        self.copy_events = copy_events
+        super(SyntheticSubtitles, self).__init__(subpath=Path('synthetic.ass'), threshold=threshold, padding=padding,
+                                                 ignore_range=ignore_range,
+                                                 audio_length=audio_length if audio_length is not None
+                                                 else events[-1].end,
+                                                 subtext='')
+
+    def parse(self, format_=None):
+        ssadata = ps2.SSAFile()
+        ssadata.events = copy.deepcopy(self.events) if self.copy_events else self.events
+        return ssadata
+
+    def load_all(self):
+        r"""
+        load() with the options condense uses
+        """
+        self.load(include_all=False, regex=None, substrreplace_regex='', substrreplace_nokeepchanges=False)
+        return self
+
+
+# every fourth line has a karaoke/signs line on top of it, like ASS files with several layers
+def layered_lines(n: int) -> List[ps2.SSAEvent]:
+    events = []
+    for i in range(n):
+        start = (i // 2) * 2000 + (i % 2) * 300
+        if i % 4 == 3:
+            events.append(ps2.SSAEvent(start=start, end=start + 2500, text=r"{\k20}ka{\k20}ra{\k30}o{\k30}ke"))
+        else:
+            events.append(ps2.SSAEvent(start=start, end=start + 1500, text=f"line {i}"))
+    return events
+
+
+# dialogue with gaps of varying length, so some lines merge and some don't, and typeset signs of varying length that
+# start and end inside, between and across groups
+def dialogue_with_signs(n: int, text_length: int = 0) -> List[ps2.SSAEvent]:
+    r"""
+    :param n: Number of dialogue lines, each followed by a sign
+    :param text_length: Characters of filler text added to each event, to make events a realistic size
+    """
+    filler = " " + "x" * text_length if text_length > 0 else ""
+    events = []
+    t = 0
+    for i in range(n):
+        events.append(ps2.SSAEvent(start=t, end=t + 1200, text=f"line {i}{filler}", style='Dialogue'))
+        events.append(ps2.SSAEvent(start=t + (i * 397) % 2600 - 700, end=t + (i * 397) % 2600 + 300 + (i % 7) * 900,
+                                   text=r"{\an8\pos(320,40)}sign" + filler, style='Signs'))
+        t += 1500 + (i * 733) % 3000
+    return events
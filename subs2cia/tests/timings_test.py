@@ -0,0 +1,127 @@
+import argparse
+import copy
+import random
+import time
+import pysubs2 as ps2
+from subs2cia import timings
+from subs2cia.subtools import partition_and_split, get_partitioned_and_split_times_duration
+from subs2cia.tests.synthetic_subtitles import SyntheticSubtitles
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=f'array-backed timing engine test and threshold/padding sweep')
+
+    parser.add_argument('--seed', metavar='N', dest='seed', default=0, type=int,
+                        help='Random seed for the synthetic subtitles')
+
+    parser.add_argument('--trials', metavar='N', dest='trials', default=200, type=int,
+                        help='Number of random subtitle files to compare against the list-based code')
+
+    parser.add_argument('--episodes', metavar='N', dest='episodes', default=24, type=int,
+                        help='Number of synthetic episodes in the sweep')
+
+    args = parser.parse_args()
+    return args
+
+
+# lines with random gaps and lengths, some overlapping, some zero-length, some signs
+def random_events(rng, n):
+    events = []
+    t = rng.randrange(0, 5000)
+    for i in range(n):
+        length = rng.choice([0, rng.randrange(200, 6000)])
+        text = r"{\an8}sign" if rng.random() < 0.2 else f"line {i}"
+        events.append(ps2.SSAEvent(start=t, end=t + length, text=text))
+        t += rng.choice([0, rng.randrange(0, 800), rng.randrange(800, 8000), rng.randrange(8000, 90000)])
+    return events
+
+
+def merged(events, threshold, padding, ignore_range):
+    # deep copies, the same events are loaded with and without NumPy
+    subdata = SyntheticSubtitles(events, threshold, padding, ignore_range, audio_length=events[-1].end + 1000,
+                                 copy_events=True).load_all()
+    subdata.merge_groups()
+    groups = [([(e.start, e.end) for e in g.events], g.events_start, g.events_end, g.group_limits,
+               g.shifted_range(-1000)) for g in subdata.groups]
+    return groups, subdata.get_times()
+
+
+def compare(rng):
+    events = random_events(rng, rng.randrange(1, 300))
+    threshold = rng.choice([0, 500, 1500, 5000])
+    padding = rng.choice([0, 100, 250])
+    ignore_range = None
+    if rng.random() < 0.5:
+        start = rng.randrange(0, events[-1].end + 1)
+        ignore_range = [[('', start), ('+', rng.randrange(1, 60000))]]
+    partition = rng.choice([0, 0, 60000, 300000])
+    split = rng.choice([0, 0, 30000, 120000])
+
+    with timings.numpy_enabled(False):
+        groups, times = merged(events, threshold, padding, ignore_range)
+        divided = partition_and_split(copy.deepcopy(times), partition, split)
+    with timings.numpy_enabled(True) as np:
+        assert np is not None, "NumPy is needed for this test"
+        groups_np, times_np = merged(events, threshold, padding, ignore_range)
+        divided_np = partition_and_split(copy.deepcopy(times_np), partition, split)
+
+    assert groups_np == groups
+    assert times_np == times
+    assert divided_np == divided, (partition, split)
+    assert all(type(t) is int for p in divided_np for s in p for x in s for t in x)
+
+
+def season(rng, episodes):
+    # starts and ends of the dialogue lines of each episode, ~24 minutes of ~400 lines
+    season = []
+    for _ in range(episodes):
+        starts, ends = [], []
+        t = 0
+        while t < 24 * 60 * 1000:
+            starts.append(t)
+            ends.append(t + rng.randrange(800, 5000))
+            t = ends[-1] + rng.choice([rng.randrange(0, 1500), rng.randrange(1500, 20000)])
+        season.append((starts, ends))
+    return season
+
+
+def condensed_duration_lists(starts, ends, threshold, padding):
+    events = [ps2.SSAEvent(start=s, end=e, text='line') for s, e in zip(starts, ends)]
+    subdata = SyntheticSubtitles(events, threshold, padding, audio_length=events[-1].end + 1000).load_all()
+    subdata.merge_groups()
+    return get_partitioned_and_split_times_duration(partition_and_split(subdata.get_times()))
+
+
+if __name__ == '__main__':
+    args = get_args()
+    rng = random.Random(args.seed)
+
+    for _ in range(args.trials):
+        compare(rng)
+    print(f"{args.trials} random subtitle files: same groups, times, partitions and splits with and without NumPy")
+
+    episodes = season(rng, args.episodes)
+    thresholds = range(0, 10001, 500)
+    paddings = range(0, 1001, 100)
+
+    start = time.perf_counter()
+    durations = {}
+    with timings.numpy_enabled(True):
+        for threshold in thresholds:
+            for padding in paddings:
+                total = 0
+                for starts, ends in episodes:
+                    _, _, _, range_starts, range_ends = timings.merge_times(starts, ends, threshold, padding)
+                    total += int((range_ends - range_starts).sum())
+                durations[(threshold, padding)] = total
+    elapsed = time.perf_counter() - start
+    print(f"Swept {len(durations)} threshold/padding pairs over {len(episodes)} episodes in {elapsed * 1000:.0f}ms")
+
+    # spot check against the full subtitle pipeline without NumPy, which is too slow to run for every pair
+    start = time.perf_counter()
+    with timings.numpy_enabled(False):
+        for threshold, padding in [(0, 0), (1500, 200), (10000, 1000)]:
+            total = sum(condensed_duration_lists(starts, ends, threshold, padding) for starts, ends in episodes)
+            assert total == durations[(threshold, padding)], (threshold, padding)
+    elapsed = time.perf_counter() - start
+    print(f"List-based pipeline: {elapsed / 3 * 1000:.0f}ms per threshold/padding pair, same condensed durations")
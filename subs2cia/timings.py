@@ -0,0 +1,147 @@
+r"""
+Array-backed timing engine: threshold merging of subtitle groups and partitioning/splitting of merged times, done on
+NumPy arrays of start and end times instead of one Python comparison per subtitle line. Subtitle objects are only
+needed afterwards, to attach text to the groups that were found.
+NumPy is optional. Each function returns None when NumPy isn't installed, or for inputs the vectorized code doesn't
+reproduce exactly (e.g. events ending before they start), and callers then use the list-based code in subtools.
+"""
+import contextlib
+from typing import List, Tuple, Union
+
+# numpy is imported on first use, see load_numpy()
+np = None
+_numpy_loaded = False
+
+
+def load_numpy():
+    r"""
+    Imports NumPy the first time timings are computed, so that runs that don't get that far don't pay for the import
+    :return: numpy module, or None if NumPy is not available
+    """
+    global np, _numpy_loaded
+    if _numpy_loaded:
+        return np
+    _numpy_loaded = True
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    return np
+
+
+@contextlib.contextmanager
+def numpy_enabled(enabled: bool):
+    r"""
+    Uses or ignores NumPy inside a with block and restores the previous state afterwards, to compare both code paths
+    :param enabled: If False, timings are computed with the list-based code even if NumPy is installed
+    :return: numpy module, or None if disabled or not available
+    """
+    global np, _numpy_loaded
+    saved = np, _numpy_loaded
+    np, _numpy_loaded = None, not enabled
+    try:
+        yield load_numpy()
+    finally:
+        np, _numpy_loaded = saved
+
+
+def _clamped_start(starts, extend):
+    # same as `start - extend if start - extend > 0 else 0` in SubGroup
+    extended = starts - extend
+    return np.where(extended > 0, extended, 0)
+
+
+def merge_times(starts, ends, threshold: int, padding: int):
+    r"""
+    Merges subtitle groups whose limits (range extended by half the threshold) overlap, like
+    SubtitleManipulator.merge_groups.
+    A group is merged into the run before it if the latest end in that run, extended, is after its extended start.
+    When every group ends no earlier than it starts, the latest end in the current run is also the latest end seen so
+    far, so the merge decisions come from a running maximum.
+    :param starts: Start of each group, in milliseconds, in group order
+    :param ends: End of each group, in milliseconds, in group order
+    :return: (index of the first group of each merged run, earliest start, latest end, range start and range end of
+        each merged run) as arrays, or None
+    """
+    if load_numpy() is None:
+        return None
+    starts = np.asarray(starts)
+    ends = np.asarray(ends)
+    limit = threshold / 2 + padding  # divide by two: threshold is distance to next group
+    if len(starts) == 0 or limit < 0 or starts.dtype.kind not in 'iu' or ends.dtype.kind not in 'iu' or \
+            np.any(ends < starts):
+        return None
+
+    latest_end = np.maximum.accumulate(ends)
+    merged = latest_end[:-1] + limit > _clamped_start(starts[1:], limit)
+    firsts = np.concatenate(([0], np.flatnonzero(~merged) + 1))
+    run_starts = np.minimum.reduceat(starts, firsts)
+    run_ends = np.maximum.reduceat(ends, firsts)
+    return firsts, run_starts, run_ends, _clamped_start(run_starts, padding), run_ends + padding
+
+
+def cut_points(values, size) -> List[Tuple[int, int]]:
+    r"""
+    Cuts sorted values into runs about size apart, like decide_partitions and split_times: the k-th cut is made at the
+    first value past k * size that comes after the previous cut, on whichever side of it is closer to k * size.
+    Each cut is found by bisecting instead of testing every value.
+    :param values: Nondecreasing array, e.g. end times or cumulative durations
+    :return: List of [start, end) index pairs
+    """
+    n = len(values)
+    cuts = []
+    start = 0
+    idx = 0  # first value the next cut may be made at
+    k = 1
+    while True:
+        boundary = k * size
+        idx = max(idx, int(np.searchsorted(values, boundary, side='right')))
+        if idx >= n:
+            break
+        # idx - 1 is -1 when the first value is already past the boundary, compared against the last value as before
+        if abs(values[idx] - boundary) < abs(values[idx - 1] - boundary):
+            end = idx + 1
+        else:
+            end = idx
+        cuts.append((start, end))
+        k += 1
+        start = end
+        idx += 1
+    cuts.append((start, n if n > 0 else 1))
+    return cuts
+
+
+def partition_and_split(sub_times: List[List[int]], partition_size: int = 0, split_size: int = 0) \
+        -> Union[List[List[List[List[int]]]], None]:
+    r"""
+    Array-backed subtools.partition_and_split, with the same output
+    :param sub_times: Merged subtitle times, [start, end] in milliseconds, in order
+    :return: List of partitions, each a list of splits, each a list of [start, end] times. None if the times can't be
+        handled here
+    """
+    if load_numpy() is None or len(sub_times) == 0:
+        return None
+    times = np.array([(t[0], t[1]) for t in sub_times])
+    if times.dtype.kind not in 'iu':
+        return None
+    ends = times[:, 1]
+    durations = ends - times[:, 0]
+    if np.any(ends[1:] < ends[:-1]) or np.any(durations < 0):
+        return None
+
+    if partition_size == 0:
+        partitions = [(0, len(sub_times))]
+    else:
+        partitions = cut_points(ends, partition_size)
+
+    divided_times = []
+    # splits are sized by duration since the start of the file, not of the partition, as in split_times
+    elapsed = np.cumsum(durations)
+    for p_start, p_end in partitions:
+        if split_size == 0:
+            divided_times.append([sub_times[p_start:p_end]])
+            continue
+        partition_times = times[p_start:p_end].tolist()
+        splits = cut_points(elapsed[p_start:p_end], split_size)
+        divided_times.append([partition_times[s_start:s_end] for s_start, s_end in splits])
+    return divided_times